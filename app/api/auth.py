@@ -8,6 +8,12 @@ from app.schemas.auth import (
 )
 from app.core.storage import storage
 from app.services.auth_service import GoogleAuthService
+from app.services.client_registry import client_registry
+from app.services.account_cache import account_cache
+from app.services.cookie_jar import cookie_jars
+from app.services.event_dedup import event_dedup
+from app.services.session_keepalive import session_keepalive
+from app.services.realtime import realtime_manager
 from app.core.auth import get_current_user
 
 router = APIRouter()
@@ -102,7 +108,13 @@ async def login_with_cookies(input_data: LoginWithCookiesInput):
         await storage.save_user(input_data.email, user_data)
     
     # Save Google Voice session
-    await storage.save_gv_session(user_data["id"], input_data.cookies)
+    version = await storage.save_gv_session(user_data["id"], input_data.cookies)
+    jar = cookie_jars.replace(user_data["id"], input_data.cookies, version)
+    await realtime_manager.replace_cookie_jar(user_data["id"], jar)
+    session_keepalive.reset(user_data["id"])
+    client_registry.invalidate(user_data["id"])
+    account_cache.invalidate(user_data["id"])
+    event_dedup.forget(user_data["id"])
     
     # Create session
     session_id = await storage.create_session({
@@ -141,7 +153,12 @@ async def logout(current_user: dict = Depends(get_current_user)):
 @router.post("/logout-gvoice")
 async def logout_gvoice(current_user: dict = Depends(get_current_user)):
     """Logout from Google Voice (delete stored cookies)"""
+    cookie_jars.discard(current_user["id"])
+    session_keepalive.unregister(current_user["id"])
     await storage.delete_gv_session(current_user["id"])
+    client_registry.invalidate(current_user["id"])
+    account_cache.invalidate(current_user["id"])
+    event_dedup.forget(current_user["id"])
     return {"message": "Google Voice session deleted"}
 
 # Add missing import
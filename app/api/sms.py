@@ -1,14 +1,22 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Header
+from fastapi.responses import StreamingResponse
 from typing import Optional, List
 from datetime import datetime
+import asyncio
+import json
 import uuid
 
 from app.schemas.sms import (
     SendSMSInput, SMSMessage, ThreadResponse, ListThreadsResponse
 )
-from app.core.auth import get_current_user
+from app.core.auth import get_current_user, get_stream_user
 from app.core.storage import storage
 from app.services.gvoice_client import GVoiceClient
+from app.services.client_registry import client_registry, NoGVoiceSession
+from app.services.account_cache import account_cache
+from app.services.cookie_jar import cookie_jars
+from app.services.event_log import event_log
+from app.services.realtime import realtime_manager
 from app.services.browser_waa_service import EnhancedGVoiceClient
 from app.services.ui_automation_client import UIAutomationClient
 from app.services.webhook_service import webhook_service
@@ -16,15 +24,33 @@ from app.models.webhook import WebhookEvent
 
 router = APIRouter()
 
+# Default interval between SSE keep-alive comments (seconds)
+SSE_HEARTBEAT = 15.0
+# Events buffered per SSE stream; a client that falls further behind is
+# disconnected and resumes with Last-Event-ID
+SSE_QUEUE_SIZE = 256
+# Reconnect delay suggested to EventSource clients (milliseconds)
+SSE_RETRY_MS = 3000
+
 async def get_gvoice_client(user_id: str) -> GVoiceClient:
     """Get authenticated Google Voice client for user"""
-    cookies = await storage.get_gv_session(user_id)
-    if not cookies:
+    try:
+        return await client_registry.get_client(user_id)
+    except NoGVoiceSession:
+        raise HTTPException(
+            status_code=400,
+            detail="No Google Voice session found. Please login with cookies first."
+        )
+
+async def coalesced_read(user_id: str, endpoint: str, params: Optional[dict] = None):
+    """Run a read through the client registry so identical concurrent calls merge"""
+    try:
+        return await client_registry.read(user_id, endpoint, params)
+    except NoGVoiceSession:
         raise HTTPException(
             status_code=400,
             detail="No Google Voice session found. Please login with cookies first."
         )
-    return GVoiceClient(cookies)
 
 @router.post("/send")
 async def send_sms(
@@ -35,6 +61,7 @@ async def send_sms(
     client = await get_gvoice_client(current_user["id"])
     
     try:
+        sender = await account_cache.get_phone_number(current_user["id"], wait=False)
         results = []
         for recipient in input_data.recipients:
             result = await client.send_sms(recipient, input_data.message)
@@ -52,6 +79,7 @@ async def send_sms(
                     event_type=WebhookEvent.MESSAGE_SENT,
                     data={
                         "message_id": result.get("message_id"),
+                        "sender": sender,
                         "recipient": recipient,
                         "message": input_data.message,
                         "timestamp": result.get("timestamp")
@@ -62,12 +90,16 @@ async def send_sms(
                     user_id=current_user["id"],
                     event_type=WebhookEvent.MESSAGE_FAILED,
                     data={
+                        "sender": sender,
                         "recipient": recipient,
                         "message": input_data.message,
                         "error": result.get("error")
                     }
                 )
         
+        # Sent messages change thread listings
+        client_registry.invalidate(current_user["id"])
+        
         # Check if all succeeded
         all_success = all(r["success"] for r in results)
         
@@ -103,6 +135,7 @@ async def send_sms_enhanced(
                 detail="Failed to initialize browser WAA system"
             )
         
+        sender = await account_cache.get_phone_number(current_user["id"], wait=False)
         results = []
         for recipient in input_data.recipients:
             result = await client.send_sms(recipient, input_data.message)
@@ -121,6 +154,7 @@ async def send_sms_enhanced(
                     event_type=WebhookEvent.MESSAGE_SENT,
                     data={
                         "message_id": result.get("transaction_id"),
+                        "sender": sender,
                         "recipient": recipient,
                         "message": input_data.message,
                         "signature_type": result.get("signature_type"),
@@ -132,6 +166,7 @@ async def send_sms_enhanced(
                     user_id=current_user["id"],
                     event_type=WebhookEvent.MESSAGE_FAILED,
                     data={
+                        "sender": sender,
                         "recipient": recipient,
                         "message": input_data.message,
                         "error": result.get("error"),
@@ -174,6 +209,7 @@ async def send_sms_ui_automation(
                 detail="Failed to initialize UI automation service"
             )
         
+        sender = await account_cache.get_phone_number(current_user["id"], wait=False)
         results = []
         for recipient in input_data.recipients:
             result = await client.send_sms(recipient, input_data.message)
@@ -192,6 +228,7 @@ async def send_sms_ui_automation(
                     event_type=WebhookEvent.MESSAGE_SENT,
                     data={
                         "message_id": result.get("message_id"),
+                        "sender": sender,
                         "recipient": recipient,
                         "message": input_data.message,
                         "method": "ui_automation",
@@ -203,6 +240,7 @@ async def send_sms_ui_automation(
                     user_id=current_user["id"],
                     event_type=WebhookEvent.MESSAGE_FAILED,
                     data={
+                        "sender": sender,
                         "recipient": recipient,
                         "message": input_data.message,
                         "error": result.get("error"),
@@ -229,29 +267,27 @@ async def list_threads(
     current_user: dict = Depends(get_current_user)
 ) -> ListThreadsResponse:
     """List conversation threads"""
-    client = await get_gvoice_client(current_user["id"])
+    result = await coalesced_read(
+        current_user["id"],
+        "list_threads",
+        {"folder": folder, "version_token": page_token}
+    )
     
-    try:
-        result = await client.list_threads(folder, page_token)
-        
-        # Convert to our schema format
-        threads = []
-        for thread_data in result.get("threads", []):
-            # This would need proper parsing from protobuf in real implementation
-            threads.append(ThreadResponse(
-                thread_id=thread_data.get("id", ""),
-                participants=thread_data.get("participants", []),
-                messages=[],
-                last_message_time=None
-            ))
-        
-        return ListThreadsResponse(
-            threads=threads,
-            next_page_token=result.get("version_token")
-        )
+    # Convert to our schema format
+    threads = []
+    for thread_data in result.get("threads", []):
+        # This would need proper parsing from protobuf in real implementation
+        threads.append(ThreadResponse(
+            thread_id=thread_data.get("id", ""),
+            participants=thread_data.get("participants", []),
+            messages=[],
+            last_message_time=None
+        ))
     
-    finally:
-        await client.close()
+    return ListThreadsResponse(
+        threads=threads,
+        next_page_token=result.get("version_token")
+    )
 
 @router.get("/threads/{thread_id}")
 async def get_thread(
@@ -260,35 +296,33 @@ async def get_thread(
     current_user: dict = Depends(get_current_user)
 ) -> ThreadResponse:
     """Get messages in a specific thread"""
-    client = await get_gvoice_client(current_user["id"])
+    result = await coalesced_read(
+        current_user["id"],
+        "get_thread",
+        {"thread_id": thread_id, "message_count": message_count}
+    )
     
-    try:
-        result = await client.get_thread(thread_id, message_count)
-        
-        # Convert to our schema format
-        messages = []
-        for msg_data in result.get("messages", []):
-            # This would need proper parsing from protobuf in real implementation
-            messages.append(SMSMessage(
-                id=msg_data.get("id", str(uuid.uuid4())),
-                thread_id=thread_id,
-                sender=msg_data.get("sender"),
-                recipients=msg_data.get("recipients", []),
-                message=msg_data.get("text", ""),
-                timestamp=datetime.utcnow(),
-                direction=msg_data.get("direction", "received"),
-                status=msg_data.get("status")
-            ))
-        
-        return ThreadResponse(
+    # Convert to our schema format
+    messages = []
+    for msg_data in result.get("messages", []):
+        # This would need proper parsing from protobuf in real implementation
+        messages.append(SMSMessage(
+            id=msg_data.get("id", str(uuid.uuid4())),
             thread_id=thread_id,
-            participants=[],  # Would be extracted from thread data
-            messages=messages,
-            last_message_time=messages[0].timestamp if messages else None
-        )
+            sender=msg_data.get("sender"),
+            recipients=msg_data.get("recipients", []),
+            message=msg_data.get("text", ""),
+            timestamp=datetime.utcnow(),
+            direction=msg_data.get("direction", "received"),
+            status=msg_data.get("status")
+        ))
     
-    finally:
-        await client.close()
+    return ThreadResponse(
+        thread_id=thread_id,
+        participants=[],  # Would be extracted from thread data
+        messages=messages,
+        last_message_time=messages[0].timestamp if messages else None
+    )
 
 @router.delete("/threads/{thread_id}")
 async def delete_thread(
@@ -302,6 +336,7 @@ async def delete_thread(
         success = await client.delete_thread(thread_id)
         
         if success:
+            client_registry.invalidate(current_user["id"])
             return {"message": "Thread deleted successfully"}
         else:
             raise HTTPException(status_code=400, detail="Failed to delete thread")
@@ -318,6 +353,7 @@ async def mark_all_read(current_user: dict = Depends(get_current_user)):
         success = await client.mark_all_read()
         
         if success:
+            client_registry.invalidate(current_user["id"])
             return {"message": "All messages marked as read"}
         else:
             raise HTTPException(status_code=400, detail="Failed to mark messages as read")
@@ -326,16 +362,122 @@ async def mark_all_read(current_user: dict = Depends(get_current_user)):
         await client.close()
 
 @router.get("/account")
-async def get_account_info(current_user: dict = Depends(get_current_user)):
+async def get_account_info(
+    refresh: bool = Query(False, description="Bypass the account cache"),
+    current_user: dict = Depends(get_current_user)
+):
     """Get Google Voice account information"""
-    client = await get_gvoice_client(current_user["id"])
-    
     try:
-        account_info = await client.get_account()
-        return {
-            "account": account_info,
-            "user_id": current_user["id"]
-        }
+        account_info = await account_cache.get(current_user["id"], force_refresh=refresh)
+    except NoGVoiceSession:
+        raise HTTPException(
+            status_code=400,
+            detail="No Google Voice session found. Please login with cookies first."
+        )
+    return {
+        "account": account_info,
+        "user_id": current_user["id"]
+    }
+
+def sse_frame(event: str, data: str, event_id: Optional[int] = None) -> str:
+    """Format one Server-Sent Events frame"""
+    if event_id is None:
+        return f"event: {event}\ndata: {data}\n\n"
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+def sse_message(record: dict) -> str:
+    """SSE frame for a logged realtime event, using its seq as the event ID"""
+    data = json.dumps({
+        "seq": record["seq"],
+        "thread_id": record.get("thread_id"),
+        "data": record["data"],
+        "timestamp": record["timestamp"]
+    })
+    return sse_frame(record["type"], data, record["seq"])
+
+@router.get("/events")
+async def stream_events(
+    heartbeat: float = Query(SSE_HEARTBEAT, ge=1, le=300, description="Keep-alive interval in seconds"),
+    since: Optional[int] = Query(None, description="Replay events after this sequence number"),
+    last_event_id: Optional[str] = Header(None, description="Set by EventSource when reconnecting"),
+    current_user: dict = Depends(get_stream_user)
+):
+    """Stream realtime events as Server-Sent Events
     
-    finally:
-        await client.close()
\ No newline at end of file
+    Carries the same events as /api/ws/realtime. Each message's id is its
+    sequence number, so a reconnecting EventSource resumes after the last
+    event it received via Last-Event-ID.
+    """
+    user_id = current_user["id"]
+    jar = await cookie_jars.get_jar(user_id)
+    if not jar:
+        raise HTTPException(
+            status_code=400,
+            detail="No Google Voice session found. Please login with cookies first."
+        )
+    
+    if last_event_id and last_event_id.isdigit():
+        since = int(last_event_id)
+    
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+    overflowed = asyncio.Event()
+    
+    def push(item):
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            overflowed.set()
+    
+    async def on_message(record):
+        push(record)
+    
+    async def on_connected():
+        push(sse_frame("connected", json.dumps({"message": "Real-time connection established"})))
+    
+    async def on_state(state):
+        push(sse_frame("realtime_state", json.dumps({"state": state})))
+    
+    # Subscribe before reading the log so nothing falls between replay and live
+    subscription_id = await realtime_manager.subscribe(
+        user_id, jar, {"message": on_message, "connected": on_connected, "state": on_state}
+    )
+    
+    async def event_stream():
+        try:
+            # Queued live events all arrived after subscribing
+            last_seq = 0
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            
+            if since is not None:
+                events, gap = await event_log.since(user_id, since)
+                if gap:
+                    yield sse_frame("replay_gap", json.dumps({"since": since}))
+                last_seq = since
+                for record in events:
+                    yield sse_message(record)
+                    last_seq = record["seq"]
+            
+            while not overflowed.is_set():
+                try:
+                    item = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                if isinstance(item, str):
+                    yield item
+                elif item["seq"] > last_seq:
+                    yield sse_message(item)
+                    last_seq = item["seq"]
+        finally:
+            await realtime_manager.unsubscribe(user_id, subscription_id)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx and similar proxies from buffering the stream
+            "X-Accel-Buffering": "no"
+        }
+    )
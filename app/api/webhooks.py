@@ -25,7 +25,11 @@ async def create_webhook(
         headers=input_data.headers,
         secret=input_data.secret,
         max_retries=input_data.max_retries,
-        retry_delay=input_data.retry_delay
+        retry_delay=input_data.retry_delay,
+        retry_backoff=input_data.retry_backoff,
+        retry_max_delay=input_data.retry_max_delay,
+        retry_jitter=input_data.retry_jitter,
+        retry_deadline=input_data.retry_deadline or None
     )
     
     await webhook_service.save_webhook(webhook)
@@ -60,6 +64,11 @@ async def list_webhooks(current_user: dict = Depends(get_current_user)):
         for w in webhooks
     ]
 
+@router.get("/status")
+async def get_delivery_status(current_user: dict = Depends(get_current_user)):
+    """Get circuit breaker and connection pool status of your webhook destinations"""
+    return await webhook_service.get_user_status(current_user["id"])
+
 @router.get("/{webhook_id}", response_model=WebhookResponse)
 async def get_webhook(
     webhook_id: str,
@@ -107,10 +116,19 @@ async def update_webhook(
         webhook.status = input_data.status
         if webhook.status == WebhookStatus.ACTIVE:
             webhook.failure_count = 0  # Reset failure count when reactivating
+            await webhook_service.stats.reset_failures(webhook)
     if input_data.max_retries is not None:
         webhook.max_retries = input_data.max_retries
     if input_data.retry_delay is not None:
         webhook.retry_delay = input_data.retry_delay
+    if input_data.retry_backoff is not None:
+        webhook.retry_backoff = input_data.retry_backoff
+    if input_data.retry_max_delay is not None:
+        webhook.retry_max_delay = input_data.retry_max_delay
+    if input_data.retry_jitter is not None:
+        webhook.retry_jitter = input_data.retry_jitter
+    if input_data.retry_deadline is not None:
+        webhook.retry_deadline = input_data.retry_deadline or None
     
     await webhook_service.save_webhook(webhook)
     
@@ -1,61 +1,249 @@
 """WebSocket endpoint for real-time message delivery"""
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, Query
-from typing import Dict, List
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
 import json
 import asyncio
 import logging
 
 from app.core.auth import get_current_user
 from app.core.storage import storage
+from app.models.realtime import RealtimeEventType
+from app.services.cookie_jar import cookie_jars
+from app.services.event_log import event_log
 from app.services.realtime import realtime_manager
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Outbound frames buffered per connection before the slow-consumer policy applies
+SEND_QUEUE_SIZE = 256
+# What to do with a connection whose queue is full: "disconnect" (the client
+# reconnects and replays with ?since=) or "drop_oldest"
+SLOW_CONSUMER_POLICY = "disconnect"
+# Close code sent to disconnected slow consumers (Try Again Later)
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+def _split_list(value: Optional[str]) -> Optional[List[str]]:
+    """Items of a comma-separated query parameter, or None if it is empty"""
+    if not value:
+        return None
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+class EventFilter:
+    """Event types and thread IDs a connection subscribed to (None means all)
+    
+    Thread filters apply to events that belong to a thread; events without
+    a thread ID (e.g. a missed call) are only filtered by type.
+    """
+    
+    def __init__(
+        self,
+        events: Optional[Iterable[str]] = None,
+        threads: Optional[Iterable[str]] = None
+    ):
+        self.events: Optional[FrozenSet[str]] = None
+        if events:
+            valid = {e.value for e in RealtimeEventType}
+            unknown = set(events) - valid
+            if unknown:
+                raise ValueError(f"Unknown event types: {', '.join(sorted(unknown))}")
+            self.events = frozenset(events)
+        self.threads: Optional[FrozenSet[str]] = frozenset(threads) if threads else None
+    
+    @classmethod
+    def from_query(cls, events: Optional[str], threads: Optional[str]) -> "EventFilter":
+        """Build a filter from comma-separated query parameters"""
+        return cls(_split_list(events), _split_list(threads))
+    
+    def matches(self, record: dict) -> bool:
+        """Whether a logged event passes the filter"""
+        if self.events is not None and record["type"] not in self.events:
+            return False
+        if self.threads is not None:
+            thread_id = record.get("thread_id")
+            if thread_id is not None and thread_id not in self.threads:
+                return False
+        return True
+    
+    def describe(self) -> dict:
+        """The filter as sent back to the client"""
+        return {
+            "events": sorted(self.events) if self.events is not None else None,
+            "threads": sorted(self.threads) if self.threads is not None else None
+        }
+
+
+class ClientConnection:
+    """One WebSocket with its bounded outbound queue and writer task"""
+    
+    def __init__(self, websocket: WebSocket, user_id: str, queue_size: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.closed = False
+
+
 class ConnectionManager:
-    """Manage WebSocket connections"""
+    """Manage WebSocket connections
     
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    Frames are serialized once and put on each connection's queue; a writer
+    task per connection sends them, so a slow client only fills its own
+    queue instead of stalling the other tabs and the realtime channel.
+    """
+    
+    def __init__(self, queue_size: int = SEND_QUEUE_SIZE, policy: str = SLOW_CONSUMER_POLICY):
+        self.queue_size = queue_size
+        self.policy = policy
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        # Last serialized message frame per user, shared by all subscribers
+        self._frame_cache: Dict[str, Tuple[int, str]] = {}
+        self.slow_disconnects = 0
     
     async def connect(self, websocket: WebSocket, user_id: str):
         """Connect a WebSocket for a user"""
         await websocket.accept()
         
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        
-        self.active_connections[user_id].append(websocket)
+        connection = ClientConnection(websocket, user_id, self.queue_size)
+        connection.writer = asyncio.create_task(self._write(connection))
+        self.active_connections.setdefault(user_id, {})[websocket] = connection
         logger.info(f"WebSocket connected for user: {user_id}")
     
     def disconnect(self, websocket: WebSocket, user_id: str):
         """Disconnect a WebSocket"""
-        if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
+        connections = self.active_connections.get(user_id)
+        if connections is not None:
+            connection = connections.pop(websocket, None)
+            if connection:
+                connection.closed = True
+                if connection.writer and connection.writer is not asyncio.current_task():
+                    connection.writer.cancel()
             
             # Remove user if no more connections
-            if not self.active_connections[user_id]:
+            if not connections:
                 del self.active_connections[user_id]
+                self._frame_cache.pop(user_id, None)
         
         logger.info(f"WebSocket disconnected for user: {user_id}")
     
+    async def _write(self, connection: ClientConnection):
+        """Writer task: send queued frames in order"""
+        try:
+            while True:
+                text = await connection.queue.get()
+                try:
+                    await connection.websocket.send_text(text)
+                finally:
+                    connection.queue.task_done()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to send to WebSocket: {e}")
+            self.disconnect(connection.websocket, connection.user_id)
+    
+    def _get(self, websocket: WebSocket, user_id: str) -> Optional[ClientConnection]:
+        """Look up the live connection for a WebSocket"""
+        connection = self.active_connections.get(user_id, {}).get(websocket)
+        return None if connection is None or connection.closed else connection
+    
+    def is_connected(self, websocket: WebSocket, user_id: str) -> bool:
+        """Whether a WebSocket is still registered"""
+        return self._get(websocket, user_id) is not None
+    
+    def _enqueue(self, connection: ClientConnection, text: str):
+        """Queue a frame without waiting, applying the slow-consumer policy"""
+        try:
+            connection.queue.put_nowait(text)
+            return
+        except asyncio.QueueFull:
+            pass
+        
+        if self.policy == "drop_oldest":
+            connection.queue.get_nowait()
+            connection.queue.task_done()
+            connection.queue.put_nowait(text)
+            connection.dropped += 1
+            if connection.dropped == 1 or connection.dropped % 100 == 0:
+                logger.warning(
+                    f"Dropping frames for slow WebSocket of user {connection.user_id} "
+                    f"({connection.dropped} so far)"
+                )
+            return
+        
+        logger.warning(f"Disconnecting slow WebSocket for user: {connection.user_id}")
+        self.slow_disconnects += 1
+        self.disconnect(connection.websocket, connection.user_id)
+        asyncio.create_task(self._close(connection.websocket))
+    
+    async def _close(self, websocket: WebSocket):
+        """Close a WebSocket, ignoring errors from an already closed one"""
+        try:
+            await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Client too slow")
+        except Exception:
+            pass
+    
+    async def send(self, websocket: WebSocket, user_id: str, message: dict):
+        """Queue a reply to one connection, waiting for queue space
+        
+        Used for frames the connection's own handler produces (replies,
+        replay), where waiting applies backpressure to that client only.
+        """
+        connection = self._get(websocket, user_id)
+        if connection:
+            await connection.queue.put(json.dumps(message))
+    
     async def send_to_user(self, user_id: str, message: dict):
         """Send message to all connections for a user"""
-        if user_id in self.active_connections:
-            dead_connections = []
-            
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except Exception as e:
-                    logger.warning(f"Failed to send to WebSocket: {e}")
-                    dead_connections.append(connection)
-            
-            # Remove dead connections
-            for dead_conn in dead_connections:
-                self.disconnect(dead_conn, user_id)
+        text = json.dumps(message)
+        for connection in list(self.active_connections.get(user_id, {}).values()):
+            self._enqueue(connection, text)
+    
+    async def send_to_connection(self, websocket: WebSocket, user_id: str, message: dict):
+        """Send message to a single connection"""
+        connection = self._get(websocket, user_id)
+        if connection:
+            self._enqueue(connection, json.dumps(message))
+    
+    def message_text(self, user_id: str, record: dict) -> str:
+        """Serialize a logged event record, once per broadcast"""
+        cached = self._frame_cache.get(user_id)
+        if cached and cached[0] == record["seq"]:
+            return cached[1]
+        frame = {
+            "type": record["type"],
+            "seq": record["seq"],
+            "data": record["data"],
+            "timestamp": record["timestamp"]
+        }
+        if record.get("thread_id") is not None:
+            frame["thread_id"] = record["thread_id"]
+        text = json.dumps(frame)
+        self._frame_cache[user_id] = (record["seq"], text)
+        return text
+    
+    async def send_record(self, websocket: WebSocket, user_id: str, record: dict, wait: bool = False):
+        """Send a logged message record to one connection"""
+        connection = self._get(websocket, user_id)
+        if connection is None:
+            return
+        text = self.message_text(user_id, record)
+        if wait:
+            await connection.queue.put(text)
+        else:
+            self._enqueue(connection, text)
+    
+    async def drain(self, websocket: WebSocket, user_id: str, timeout: float = 5.0):
+        """Wait until a connection's queued frames were sent"""
+        connection = self._get(websocket, user_id)
+        if connection:
+            try:
+                await asyncio.wait_for(connection.queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
     
     def get_user_count(self) -> int:
         """Get number of connected users"""
@@ -64,6 +252,16 @@ class ConnectionManager:
     def get_connection_count(self) -> int:
         """Get total number of connections"""
         return sum(len(conns) for conns in self.active_connections.values())
+    
+    def get_queue_stats(self) -> Dict[str, int]:
+        """Outbound queue depth and slow-consumer counters"""
+        connections = [c for conns in self.active_connections.values() for c in conns.values()]
+        return {
+            "queued_frames": sum(c.queue.qsize() for c in connections),
+            "max_queue_depth": max((c.queue.qsize() for c in connections), default=0),
+            "dropped_frames": sum(c.dropped for c in connections),
+            "slow_disconnects": self.slow_disconnects
+        }
 
 # Global connection manager
 manager = ConnectionManager()
@@ -82,9 +280,18 @@ async def authenticate_websocket(token: str) -> dict:
 @router.websocket("/realtime")
 async def websocket_endpoint(
     websocket: WebSocket,
-    token: str = Query(..., description="Session token for authentication")
+    token: str = Query(..., description="Session token for authentication"),
+    since: Optional[int] = Query(None, description="Replay events after this sequence number"),
+    events: Optional[str] = Query(None, description="Comma-separated event types to receive"),
+    threads: Optional[str] = Query(None, description="Comma-separated thread IDs to receive")
 ):
-    """WebSocket endpoint for real-time message receiving"""
+    """WebSocket endpoint for real-time message receiving
+    
+    Clients can narrow what they receive with the events/threads query
+    parameters or at any time with
+    {"type": "subscribe", "events": [...], "threads": [...]}; omitted or
+    null fields mean all. Events are filtered before they are serialized.
+    """
     
     try:
         # Authenticate user
@@ -94,44 +301,88 @@ async def websocket_endpoint(
         # Connect WebSocket
         await manager.connect(websocket, user_id)
         
-        # Get Google Voice cookies
-        gv_cookies = await storage.get_gv_session(user_id)
-        if not gv_cookies:
-            await websocket.send_text(json.dumps({
+        # Get the live Google Voice cookie jar
+        jar = await cookie_jars.get_jar(user_id)
+        if not jar:
+            await manager.send(websocket, user_id, {
                 "type": "error",
                 "message": "No Google Voice session found. Please login with cookies first."
-            }))
+            })
+            await manager.drain(websocket, user_id)
             return
         
-        # Define event handlers for realtime messages
-        async def on_message(message_data):
+        # Initial subscription from the query string
+        try:
+            event_filter = EventFilter.from_query(events, threads)
+        except ValueError as e:
+            await manager.send(websocket, user_id, {"type": "error", "message": str(e)})
+            event_filter = EventFilter()
+        
+        # Live events are held back while a replay is being sent
+        replay_pending: Optional[List[dict]] = [] if since is not None else None
+        
+        # Define event handlers for this connection; the user's upstream
+        # channel is shared and fans events out to every subscriber
+        async def on_message(record):
             """Handle incoming real-time message"""
-            await manager.send_to_user(user_id, {
-                "type": "message",
-                "data": message_data,
-                "timestamp": asyncio.get_event_loop().time()
-            })
+            if replay_pending is not None:
+                replay_pending.append(record)
+                return
+            if event_filter.matches(record):
+                await manager.send_record(websocket, user_id, record)
         
         async def on_connected():
             """Handle realtime connection established"""
-            await manager.send_to_user(user_id, {
+            await manager.send_to_connection(websocket, user_id, {
                 "type": "connected",
                 "message": "Real-time connection established"
             })
         
-        # Start realtime client
+        async def on_state(state):
+            """Report upstream channel health changes (reconnecting, failed, ...)"""
+            await manager.send_to_connection(websocket, user_id, {
+                "type": "realtime_state",
+                "state": state
+            })
+        
+        # Subscribe to the user's realtime channel
         event_handlers = {
             "message": on_message,
-            "connected": on_connected
+            "connected": on_connected,
+            "state": on_state
         }
         
-        await realtime_manager.start_client(user_id, gv_cookies, event_handlers)
+        subscription_id = await realtime_manager.subscribe(user_id, jar, event_handlers)
         
         # Send connection success
-        await websocket.send_text(json.dumps({
+        await manager.send(websocket, user_id, {
             "type": "connected",
-            "message": f"Real-time messaging started for {user_data['email']}"
-        }))
+            "message": f"Real-time messaging started for {user_data['email']}",
+            "seq": await event_log.last_seq(user_id)
+        })
+        
+        # Replay missed events, then switch to live delivery
+        if since is not None:
+            replayed, gap = await event_log.since(user_id, since)
+            if gap:
+                # Older events are gone; the client has to re-fetch threads
+                await manager.send(websocket, user_id, {"type": "replay_gap", "since": since})
+            last_seq = since
+            for record in replayed:
+                if event_filter.matches(record):
+                    await manager.send_record(websocket, user_id, record, wait=True)
+                last_seq = record["seq"]
+            
+            # Drain events that arrived during the replay; more may arrive
+            # while sending, so switch to live only once the list is empty
+            while replay_pending:
+                record = replay_pending.pop(0)
+                if record["seq"] > last_seq:
+                    if event_filter.matches(record):
+                        await manager.send_record(websocket, user_id, record, wait=True)
+                    last_seq = record["seq"]
+            replay_pending = None
+            await manager.send(websocket, user_id, {"type": "replay_complete", "seq": last_seq})
         
         # Keep connection alive and handle client messages
         while True:
@@ -142,27 +393,40 @@ async def websocket_endpoint(
                 
                 # Handle different message types
                 if message.get("type") == "ping":
-                    await websocket.send_text(json.dumps({"type": "pong"}))
+                    await manager.send(websocket, user_id, {"type": "pong"})
+                elif message.get("type") == "subscribe":
+                    try:
+                        event_filter = EventFilter(message.get("events"), message.get("threads"))
+                    except (TypeError, ValueError) as e:
+                        await manager.send(websocket, user_id, {"type": "error", "message": str(e)})
+                    else:
+                        await manager.send(websocket, user_id, {
+                            "type": "subscribed",
+                            **event_filter.describe()
+                        })
                 elif message.get("type") == "status":
-                    await websocket.send_text(json.dumps({
+                    await manager.send(websocket, user_id, {
                         "type": "status",
                         "connected_users": manager.get_user_count(),
                         "total_connections": manager.get_connection_count()
-                    }))
+                    })
                 
             except WebSocketDisconnect:
                 break
             except json.JSONDecodeError:
-                await websocket.send_text(json.dumps({
+                await manager.send(websocket, user_id, {
                     "type": "error",
                     "message": "Invalid JSON received"
-                }))
+                })
             except Exception as e:
+                if not manager.is_connected(websocket, user_id):
+                    # Closed by us, e.g. as a slow consumer
+                    break
                 logger.error(f"Error handling WebSocket message: {e}")
-                await websocket.send_text(json.dumps({
+                await manager.send(websocket, user_id, {
                     "type": "error",
                     "message": str(e)
-                }))
+                })
     
     except ValueError as e:
         # Authentication failed
@@ -186,10 +450,9 @@ async def websocket_endpoint(
         # Cleanup
         if 'user_id' in locals():
             manager.disconnect(websocket, user_id)
-            # Note: Keep realtime client running for other connections
-            # Only stop if this was the last connection for this user
-            if user_id not in manager.active_connections:
-                await realtime_manager.stop_client(user_id)
+            # The channel outlives this connection for a grace period
+            if 'subscription_id' in locals():
+                await realtime_manager.unsubscribe(user_id, subscription_id)
 
 @router.get("/realtime/status")
 async def get_realtime_status():
@@ -197,5 +460,7 @@ async def get_realtime_status():
     return {
         "connected_users": manager.get_user_count(),
         "total_connections": manager.get_connection_count(),
-        "active_users": list(manager.active_connections.keys())
+        "active_users": list(manager.active_connections.keys()),
+        "queues": manager.get_queue_stats(),
+        "upstream": realtime_manager.get_status()
     }
\ No newline at end of file
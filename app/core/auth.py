@@ -1,4 +1,4 @@
-from fastapi import HTTPException, Depends, Header
+from fastapi import HTTPException, Depends, Header, Query
 from typing import Optional, Dict
 from app.core.storage import storage
 
@@ -23,4 +23,14 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict:
     session_data["has_gv_session"] = gv_cookies is not None
     session_data["session_id"] = session_id
     
-    return session_data
\ No newline at end of file
+    return session_data
+
+
+async def get_stream_user(
+    authorization: Optional[str] = Header(None),
+    token: Optional[str] = Query(None, description="Session token, for clients that can't set headers")
+) -> Dict:
+    """Authenticate a streaming request by Authorization header or ?token= (e.g. EventSource)"""
+    if token and not authorization:
+        authorization = f"Bearer {token}"
+    return await get_current_user(authorization)
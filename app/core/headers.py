@@ -0,0 +1,160 @@
+"""Request header construction shared by the Google Voice clients"""
+
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+from app.core.constants import (
+    USER_AGENT, CH_USER_AGENT, CH_PLATFORM, CLIENT_VERSION,
+    JAVASCRIPT_USER_AGENT, WAA_X_USER_AGENT, API_KEY, WAA_API_KEY,
+    ORIGIN, API_DOMAIN, CONTACTS_DOMAIN, WAA_DOMAIN, UPLOAD_DOMAIN,
+    CLIENT_DETAILS
+)
+from app.core.sapisid import authorization_header
+
+# Encoded once instead of on every API request
+CLIENT_DETAILS_ENCODED = urlencode(CLIENT_DETAILS)
+
+BASE_HEADERS = {
+    "Sec-Ch-Ua": CH_USER_AGENT,
+    "Sec-Ch-Ua-Platform": CH_PLATFORM,
+    "Sec-Ch-Ua-Mobile": "?0",
+    "User-Agent": USER_AGENT,
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.5",
+}
+
+# Templates are memoized per (scheme + host, api_extras); bound the memo in case
+# callers ever pass unexpected hosts
+_MAX_TEMPLATES = 64
+_templates: Dict[Tuple[str, bool], Dict[str, str]] = {}
+
+
+def _url_origin(url: str) -> str:
+    """Return the scheme and host part of a URL without parsing it fully"""
+    end = url.find("/", 8)
+    return url if end == -1 else url[:end]
+
+
+def build_template(origin: str, api_extras: bool = True) -> Dict[str, str]:
+    """Build the static headers for requests to an origin (scheme + host)
+
+    With api_extras=False only the browser and origin headers are set, which
+    is what the realtime channel sends.
+    """
+    headers = dict(BASE_HEADERS)
+
+    # Set origin and referer
+    if UPLOAD_DOMAIN in origin:
+        headers["Origin"] = f"https://{UPLOAD_DOMAIN}"
+        headers["Referer"] = f"https://{UPLOAD_DOMAIN}/"
+    else:
+        headers["Origin"] = ORIGIN
+        headers["Referer"] = f"{ORIGIN}/"
+
+    if api_extras:
+        # API domain specific headers
+        if API_DOMAIN in origin:
+            headers["X-Client-Version"] = CLIENT_VERSION
+            headers["X-ClientDetails"] = CLIENT_DETAILS_ENCODED
+            headers["X-JavaScript-User-Agent"] = JAVASCRIPT_USER_AGENT
+            headers["X-Requested-With"] = "XMLHttpRequest"
+            headers["X-Goog-Encode-Response-If-Executable"] = "base64"
+
+        # Contacts domain specific headers
+        if CONTACTS_DOMAIN in origin:
+            headers["X-Goog-Api-Key"] = API_KEY
+            headers["X-Goog-Encode-Response-If-Executable"] = "base64"
+
+        # WAA domain specific headers
+        if WAA_DOMAIN in origin:
+            headers["X-Goog-Api-Key"] = WAA_API_KEY
+            headers["X-User-Agent"] = WAA_X_USER_AGENT
+
+        # Set sec-fetch-site
+        if API_DOMAIN in origin and origin.startswith("https://"):
+            headers["Sec-Fetch-Site"] = "same-site"
+        else:
+            headers["Sec-Fetch-Site"] = "same-origin"
+    else:
+        headers["Sec-Fetch-Site"] = "same-site"
+
+    return headers
+
+
+def get_template(url: str, api_extras: bool = True) -> Dict[str, str]:
+    """Get the memoized static header template for a URL (do not mutate)"""
+    key = (_url_origin(url), api_extras)
+    template = _templates.get(key)
+    if template is None:
+        if len(_templates) >= _MAX_TEMPLATES:
+            _templates.clear()
+        template = build_template(key[0], api_extras)
+        _templates[key] = template
+    return template
+
+
+class HeaderBuilder:
+    """Builds per-request headers from precomputed templates
+
+    The Cookie header is serialized once and reused until
+    cookies_changed() is called; the SAPISIDHASH Authorization value comes
+    from the shared per-second memo in app.core.sapisid.
+    """
+
+    def __init__(
+        self,
+        cookies: Dict[str, str],
+        auth_user: str = "0",
+        api_extras: bool = True,
+        sapisid_variants: bool = False
+    ):
+        self.cookies = cookies
+        self.auth_user = auth_user
+        self.api_extras = api_extras
+        self.sapisid_variants = sapisid_variants
+        self._cookie_header: Optional[str] = None
+
+    def set_cookies(self, cookies: Dict[str, str]):
+        """Replace the cookies used for requests"""
+        self.cookies = cookies
+        self.cookies_changed()
+
+    def cookies_changed(self):
+        """Invalidate cached cookie-derived headers after the cookies were mutated"""
+        self._cookie_header = None
+
+    def _get_cookie_header(self) -> str:
+        """Serialize cookies into a Cookie header, cached until they change"""
+        if self._cookie_header is None:
+            self._cookie_header = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        return self._cookie_header
+
+    def build(
+        self,
+        url: str,
+        content_type: Optional[str] = None,
+        extra_headers: Optional[Dict[str, str]] = None
+    ) -> Dict[str, str]:
+        """Build the full header dict for a request to url"""
+        headers = dict(get_template(url, self.api_extras))
+        headers["X-Goog-AuthUser"] = self.auth_user
+
+        if content_type:
+            headers["Content-Type"] = content_type
+
+        # Add authorization if we have SAPISID cookie
+        authorization = authorization_header(
+            self.cookies, include_variants=self.sapisid_variants
+        )
+        if authorization:
+            headers["Authorization"] = authorization
+
+        if self.cookies:
+            headers["Cookie"] = self._get_cookie_header()
+
+        if extra_headers:
+            headers.update(extra_headers)
+
+        return headers
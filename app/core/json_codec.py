@@ -0,0 +1,44 @@
+"""JSON encoding to bytes, using orjson when it is installed"""
+
+import json
+import os
+from typing import Any, Callable
+
+# Set to "json" to force the standard library encoder
+JSON_ENCODER_ENV = "GVOICE_JSON_ENCODER"
+
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+
+def _select_encoder() -> Callable[[Any], bytes]:
+    """Use orjson if it's importable and behaves like the stdlib encoder
+
+    Both produce compact UTF-8 output, so payloads made of plain JSON
+    types encode to the same bytes whichever is selected.
+    """
+    if os.getenv(JSON_ENCODER_ENV, "").lower() == "json":
+        return _stdlib_dumps
+    try:
+        import orjson
+    except ImportError:
+        return _stdlib_dumps
+
+    options = orjson.OPT_NON_STR_KEYS
+
+    def _orjson_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str, option=options)
+
+    sample = {"event": "message.received", "data": {"text": "hé", "n": 1, "ok": None}}
+    try:
+        if json.loads(_orjson_dumps(sample)) != sample:
+            return _stdlib_dumps
+    except Exception:
+        return _stdlib_dumps
+    return _orjson_dumps
+
+
+# Encoder chosen at import time
+dumps_bytes = _select_encoder()
+JSON_ENCODER = "orjson" if dumps_bytes is not _stdlib_dumps else "json"
@@ -0,0 +1,80 @@
+"""SAPISIDHASH authorization signing shared by all Google Voice clients"""
+
+import hashlib
+import time
+from functools import lru_cache
+from typing import Dict, Optional
+
+from app.core.constants import ORIGIN
+
+# Authorization schemes and the cookie each one is signed with
+SAPISID_SCHEMES = (
+    ("SAPISIDHASH", "SAPISID"),
+    ("SAPISID1PHASH", "__Secure-1PAPISID"),
+    ("SAPISID3PHASH", "__Secure-3PAPISID"),
+)
+
+
+@lru_cache(maxsize=4096)
+def _signed_value(scheme: str, timestamp: int, sapisid: str, origin: str) -> str:
+    """Hash and format one scheme value; memoized per (second, cookie, origin)"""
+    hash_value = hashlib.sha1(f"{timestamp} {sapisid} {origin}".encode()).hexdigest()
+    return f"{scheme} {timestamp}_{hash_value}"
+
+
+@lru_cache(maxsize=1024)
+def _combined_value(
+    timestamp: int,
+    origin: str,
+    sapisid: str,
+    sapisid_1p: Optional[str],
+    sapisid_3p: Optional[str]
+) -> str:
+    """Join the SAPISIDHASH value with whichever 1P/3P variants apply"""
+    parts = [_signed_value("SAPISIDHASH", timestamp, sapisid, origin)]
+    for (scheme, _), variant_cookie in zip(SAPISID_SCHEMES[1:], (sapisid_1p, sapisid_3p)):
+        if variant_cookie is not None:
+            parts.append(_signed_value(scheme, timestamp, variant_cookie, origin))
+    return " ".join(parts)
+
+
+def sapisid_hash(
+    sapisid: str,
+    origin: str = ORIGIN,
+    timestamp: Optional[int] = None,
+    scheme: str = "SAPISIDHASH"
+) -> str:
+    """Generate a SAPISID-style hash for the Authorization header
+
+    The hash only depends on the whole second, so repeated calls within the
+    same second for the same cookie and origin are served from a memo.
+    """
+    if timestamp is None:
+        timestamp = int(time.time())
+    return _signed_value(scheme, timestamp, sapisid, origin)
+
+
+def authorization_header(
+    cookies: Dict[str, str],
+    origin: str = ORIGIN,
+    timestamp: Optional[int] = None,
+    include_variants: bool = False
+) -> Optional[str]:
+    """Build the Authorization header value for a cookie set
+
+    Returns None when there is no SAPISID cookie. With include_variants the
+    SAPISID1PHASH/SAPISID3PHASH values are appended for whichever of the
+    __Secure-1PAPISID/__Secure-3PAPISID cookies are present, as browsers do.
+    """
+    sapisid = cookies.get("SAPISID")
+    if sapisid is None:
+        return None
+    if timestamp is None:
+        timestamp = int(time.time())
+
+    if not include_variants:
+        return _signed_value("SAPISIDHASH", timestamp, sapisid, origin)
+    return _combined_value(
+        timestamp, origin, sapisid,
+        cookies.get("__Secure-1PAPISID"), cookies.get("__Secure-3PAPISID")
+    )
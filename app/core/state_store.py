@@ -0,0 +1,316 @@
+"""Shared state backends: versioned JSON documents, leases and work queues"""
+
+import asyncio
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Networked state backend, e.g. "redis://redis:6379/0"; unset means local files
+STATE_URL_ENV = "GVOICE_STATE_URL"
+# Prefix for every key written by this application
+STATE_PREFIX = "gvoice"
+# How long a deleted document's version is remembered (seconds); far longer
+# than any read-modify-write, so a stale compare-and-set can't match a
+# recreated document
+DELETED_VERSION_TTL = 3600.0
+
+
+class StateStore(ABC):
+    """Key/value store shared by every replica
+
+    Values are JSON-serializable dicts with a version that increases on
+    every write, so callers can do optimistic compare-and-set updates. A
+    missing document reads as version 0, but versions keep counting across
+    deletes (for DELETED_VERSION_TTL), so a stale compare-and-set never
+    matches a recreated document. Versions of documents that expire by
+    their TTL start over.
+    Leases give one holder exclusive ownership of a key until they expire;
+    queues are FIFO lists consumed by any replica.
+    """
+
+    async def close(self):
+        """Release connections"""
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a document"""
+        value, _ = await self.get_versioned(key)
+        return value
+
+    @abstractmethod
+    async def get_versioned(self, key: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        """Get a document and its version (0 if it doesn't exist)"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> int:
+        """Write a document unconditionally; returns the new version"""
+
+    @abstractmethod
+    async def compare_and_set(
+        self, key: str, value: Dict[str, Any], expected_version: int
+    ) -> Optional[int]:
+        """Write only if the version is unchanged; returns the new version or None"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> bool:
+        """Delete a document"""
+
+    @abstractmethod
+    async def keys(self, prefix: str) -> List[str]:
+        """List document keys starting with prefix"""
+
+    @abstractmethod
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """Take a lease (or extend one already held by owner)"""
+
+    @abstractmethod
+    async def renew_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """Extend a lease held by owner; False if it was lost"""
+
+    @abstractmethod
+    async def release_lease(self, key: str, owner: str):
+        """Give up a lease held by owner"""
+
+    @abstractmethod
+    async def push(self, queue: str, item: Dict[str, Any]):
+        """Append an item to a queue"""
+
+    @abstractmethod
+    async def pop(self, queue: str, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        """Take the oldest item from a queue, waiting up to timeout seconds"""
+
+
+class MemoryStateStore(StateStore):
+    """In-process stand-in for a networked store (single replica and tests)"""
+
+    def __init__(self):
+        self._docs: Dict[str, Tuple[Dict[str, Any], int, Optional[float]]] = {}
+        # Last version and expiry of deleted documents, oldest first
+        self._deleted: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._queues: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._queue_ready = asyncio.Condition()
+
+    def _live(self, key: str) -> Optional[Tuple[Dict[str, Any], int, Optional[float]]]:
+        """Return a document entry unless it has expired"""
+        entry = self._docs.get(key)
+        if entry and entry[2] is not None and entry[2] <= time.monotonic():
+            del self._docs[key]
+            return None
+        return entry
+
+    def _sweep_deleted(self):
+        """Forget versions of documents deleted more than DELETED_VERSION_TTL ago"""
+        now = time.monotonic()
+        while self._deleted:
+            _, (_, expires) = next(iter(self._deleted.items()))
+            if expires > now:
+                break
+            self._deleted.popitem(last=False)
+
+    def _write(self, key: str, value: Dict[str, Any], ttl: Optional[float]) -> int:
+        entry = self._live(key)
+        if entry is not None:
+            version = entry[1] + 1
+        else:
+            # Versions keep counting across deletes so a stale CAS can never match
+            self._sweep_deleted()
+            deleted = self._deleted.pop(key, None)
+            version = (deleted[0] if deleted else 0) + 1
+        expires = time.monotonic() + ttl if ttl else None
+        # Store a copy, as a networked store would
+        self._docs[key] = (json.loads(json.dumps(value, default=str)), version, expires)
+        return version
+
+    async def get_versioned(self, key: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        entry = self._live(key)
+        if entry is None:
+            return None, 0
+        return json.loads(json.dumps(entry[0])), entry[1]
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> int:
+        return self._write(key, value, ttl)
+
+    async def compare_and_set(
+        self, key: str, value: Dict[str, Any], expected_version: int
+    ) -> Optional[int]:
+        entry = self._live(key)
+        current = entry[1] if entry else 0
+        if current != expected_version:
+            return None
+        return self._write(key, value, None)
+
+    async def delete(self, key: str) -> bool:
+        entry = self._live(key)
+        if entry is None:
+            return False
+        del self._docs[key]
+        self._sweep_deleted()
+        self._deleted[key] = (entry[1], time.monotonic() + DELETED_VERSION_TTL)
+        return True
+
+    async def keys(self, prefix: str) -> List[str]:
+        return [key for key in list(self._docs) if key.startswith(prefix) and self._live(key)]
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.monotonic()
+        holder = self._leases.get(key)
+        if holder and holder[0] != owner and holder[1] > now:
+            return False
+        self._leases[key] = (owner, now + ttl)
+        return True
+
+    async def renew_lease(self, key: str, owner: str, ttl: float) -> bool:
+        holder = self._leases.get(key)
+        if not holder or holder[0] != owner or holder[1] <= time.monotonic():
+            return False
+        self._leases[key] = (owner, time.monotonic() + ttl)
+        return True
+
+    async def release_lease(self, key: str, owner: str):
+        holder = self._leases.get(key)
+        if holder and holder[0] == owner:
+            del self._leases[key]
+
+    async def push(self, queue: str, item: Dict[str, Any]):
+        async with self._queue_ready:
+            self._queues.setdefault(queue, deque()).append(json.loads(json.dumps(item, default=str)))
+            self._queue_ready.notify_all()
+
+    async def pop(self, queue: str, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        async with self._queue_ready:
+            items = self._queues.setdefault(queue, deque())
+            if not items:
+                try:
+                    await asyncio.wait_for(
+                        self._queue_ready.wait_for(lambda: bool(items)), timeout
+                    )
+                except asyncio.TimeoutError:
+                    return None
+            return items.popleft()
+
+
+class RedisStateStore(StateStore):
+    """StateStore on Redis or a Redis-compatible server
+
+    Documents are hashes holding the JSON data and its version; CAS and
+    lease renewal run as Lua scripts so they are atomic on the server.
+    Deleting a document removes its data but keeps the version field for
+    DELETED_VERSION_TTL, after which Redis expires the key, so versions
+    keep counting as in MemoryStateStore without leaking keys.
+    Needs the optional redis package, imported only when configured.
+    """
+
+    _CAS_SCRIPT = (
+        "local v = tonumber(redis.call('hget', KEYS[1], 'version') or '0') "
+        "local current = v "
+        "if redis.call('hexists', KEYS[1], 'data') == 0 then current = 0 end "
+        "if current ~= tonumber(ARGV[1]) then return -1 end "
+        "redis.call('hset', KEYS[1], 'data', ARGV[2], 'version', v + 1) "
+        "if current == 0 then redis.call('persist', KEYS[1]) end "
+        "return v + 1"
+    )
+    _DELETE_SCRIPT = (
+        "if redis.call('hexists', KEYS[1], 'data') == 0 then return 0 end "
+        "redis.call('hdel', KEYS[1], 'data') "
+        "redis.call('pexpire', KEYS[1], ARGV[1]) "
+        "return 1"
+    )
+    _SET_SCRIPT = (
+        "local v = redis.call('hincrby', KEYS[1], 'version', 1) "
+        "redis.call('hset', KEYS[1], 'data', ARGV[1]) "
+        "if tonumber(ARGV[2]) > 0 then redis.call('pexpire', KEYS[1], ARGV[2]) "
+        "else redis.call('persist', KEYS[1]) end "
+        "return v"
+    )
+    _RENEW_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    )
+    _RELEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, url: str, prefix: str = STATE_PREFIX):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError(f"{url} requires the redis package (pip install redis)")
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url, decode_responses=True)
+
+    def _key(self, kind: str, key: str) -> str:
+        return f"{self.prefix}:{kind}:{key}"
+
+    async def close(self):
+        await self._redis.close()
+
+    async def get_versioned(self, key: str) -> Tuple[Optional[Dict[str, Any]], int]:
+        entry = await self._redis.hgetall(self._key("doc", key))
+        if not entry or "data" not in entry:
+            return None, 0
+        return json.loads(entry["data"]), int(entry.get("version", 0))
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> int:
+        return int(await self._redis.eval(
+            self._SET_SCRIPT, 1, self._key("doc", key),
+            json.dumps(value, default=str), int((ttl or 0) * 1000)
+        ))
+
+    async def compare_and_set(
+        self, key: str, value: Dict[str, Any], expected_version: int
+    ) -> Optional[int]:
+        version = int(await self._redis.eval(
+            self._CAS_SCRIPT, 1, self._key("doc", key),
+            expected_version, json.dumps(value, default=str)
+        ))
+        return None if version < 0 else version
+
+    async def delete(self, key: str) -> bool:
+        return bool(await self._redis.eval(
+            self._DELETE_SCRIPT, 1, self._key("doc", key), int(DELETED_VERSION_TTL * 1000)
+        ))
+
+    async def keys(self, prefix: str) -> List[str]:
+        start = len(self._key("doc", ""))
+        found = [key async for key in self._redis.scan_iter(match=self._key("doc", prefix) + "*")]
+        if not found:
+            return []
+        # Skip recently deleted documents, which only keep their version
+        pipe = self._redis.pipeline(transaction=False)
+        for key in found:
+            pipe.hexists(key, "data")
+        exists = await pipe.execute()
+        return [key[start:] for key, live in zip(found, exists) if live]
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        acquired = await self._redis.set(
+            self._key("lease", key), owner, nx=True, px=int(ttl * 1000)
+        )
+        return bool(acquired) or await self.renew_lease(key, owner, ttl)
+
+    async def renew_lease(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(await self._redis.eval(
+            self._RENEW_SCRIPT, 1, self._key("lease", key), owner, int(ttl * 1000)
+        ))
+
+    async def release_lease(self, key: str, owner: str):
+        await self._redis.eval(self._RELEASE_SCRIPT, 1, self._key("lease", key), owner)
+
+    async def push(self, queue: str, item: Dict[str, Any]):
+        await self._redis.rpush(self._key("queue", queue), json.dumps(item, default=str))
+
+    async def pop(self, queue: str, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        result = await self._redis.blpop(self._key("queue", queue), timeout=max(int(timeout), 1))
+        return json.loads(result[1]) if result else None
+
+
+def create_state_store(url: str) -> StateStore:
+    """Create a state store from a URL (memory:// for the in-process stand-in)"""
+    if url.startswith("memory://"):
+        return MemoryStateStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateStore(url)
+    raise ValueError(f"Unsupported state store URL: {url}")
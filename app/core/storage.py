@@ -3,12 +3,14 @@
 import json
 import os
 from pathlib import Path
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, List, Tuple
 import asyncio
 import aiofiles
 from datetime import datetime, timedelta
 import uuid
 
+from app.core.state_store import StateStore, STATE_URL_ENV, create_state_store
+
 class FileStorage:
     """File-based storage using .config/gvoice directory"""
     
@@ -17,6 +19,9 @@ class FileStorage:
         self.sessions_dir = self.base_dir / "sessions"
         self.users_dir = self.base_dir / "users"
         self.gv_sessions_dir = self.base_dir / "gv_sessions"
+        # Networked state store when documents are shared between replicas
+        self.state: Optional[StateStore] = None
+        self._cas_lock = asyncio.Lock()
         
         # Create directories if they don't exist
         self._ensure_directories()
@@ -52,6 +57,34 @@ class FileStorage:
             pass
         return False
     
+    async def file_exists(self, filepath: Path) -> bool:
+        """Check if a JSON file exists"""
+        return filepath.exists()
+    
+    async def list_json_files(self, directory: Path) -> List[Path]:
+        """List the JSON files in a directory"""
+        if not directory.exists():
+            return []
+        return list(directory.glob("*.json"))
+    
+    async def load_json_versioned(self, filepath: Path) -> Tuple[Optional[Dict], int]:
+        """Load a JSON file with its write version (0 if missing)"""
+        data = await self.load_json_file(filepath)
+        if data is None:
+            return None, 0
+        return data, data.get("version", 0)
+    
+    async def compare_and_set_json(
+        self, filepath: Path, data: Dict, expected_version: int
+    ) -> Optional[int]:
+        """Write a JSON file only if its version is unchanged; returns the new version"""
+        async with self._cas_lock:
+            _, version = await self.load_json_versioned(filepath)
+            if version != expected_version:
+                return None
+            await self.save_json_file(filepath, {**data, "version": version + 1})
+            return version + 1
+    
     # User management
     async def save_user(self, email: str, user_data: Dict) -> None:
         """Save user data"""
@@ -69,7 +102,7 @@ class FileStorage:
         """Check if user exists"""
         safe_email = email.replace("@", "_at_").replace(".", "_")
         filepath = self.users_dir / f"{safe_email}.json"
-        return filepath.exists()
+        return await self.file_exists(filepath)
     
     # Session management
     async def create_session(self, user_data: Dict, expire_minutes: int = 1440) -> str:
@@ -117,14 +150,30 @@ class FileStorage:
         return True
     
     # Google Voice session management
-    async def save_gv_session(self, user_id: str, cookies: Dict[str, str]) -> None:
-        """Save Google Voice session cookies"""
+    async def save_gv_session(self, user_id: str, cookies: Dict[str, str]) -> int:
+        """Save Google Voice session cookies, replacing any stored ones"""
+        while True:
+            _, version = await self.get_gv_session_versioned(user_id)
+            new_version = await self.compare_and_set_gv_session(user_id, cookies, version)
+            if new_version is not None:
+                return new_version
+    
+    async def get_gv_session_versioned(self, user_id: str) -> Tuple[Optional[Dict[str, str]], int]:
+        """Get Google Voice session cookies with their version (for compare-and-set)"""
+        filepath = self.gv_sessions_dir / f"{user_id}.json"
+        data, version = await self.load_json_versioned(filepath)
+        return (data.get("cookies") if data else None), version
+    
+    async def compare_and_set_gv_session(
+        self, user_id: str, cookies: Dict[str, str], expected_version: int
+    ) -> Optional[int]:
+        """Save cookies only if nobody else saved since expected_version"""
         filepath = self.gv_sessions_dir / f"{user_id}.json"
         data = {
             "cookies": cookies,
             "saved_at": datetime.utcnow().isoformat()
         }
-        await self.save_json_file(filepath, data)
+        return await self.compare_and_set_json(filepath, data, expected_version)
     
     async def get_gv_session(self, user_id: str) -> Optional[Dict[str, str]]:
         """Get Google Voice session cookies"""
@@ -134,6 +183,10 @@ class FileStorage:
             return data.get("cookies")
         return None
     
+    async def list_gv_session_user_ids(self) -> List[str]:
+        """List user IDs that have stored Google Voice sessions"""
+        return [f.stem for f in await self.list_json_files(self.gv_sessions_dir)]
+    
     async def delete_gv_session(self, user_id: str) -> bool:
         """Delete Google Voice session"""
         filepath = self.gv_sessions_dir / f"{user_id}.json"
@@ -142,12 +195,72 @@ class FileStorage:
     # Cleanup expired sessions
     async def cleanup_expired_sessions(self):
         """Remove expired sessions"""
-        for session_file in self.sessions_dir.glob("*.json"):
+        for session_file in await self.list_json_files(self.sessions_dir):
             session_data = await self.load_json_file(session_file)
             if session_data:
                 expires_at = datetime.fromisoformat(session_data["expires_at"])
                 if datetime.utcnow() > expires_at:
                     await self.delete_file(session_file)
 
+
+class SharedStorage(FileStorage):
+    """Storage whose documents live in a networked StateStore
+    
+    Replicas behind a load balancer share sessions, Google Voice cookies
+    and webhooks this way. File paths under the base directory are mapped
+    to store keys, so every caller of the FileStorage API works unchanged.
+    """
+    
+    def __init__(self, state: StateStore):
+        super().__init__()
+        self.state = state
+    
+    def _key(self, filepath: Path) -> str:
+        """Store key for a path, e.g. sessions/<id>"""
+        return Path(filepath).relative_to(self.base_dir).with_suffix("").as_posix()
+    
+    async def save_json_file(self, filepath: Path, data: Dict) -> None:
+        """Save a document"""
+        await self.state.set(self._key(filepath), data)
+    
+    async def load_json_file(self, filepath: Path) -> Optional[Dict]:
+        """Load a document"""
+        return await self.state.get(self._key(filepath))
+    
+    async def delete_file(self, filepath: Path) -> bool:
+        """Delete a document"""
+        return await self.state.delete(self._key(filepath))
+    
+    async def file_exists(self, filepath: Path) -> bool:
+        """Check if a document exists"""
+        return await self.state.get(self._key(filepath)) is not None
+    
+    async def list_json_files(self, directory: Path) -> List[Path]:
+        """List documents under a directory as paths"""
+        prefix = self._key(directory / "x")[:-1]
+        return [
+            self.base_dir / f"{key}.json"
+            for key in await self.state.keys(prefix)
+            if "/" not in key[len(prefix):]
+        ]
+    
+    async def load_json_versioned(self, filepath: Path) -> Tuple[Optional[Dict], int]:
+        """Load a document with the store's version"""
+        return await self.state.get_versioned(self._key(filepath))
+    
+    async def compare_and_set_json(
+        self, filepath: Path, data: Dict, expected_version: int
+    ) -> Optional[int]:
+        """Atomic compare-and-set in the store"""
+        return await self.state.compare_and_set(self._key(filepath), data, expected_version)
+
+
+def create_storage() -> FileStorage:
+    """Use the shared store named by GVOICE_STATE_URL, or local files"""
+    url = os.getenv(STATE_URL_ENV)
+    if url:
+        return SharedStorage(create_state_store(url))
+    return FileStorage()
+
 # Singleton instance
-storage = FileStorage()
\ No newline at end of file
+storage = create_storage()
\ No newline at end of file
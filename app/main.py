@@ -9,6 +9,10 @@ from app.api import auth, sms, websocket, webhooks
 from app.core.storage import storage
 from app.services.realtime import realtime_manager
 from app.services.webhook_service import webhook_service
+from app.services.cookie_jar import cookie_jars
+from app.services.session_keepalive import session_keepalive
+from app.services.event_bus import event_bus
+from app.services.event_log import event_log
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -46,17 +50,28 @@ async def startup_event():
     logger.info("Starting Google Voice REST API...")
     # Clean up expired sessions
     await storage.cleanup_expired_sessions()
+    # Connect the realtime event bus
+    await event_bus.start()
     # Start webhook delivery service
     await webhook_service.start()
+    # Start Google Voice session keep-alive
+    await session_keepalive.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down Google Voice REST API...")
+    # Stop session keep-alive
+    await session_keepalive.stop()
     # Stop all realtime clients
     await realtime_manager.stop_all()
+    await event_bus.stop()
     # Stop webhook service
     await webhook_service.stop()
+    # Persist cookies rotated since the last debounced save
+    await cookie_jars.flush_all()
+    # Persist in-memory realtime events for replay after restart
+    await event_log.flush_all()
 
 @app.get("/")
 async def root():
@@ -72,7 +87,8 @@ async def health_check():
         status_code=200,
         content={
             "status": "ok",
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": datetime.utcnow().isoformat(),
+            "gv_sessions": session_keepalive.get_status()
         }
     )
 
@@ -0,0 +1,11 @@
+"""Realtime event types"""
+
+from enum import Enum
+
+class RealtimeEventType(str, Enum):
+    """Kinds of events delivered to realtime subscribers"""
+    MESSAGE = "message"  # New SMS
+    STATUS = "status"  # Delivery/read status change of a message
+    THREAD_UPDATE = "thread_update"
+    CALL = "call"
+    VOICEMAIL = "voicemail"
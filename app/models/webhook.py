@@ -1,6 +1,6 @@
 """Webhook models and storage"""
 
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, PrivateAttr
 from typing import Optional, List, Dict
 from datetime import datetime
 from enum import Enum
@@ -13,6 +13,11 @@ class WebhookEvent(str, Enum):
     MESSAGE_FAILED = "message.failed"
     THREAD_CREATED = "thread.created"
     THREAD_DELETED = "thread.deleted"
+    SESSION_EXPIRED = "session.expired"
+    MESSAGE_STATUS = "message.status"
+    THREAD_UPDATED = "thread.updated"
+    CALL_RECEIVED = "call.received"
+    VOICEMAIL_RECEIVED = "voicemail.received"
     ALL = "*"
 
 class WebhookStatus(str, Enum):
@@ -31,7 +36,11 @@ class Webhook(BaseModel):
     secret: Optional[str] = None  # For HMAC signature validation
     status: WebhookStatus = WebhookStatus.ACTIVE
     max_retries: int = 3
-    retry_delay: int = 60  # seconds
+    retry_delay: int = 60  # seconds, before the first retry
+    retry_backoff: float = 2.0  # delay multiplier per attempt
+    retry_max_delay: int = 3600  # seconds
+    retry_jitter: float = 0.5  # fraction of the delay randomized (0 to below 1)
+    retry_deadline: Optional[int] = 86400  # seconds after the event; no retries later
     created_at: datetime = None
     updated_at: datetime = None
     last_triggered_at: Optional[datetime] = None
@@ -52,16 +61,20 @@ class WebhookDelivery(BaseModel):
     webhook_id: str
     event_type: WebhookEvent
     payload: Dict
+    idempotency_key: Optional[str] = None  # Same for every delivery of one event
     status_code: Optional[int] = None
     response_body: Optional[str] = None
     error: Optional[str] = None
     attempt: int = 1
     delivered_at: Optional[datetime] = None
     created_at: datetime = None
+    # Encoded payload, shared by the deliveries of one event and their retries
+    _body: Optional[bytes] = PrivateAttr(default=None)
     
-    def __init__(self, **data):
+    def __init__(self, body: Optional[bytes] = None, **data):
         if 'id' not in data:
             data['id'] = str(uuid.uuid4())
         if 'created_at' not in data:
             data['created_at'] = datetime.utcnow()
-        super().__init__(**data)
\ No newline at end of file
+        super().__init__(**data)
+        self._body = body
\ No newline at end of file
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, Field, HttpUrl
 from typing import List, Optional, Dict
 from datetime import datetime
 
@@ -11,6 +11,10 @@ class CreateWebhookInput(BaseModel):
     secret: Optional[str] = None
     max_retries: Optional[int] = 3
     retry_delay: Optional[int] = 60
+    retry_backoff: Optional[float] = Field(2.0, ge=1.0)
+    retry_max_delay: Optional[int] = 3600
+    retry_jitter: Optional[float] = Field(0.5, ge=0.0, lt=1.0)
+    retry_deadline: Optional[int] = Field(86400, ge=0)  # 0 or null: no deadline
 
 class UpdateWebhookInput(BaseModel):
     url: Optional[HttpUrl] = None
@@ -20,6 +24,10 @@ class UpdateWebhookInput(BaseModel):
     status: Optional[WebhookStatus] = None
     max_retries: Optional[int] = None
     retry_delay: Optional[int] = None
+    retry_backoff: Optional[float] = Field(None, ge=1.0)
+    retry_max_delay: Optional[int] = None
+    retry_jitter: Optional[float] = Field(None, ge=0.0, lt=1.0)
+    retry_deadline: Optional[int] = Field(None, ge=0)  # 0 removes the deadline
 
 class WebhookResponse(BaseModel):
     id: str
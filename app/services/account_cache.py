@@ -0,0 +1,125 @@
+"""Per-user Google Voice account info cache"""
+
+import asyncio
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.client_registry import client_registry
+
+logger = logging.getLogger(__name__)
+
+# Account info rarely changes; serve it from cache for this long (seconds)
+ACCOUNT_TTL = 600.0
+# Start a background refresh once an entry is this close to expiry (seconds)
+REFRESH_AHEAD = 120.0
+
+
+class AccountCache:
+    """Caches get_account results per user with refresh-ahead
+
+    Entries are served until they expire. Reads that land inside the
+    refresh-ahead window return the cached value immediately and kick off
+    a background refresh, so steady traffic never waits on upstream.
+    """
+
+    def __init__(self, ttl: float = ACCOUNT_TTL, refresh_ahead: float = REFRESH_AHEAD):
+        self.ttl = ttl
+        self.refresh_ahead = min(refresh_ahead, ttl)
+        self._entries: Dict[str, Tuple[float, Dict]] = {}
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        # Bumped by invalidate(), so refreshes started before it aren't stored
+        self._generations: Dict[str, int] = {}
+
+    async def get(self, user_id: str, force_refresh: bool = False) -> Dict:
+        """Get account info, fetching it if missing, expired or forced"""
+        if not force_refresh:
+            entry = self._entries.get(user_id)
+            if entry:
+                expires_at, account = entry
+                now = time.monotonic()
+                if now < expires_at:
+                    if now >= expires_at - self.refresh_ahead:
+                        self._schedule_refresh(user_id)
+                    return account
+
+        return await self.refresh(user_id)
+
+    async def refresh(self, user_id: str) -> Dict:
+        """Fetch account info from upstream and replace the cached entry"""
+        generation = self._generations.get(user_id, 0)
+        # Bypass the registry's response cache; concurrent refreshes still coalesce
+        account = await client_registry.read(user_id, "get_account", cache_ttl=0)
+        if account and self._generations.get(user_id, 0) == generation:
+            self._entries[user_id] = (time.monotonic() + self.ttl, account)
+        return account
+
+    def _schedule_refresh(self, user_id: str):
+        """Refresh an entry in the background unless one is already running"""
+        task = self._refresh_tasks.get(user_id)
+        if task and not task.done():
+            return
+
+        async def background_refresh():
+            try:
+                await self.refresh(user_id)
+            except Exception as e:
+                # Keep serving the current entry until it expires
+                logger.warning(f"Background account refresh failed for user {user_id}: {e}")
+            finally:
+                self._refresh_tasks.pop(user_id, None)
+
+        self._refresh_tasks[user_id] = asyncio.create_task(background_refresh())
+
+    def peek(self, user_id: str) -> Optional[Dict]:
+        """Return the cached account info without touching upstream"""
+        entry = self._entries.get(user_id)
+        if entry and time.monotonic() < entry[0]:
+            return entry[1]
+        return None
+
+    def invalidate(self, user_id: str):
+        """Drop the cached entry for a user; refreshes in flight won't store theirs"""
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        self._entries.pop(user_id, None)
+        task = self._refresh_tasks.pop(user_id, None)
+        if task and not task.done():
+            task.cancel()
+
+    async def get_phone_number(self, user_id: str, wait: bool = True) -> Optional[str]:
+        """Get the user's primary Google Voice number from cached account info
+
+        With wait=False only a cached value is returned; a miss schedules a
+        background fetch so hot paths such as sending never block on it.
+        """
+        if wait:
+            try:
+                account = await self.get(user_id)
+            except Exception as e:
+                logger.warning(f"Account lookup failed for user {user_id}: {e}")
+                return None
+        else:
+            account = self.peek(user_id)
+            if account is None:
+                self._schedule_refresh(user_id)
+                return None
+
+        return self._extract_phone_number(account)
+
+    @staticmethod
+    def _extract_phone_number(account: Any) -> Optional[str]:
+        """Pull the primary number out of a JSON or PBLite account response"""
+        if isinstance(account, dict):
+            return account.get("primaryDid") or account.get("primary_did")
+
+        # PBLite: GetAccountResponse[0] is the Account message, field 1 its primary DID
+        if isinstance(account, list) and account and isinstance(account[0], list):
+            inner = account[0]
+            if inner and isinstance(inner[0], str):
+                return inner[0]
+
+        return None
+
+
+# Global account cache
+account_cache = AccountCache()
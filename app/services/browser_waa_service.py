@@ -5,7 +5,6 @@ Integrates Playwright-based WAA signature generation with the main API
 import asyncio
 import json
 import time
-import hashlib
 import random
 from typing import Dict, Optional, Any
 from datetime import datetime, timedelta
@@ -16,6 +15,7 @@ from app.core.constants import (
     USER_AGENT, API_KEY, WAA_API_KEY, ORIGIN, API_DOMAIN,
     CLIENT_VERSION, JAVASCRIPT_USER_AGENT, CLIENT_DETAILS, ENDPOINTS
 )
+from app.core.sapisid import sapisid_hash
 
 
 class BrowserWAAService:
@@ -223,10 +223,7 @@ class BrowserWAAService:
     
     def _generate_sapisid_hash(self, sapisid: str) -> str:
         """Generate SAPISID hash for authorization"""
-        timestamp = int(time.time())
-        hash_input = f"{timestamp} {sapisid} {ORIGIN}"
-        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
-        return f"SAPISIDHASH {timestamp}_{hash_value}"
+        return sapisid_hash(sapisid)
     
     async def close(self):
         """Clean up browser resources"""
@@ -325,11 +322,7 @@ class EnhancedGVoiceClient:
     
     def _generate_sapisid_hash(self) -> str:
         """Generate SAPISID hash"""
-        timestamp = int(time.time())
-        sapisid = self.cookies.get("SAPISID", "")
-        hash_input = f"{timestamp} {sapisid} {ORIGIN}"
-        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
-        return f"SAPISIDHASH {timestamp}_{hash_value}"
+        return sapisid_hash(self.cookies.get("SAPISID", ""))
     
     async def close(self):
         """Clean up resources"""
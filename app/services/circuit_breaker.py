@@ -0,0 +1,181 @@
+"""Circuit breakers for webhook destinations"""
+
+import logging
+import random
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Consecutive failures that open a closed circuit
+CIRCUIT_FAILURE_THRESHOLD = 5
+# First open period; doubles each time a probe fails (seconds)
+CIRCUIT_OPEN_BASE = 30.0
+# Longest open period between probes (seconds)
+CIRCUIT_OPEN_MAX = 30 * 60.0
+# Deliveries parked per destination while open; the oldest are dropped beyond this
+CIRCUIT_MAX_PARKED = 1000
+
+
+class CircuitState(str, Enum):
+    """State of a destination's circuit"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Failure tracking for one destination (scheme, host and port)
+
+    Closed: requests flow and consecutive failures are counted. Open:
+    nothing is sent and new deliveries are parked until the open period
+    ends. Half-open: a single probe delivery is let through; success
+    closes the circuit and releases the parked deliveries, failure opens
+    it again for twice as long (up to CIRCUIT_OPEN_MAX, with jitter).
+    """
+
+    def __init__(self, destination: str, registry: "CircuitBreakers"):
+        self.destination = destination
+        self.registry = registry
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.parked: Deque[Any] = deque()
+        self.dropped = 0
+
+    def _transition(self, state: CircuitState):
+        if state == self.state:
+            return
+        logger.warning(f"Webhook destination {self.destination}: circuit {self.state.value} -> {state.value}")
+        self.registry.record_transition(self.state, state)
+        self.state = state
+
+    def open_delay(self) -> float:
+        """Length of the current open period"""
+        ceiling = min(CIRCUIT_OPEN_MAX, CIRCUIT_OPEN_BASE * (2 ** min(self.trips, 16)))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def allow(self) -> bool:
+        """Whether a delivery may be sent now; may start a half-open probe"""
+        if self.state == CircuitState.CLOSED:
+            return True
+        if self.state == CircuitState.OPEN and time.monotonic() >= self.open_until:
+            self._transition(CircuitState.HALF_OPEN)
+            return True
+        # Open, or half-open with the probe still in flight
+        return False
+
+    def park(self, delivery: Any) -> Optional[Any]:
+        """Hold a delivery until the circuit closes; returns one dropped to make room"""
+        self.parked.append(delivery)
+        if len(self.parked) > CIRCUIT_MAX_PARKED:
+            self.dropped += 1
+            return self.parked.popleft()
+        return None
+
+    def take_probe(self) -> Optional[Any]:
+        """Oldest parked delivery, to be sent as the probe"""
+        return self.parked.popleft() if self.parked else None
+
+    def release_probe(self):
+        """Give up the half-open slot of a probe that wasn't sent
+
+        The circuit goes back to open with the open period already over,
+        so the next delivery allowed through becomes the probe.
+        """
+        if self.state == CircuitState.HALF_OPEN:
+            self.open_until = time.monotonic()
+            self._transition(CircuitState.OPEN)
+
+    def record_success(self) -> List[Any]:
+        """Close the circuit; returns the parked deliveries to resend"""
+        self.failures = 0
+        self.trips = 0
+        self._transition(CircuitState.CLOSED)
+        released = list(self.parked)
+        self.parked.clear()
+        return released
+
+    def record_reachable(self):
+        """The receiver answered but rejected one delivery (e.g. a 404)
+
+        Ends a failure streak while closed. It says nothing about recovery,
+        so it never closes an open or half-open circuit.
+        """
+        if self.state == CircuitState.CLOSED:
+            self.failures = 0
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if the circuit is (now) open
+
+        Failures of requests sent before the circuit opened don't extend
+        the open period, so the scheduled probe stays valid.
+        """
+        self.failures += 1
+        if self.state == CircuitState.OPEN:
+            return True
+        if self.state == CircuitState.HALF_OPEN:
+            self.trips += 1
+        elif self.state == CircuitState.CLOSED and self.failures < CIRCUIT_FAILURE_THRESHOLD:
+            return False
+        self.open_until = time.monotonic() + self.open_delay()
+        self._transition(CircuitState.OPEN)
+        return True
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state.value,
+            "failures": self.failures,
+            "parked": len(self.parked),
+            "dropped": self.dropped,
+            "retry_in": max(0.0, round(self.open_until - time.monotonic(), 1))
+            if self.state == CircuitState.OPEN else 0.0,
+        }
+
+
+class CircuitBreakers:
+    """Breakers by destination, with counters of state transitions"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.transitions: Dict[str, int] = {}
+
+    @staticmethod
+    def destination(url: str) -> str:
+        """Destination key of a URL: scheme, host and port"""
+        end = url.find("/", url.find("://") + 3)
+        return url if end == -1 else url[:end]
+
+    def peek(self, destination: str) -> Optional[CircuitBreaker]:
+        """Breaker of a destination, if one exists"""
+        return self._breakers.get(destination)
+
+    def get(self, url: str) -> CircuitBreaker:
+        """Breaker for the destination of a URL"""
+        destination = self.destination(url)
+        breaker = self._breakers.get(destination)
+        if breaker is None:
+            breaker = CircuitBreaker(destination, self)
+            self._breakers[destination] = breaker
+        return breaker
+
+    def record_transition(self, old: CircuitState, new: CircuitState):
+        key = f"{old.value}->{new.value}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+
+    def get_status(self) -> Dict[str, Any]:
+        """Breaker counts by state, transition counters and non-closed destinations"""
+        states = {state.value: 0 for state in CircuitState}
+        for breaker in self._breakers.values():
+            states[breaker.state.value] += 1
+        return {
+            "states": states,
+            "transitions": dict(self.transitions),
+            "destinations": {
+                d: b.get_status() for d, b in self._breakers.items()
+                if b.state != CircuitState.CLOSED or b.parked
+            },
+        }
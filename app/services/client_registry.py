@@ -0,0 +1,155 @@
+"""Per-user Google Voice client registry with single-flight reads"""
+
+import asyncio
+import json
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from app.services.cookie_jar import cookie_jars
+from app.services.gvoice_client import GVoiceClient
+
+logger = logging.getLogger(__name__)
+
+# Read-only client methods that may be coalesced, with their default
+# response cache TTL in seconds (0 disables caching, in-flight merging still applies)
+READ_ENDPOINTS = {
+    "get_account": 3.0,
+    "list_threads": 1.0,
+    "get_thread": 0.0,
+}
+
+# Cache size limit: expired entries are swept first, then the oldest evicted
+MAX_CACHE_ENTRIES = 1024
+
+
+class NoGVoiceSession(Exception):
+    """Raised when a user has no stored Google Voice session"""
+
+
+class ClientRegistry:
+    """Creates Google Voice clients and merges identical concurrent reads
+
+    Reads are keyed by (user, endpoint, params). While a read is in flight,
+    identical callers await the same upstream call instead of issuing their
+    own; successful results can additionally be served from a short cache.
+    Results are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, cache_ttls: Optional[Dict[str, float]] = None):
+        self.cache_ttls = dict(READ_ENDPOINTS)
+        if cache_ttls:
+            self.cache_ttls.update(cache_ttls)
+        self._inflight: Dict[Tuple[str, str, str], asyncio.Task] = {}
+        self._cache: Dict[Tuple[str, str, str], Tuple[float, Any]] = {}
+        # Bumped by invalidate(), so reads started before it aren't cached
+        self._generations: Dict[str, int] = {}
+        self.stats = {"upstream": 0, "coalesced": 0, "cache_hits": 0}
+
+    async def get_client(self, user_id: str) -> GVoiceClient:
+        """Create a Google Voice client backed by the user's live cookie jar"""
+        jar = await cookie_jars.get_jar(user_id)
+        if jar is None:
+            raise NoGVoiceSession(user_id)
+        return GVoiceClient(cookie_jar=jar)
+
+    @staticmethod
+    def _make_key(user_id: str, endpoint: str, params: Dict) -> Tuple[str, str, str]:
+        """Build the coalescing key for a read"""
+        return (user_id, endpoint, json.dumps(params, sort_keys=True, default=str))
+
+    async def read(
+        self,
+        user_id: str,
+        endpoint: str,
+        params: Optional[Dict] = None,
+        cache_ttl: Optional[float] = None
+    ) -> Any:
+        """Perform a read-only client call, coalescing identical concurrent calls"""
+        if endpoint not in self.cache_ttls:
+            raise ValueError(f"{endpoint} is not a coalescable read endpoint")
+
+        params = params or {}
+        key = self._make_key(user_id, endpoint, params)
+        ttl = self.cache_ttls[endpoint] if cache_ttl is None else cache_ttl
+
+        if ttl > 0:
+            cached = self._cache.get(key)
+            if cached and cached[0] > time.monotonic():
+                self.stats["cache_hits"] += 1
+                return cached[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["upstream"] += 1
+            generation = self._generations.get(user_id, 0)
+            task = asyncio.create_task(self._fetch(user_id, endpoint, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_fetch_done(key, t, ttl, generation))
+        else:
+            self.stats["coalesced"] += 1
+
+        # Shield so one cancelled caller doesn't cancel the shared upstream call
+        return await asyncio.shield(task)
+
+    async def _fetch(self, user_id: str, endpoint: str, params: Dict) -> Any:
+        """Run a single upstream read with a short-lived client"""
+        client = await self.get_client(user_id)
+        try:
+            return await getattr(client, endpoint)(**params)
+        finally:
+            await client.close()
+
+    def _on_fetch_done(
+        self, key: Tuple[str, str, str], task: asyncio.Task, ttl: float, generation: int
+    ):
+        """Release the in-flight slot and cache successful results"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.debug(f"Coalesced read {key[1]} failed: {error}")
+            return
+
+        if self._generations.get(key[0], 0) != generation:
+            # Invalidated while in flight; the result may predate the change
+            return
+
+        result = task.result()
+        if ttl > 0 and self._is_cacheable(result):
+            now = time.monotonic()
+            self._cache.pop(key, None)
+            if len(self._cache) >= MAX_CACHE_ENTRIES:
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+            # Still full of live entries: evict the oldest (insertion order)
+            while len(self._cache) >= MAX_CACHE_ENTRIES:
+                del self._cache[next(iter(self._cache))]
+            self._cache[key] = (now + ttl, result)
+
+    @staticmethod
+    def _is_cacheable(result: Any) -> bool:
+        """Only cache non-empty results that don't carry an error"""
+        if not result:
+            return False
+        if isinstance(result, dict) and result.get("error"):
+            return False
+        return True
+
+    def invalidate(self, user_id: str, endpoint: Optional[str] = None):
+        """Drop cached reads for a user, optionally limited to one endpoint
+
+        Reads already in flight are detached: their callers still get the
+        result, but it isn't cached and later callers start a new read.
+        """
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        for store in (self._cache, self._inflight):
+            for key in list(store.keys()):
+                if key[0] == user_id and (endpoint is None or key[1] == endpoint):
+                    del store[key]
+
+
+# Global client registry
+client_registry = ClientRegistry()
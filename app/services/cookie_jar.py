@@ -0,0 +1,216 @@
+"""Live Google Voice cookie jars with debounced write-back to storage"""
+
+import asyncio
+import time
+import logging
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from app.core.storage import storage
+
+logger = logging.getLogger(__name__)
+
+# Wait this long after the last cookie change before writing (seconds)
+SAVE_DEBOUNCE = 5.0
+# Never hold unsaved changes longer than this, even if cookies keep changing (seconds)
+MAX_SAVE_DELAY = 30.0
+# Compare-and-set attempts before a save is given up until the next change
+MAX_SAVE_ATTEMPTS = 5
+
+
+class CookieJar:
+    """Cookies of one user's Google Voice session, with change tracking
+
+    The cookies dict is shared by every client working for the user, so
+    cookies rotated by one response (e.g. __Secure-1PSIDTS) are picked up
+    by the next request. version increases on every effective change;
+    store_version is the version of the stored cookies the jar is based on.
+    """
+
+    def __init__(self, user_id: str, cookies: Dict[str, str], store_version: int = 0):
+        self.user_id = user_id
+        self.cookies: Dict[str, str] = dict(cookies)
+        self.store_version = store_version
+        # Cookies changed locally since the last successful save
+        self.changed_names: Set[str] = set()
+        self.version = 0
+        self.saved_version = 0
+        self.dirty_since: Optional[float] = None
+        self.changed_at: Optional[float] = None
+        self._store: Optional["CookieJarStore"] = None
+
+    @property
+    def dirty(self) -> bool:
+        """Whether there are changes not yet written to storage"""
+        return self.version != self.saved_version
+
+    def merge(self, updates: Iterable[Tuple[str, str]]) -> bool:
+        """Merge (name, value) pairs; returns True if any cookie changed"""
+        changed = False
+        for name, value in updates:
+            if self.cookies.get(name) != value:
+                self.cookies[name] = value
+                self.changed_names.add(name)
+                changed = True
+
+        if changed:
+            self._mark_changed()
+        return changed
+
+    def adopt(self, stored: Dict[str, str]):
+        """Take cookies saved by another replica, keeping our own unsaved changes"""
+        adopted = [
+            (name, value) for name, value in stored.items()
+            if name not in self.changed_names and self.cookies.get(name) != value
+        ]
+        if adopted:
+            self.cookies.update(adopted)
+            # New version so clients rebuild their Cookie header
+            self.version += 1
+
+    def _mark_changed(self):
+        """Bump the version and let the store schedule a write-back"""
+        now = time.monotonic()
+        self.version += 1
+        self.changed_at = now
+        if self.dirty_since is None:
+            self.dirty_since = now
+        if self._store:
+            self._store.schedule_save(self)
+
+
+class CookieJarStore:
+    """Keeps one CookieJar per user and writes changes back with debouncing
+
+    Bursts of cookie rotations are coalesced into a single save_gv_session
+    call once the jar has been quiet for SAVE_DEBOUNCE seconds, bounded by
+    MAX_SAVE_DELAY so a constantly busy session still gets persisted.
+    """
+
+    def __init__(self, debounce: float = SAVE_DEBOUNCE, max_delay: float = MAX_SAVE_DELAY):
+        self.debounce = debounce
+        self.max_delay = max(max_delay, debounce)
+        self._jars: Dict[str, CookieJar] = {}
+        self._save_tasks: Dict[str, asyncio.Task] = {}
+        self._load_lock = asyncio.Lock()
+
+    async def get_jar(self, user_id: str) -> Optional[CookieJar]:
+        """Get the live jar for a user, loading it from storage on first use"""
+        jar = self._jars.get(user_id)
+        if jar is not None:
+            return jar
+
+        async with self._load_lock:
+            jar = self._jars.get(user_id)
+            if jar is None:
+                cookies, store_version = await storage.get_gv_session_versioned(user_id)
+                if not cookies:
+                    return None
+                jar = self._attach(CookieJar(user_id, cookies, store_version))
+        return jar
+
+    def _attach(self, jar: CookieJar) -> CookieJar:
+        """Register a jar with this store"""
+        jar._store = self
+        self._jars[jar.user_id] = jar
+        return jar
+
+    def replace(self, user_id: str, cookies: Dict[str, str], store_version: int = 0) -> CookieJar:
+        """Replace a user's jar with freshly stored cookies (e.g. after login)"""
+        self._cancel_save(user_id)
+        old = self._jars.pop(user_id, None)
+        if old:
+            old._store = None
+        return self._attach(CookieJar(user_id, cookies, store_version))
+
+    def discard(self, user_id: str):
+        """Forget a user's jar without saving it (e.g. after GV logout)"""
+        self._cancel_save(user_id)
+        jar = self._jars.pop(user_id, None)
+        if jar:
+            jar._store = None
+
+    def active_user_ids(self):
+        """User IDs with a loaded jar"""
+        return list(self._jars.keys())
+
+    def schedule_save(self, jar: CookieJar):
+        """Start a debounced write-back for a jar unless one is pending"""
+        task = self._save_tasks.get(jar.user_id)
+        if task and not task.done():
+            return
+        self._save_tasks[jar.user_id] = asyncio.create_task(self._debounced_save(jar))
+
+    async def _debounced_save(self, jar: CookieJar):
+        """Wait for the jar to go quiet, then persist it"""
+        try:
+            while jar.dirty:
+                now = time.monotonic()
+                deadline = min(jar.changed_at + self.debounce, jar.dirty_since + self.max_delay)
+                if now < deadline:
+                    await asyncio.sleep(deadline - now)
+                    continue
+                await self._save(jar)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to persist cookies for user {jar.user_id}: {e}")
+        finally:
+            if self._save_tasks.get(jar.user_id) is asyncio.current_task():
+                del self._save_tasks[jar.user_id]
+
+    async def _save(self, jar: CookieJar):
+        """Write the jar's current cookies to storage
+
+        Uses compare-and-set against the stored version so a replica never
+        overwrites cookies another replica rotated in the meantime: on a
+        conflict the stored cookies are adopted, except those this jar
+        changed itself, and the write is retried.
+        """
+        for _ in range(MAX_SAVE_ATTEMPTS):
+            version = jar.version
+            changed = set(jar.changed_names)
+            store_version = await storage.compare_and_set_gv_session(
+                jar.user_id, dict(jar.cookies), jar.store_version
+            )
+            if store_version is not None:
+                jar.store_version = store_version
+                jar.changed_names -= changed
+                break
+
+            stored, jar.store_version = await storage.get_gv_session_versioned(jar.user_id)
+            if stored is None:
+                # Logged out elsewhere; don't bring the session back
+                logger.info(f"Dropping cookie write-back for removed session of user {jar.user_id}")
+                break
+            jar.adopt(stored)
+        else:
+            raise RuntimeError("cookies kept changing in storage")
+        jar.saved_version = version
+        # Changes made while writing keep the jar dirty for another round
+        jar.dirty_since = jar.changed_at if jar.dirty else None
+        logger.debug(f"Persisted rotated cookies for user {jar.user_id}")
+
+    def _cancel_save(self, user_id: str):
+        """Cancel a pending write-back"""
+        task = self._save_tasks.pop(user_id, None)
+        if task and not task.done():
+            task.cancel()
+
+    async def flush(self, user_id: str):
+        """Persist a user's jar immediately if it has unsaved changes"""
+        self._cancel_save(user_id)
+        jar = self._jars.get(user_id)
+        if jar and jar.dirty:
+            await self._save(jar)
+
+    async def flush_all(self):
+        """Persist every jar with unsaved changes (called on shutdown)"""
+        for user_id in list(self._jars.keys()):
+            try:
+                await self.flush(user_id)
+            except Exception as e:
+                logger.error(f"Failed to persist cookies for user {user_id}: {e}")
+
+
+# Global cookie jar store
+cookie_jars = CookieJarStore()
@@ -0,0 +1,169 @@
+"""Event bus connecting realtime channels to subscribers in every worker process"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.state_store import MemoryStateStore, RedisStateStore, StateStore
+
+logger = logging.getLogger(__name__)
+
+# Bus backend, e.g. "redis://localhost:6379/0"; unset means single process
+EVENT_BUS_URL_ENV = "GVOICE_EVENT_BUS_URL"
+# Pub/sub channel and key prefix used by networked buses
+BUS_PREFIX = "gvoice"
+
+EventHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class EventBus(ABC):
+    """Publishes per-user realtime events and elects one channel owner per user
+
+    Every worker receives every published event and hands it to its local
+    subscribers. Ownership is a lease: the worker holding it runs the
+    user's upstream channel and must renew it before it expires.
+    """
+
+    def __init__(self, leases: StateStore):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leases = leases
+        self._handlers: List[EventHandler] = []
+
+    def add_handler(self, handler: EventHandler):
+        """Register a handler called with (user_id, event) for every event"""
+        self._handlers.append(handler)
+
+    async def _deliver(self, user_id: str, event: Dict[str, Any]):
+        """Pass an event to the local handlers"""
+        for handler in self._handlers:
+            try:
+                await handler(user_id, event)
+            except Exception as e:
+                logger.error(f"Error in event bus handler: {e}")
+
+    async def start(self):
+        """Connect to the backend"""
+
+    async def stop(self):
+        """Disconnect from the backend"""
+
+    @abstractmethod
+    async def publish(self, user_id: str, event: Dict[str, Any]):
+        """Send an event to all workers"""
+
+    def _lease_key(self, user_id: str) -> str:
+        return f"realtime-owner:{user_id}"
+
+    def _lease_owner(self, token: str) -> str:
+        # The token tells apart leases taken by successive channels of one worker
+        return f"{self.worker_id}/{token}" if token else self.worker_id
+
+    async def acquire_owner(self, user_id: str, ttl: float, token: str = "") -> bool:
+        """Take (or keep) the channel lease for a user; False if someone else holds it"""
+        return await self.leases.acquire_lease(self._lease_key(user_id), self._lease_owner(token), ttl)
+
+    async def renew_owner(self, user_id: str, ttl: float, token: str = "") -> bool:
+        """Extend a lease held under this token; False if it was lost"""
+        return await self.leases.renew_lease(self._lease_key(user_id), self._lease_owner(token), ttl)
+
+    async def release_owner(self, user_id: str, token: str = ""):
+        """Give up a lease held under this token; a newer holder's lease is kept"""
+        await self.leases.release_lease(self._lease_key(user_id), self._lease_owner(token))
+
+
+class InProcessEventBus(EventBus):
+    """Single-process bus: events are delivered directly and leases are local"""
+
+    def __init__(self):
+        super().__init__(MemoryStateStore())
+
+    async def publish(self, user_id: str, event: Dict[str, Any]):
+        """Send an event to the local handlers"""
+        await self._deliver(user_id, event)
+
+
+class RedisEventBus(EventBus):
+    """Bus backed by Redis (or a Redis-compatible server) pub/sub, with leases
+    kept in a RedisStateStore on the same server
+
+    Needs the optional redis package (redis.asyncio); it is imported only
+    when this backend is configured.
+    """
+
+    def __init__(self, url: str, prefix: str = BUS_PREFIX):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError(
+                f"{EVENT_BUS_URL_ENV}={url} requires the redis package (pip install redis)"
+            )
+        super().__init__(RedisStateStore(url, prefix))
+        self.channel = f"{prefix}:realtime"
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url, decode_responses=True)
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Subscribe to the event channel and start the listener"""
+        if self._task:
+            return
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._task = asyncio.create_task(self._listen())
+        logger.info(f"Event bus connected as worker {self.worker_id}")
+
+    async def stop(self):
+        """Stop the listener and close the connection"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pubsub:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.close()
+        await self._redis.close()
+        await self.leases.close()
+
+    async def _listen(self):
+        """Deliver published events to local handlers"""
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    payload = json.loads(message["data"])
+                    await self._deliver(payload["user_id"], payload["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event bus listener error: {e}")
+                await asyncio.sleep(1)
+
+    async def publish(self, user_id: str, event: Dict[str, Any]):
+        """Publish an event to every worker, including this one"""
+        await self._redis.publish(
+            self.channel, json.dumps({"user_id": user_id, "event": event}, default=str)
+        )
+
+
+def create_event_bus(url: Optional[str] = None) -> EventBus:
+    """Create the bus configured by GVOICE_EVENT_BUS_URL"""
+    url = url if url is not None else os.getenv(EVENT_BUS_URL_ENV)
+    if not url:
+        return InProcessEventBus()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisEventBus(url)
+    raise ValueError(f"Unsupported event bus URL: {url}")
+
+
+# Global event bus
+event_bus = create_event_bus()
@@ -0,0 +1,77 @@
+"""Deduplication of inbound realtime events by Google message ID"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.models.realtime import RealtimeEventType
+from app.services.realtime_events import RealtimeEvent
+
+# How long an event key is remembered (seconds)
+DEDUP_WINDOW = 24 * 60 * 60
+# Keys remembered per user; the oldest are forgotten first
+DEDUP_MAX_KEYS = 10000
+
+
+def event_key(event: RealtimeEvent) -> Optional[str]:
+    """Identity of an event, or None if it can't be recognized when repeated
+
+    A message is identified by its Google message ID; a status change by
+    the message ID and the new status, so each transition is kept once.
+    """
+    message_id = event.data.get("message_id")
+    if not message_id:
+        return None
+    if event.type == RealtimeEventType.STATUS:
+        return f"status:{message_id}:{event.data.get('status')}"
+    return f"{event.type.value}:{message_id}"
+
+
+def idempotency_key(user_id: str, key: str) -> str:
+    """Stable idempotency key sent to receivers for an event"""
+    return hashlib.sha256(f"{user_id}:{key}".encode()).hexdigest()[:32]
+
+
+class EventDeduplicator:
+    """Per-user bounded, time-windowed set of event keys already delivered
+
+    Sits in front of the event log, so a message seen again after a
+    channel rebuild or through the polling fallback reaches neither
+    WebSocket/SSE subscribers nor webhooks a second time.
+    """
+
+    def __init__(self, window: float = DEDUP_WINDOW, max_keys: int = DEDUP_MAX_KEYS):
+        self.window = window
+        self.max_keys = max_keys
+        self._seen: Dict[str, "OrderedDict[str, float]"] = {}
+        self.duplicates = 0
+
+    def check(self, user_id: str, key: str) -> bool:
+        """Record a key; returns True if it was new, False for a duplicate"""
+        now = time.monotonic()
+        seen = self._seen.setdefault(user_id, OrderedDict())
+
+        # Keys are in insertion order, so expired ones are at the front
+        while seen:
+            _, expires = next(iter(seen.items()))
+            if expires > now:
+                break
+            seen.popitem(last=False)
+
+        if key in seen:
+            self.duplicates += 1
+            return False
+
+        seen[key] = now + self.window
+        if len(seen) > self.max_keys:
+            seen.popitem(last=False)
+        return True
+
+    def forget(self, user_id: str):
+        """Drop a user's keys (e.g. after GV logout)"""
+        self._seen.pop(user_id, None)
+
+
+# Global event deduplicator
+event_dedup = EventDeduplicator()
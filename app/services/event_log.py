@@ -0,0 +1,297 @@
+"""Bounded per-user log of inbound realtime events for WebSocket replay"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+import aiofiles
+
+from app.core.state_store import StateStore
+from app.core.storage import storage
+from app.services.event_bus import InProcessEventBus, event_bus
+
+logger = logging.getLogger(__name__)
+
+# Events kept in memory per user before the oldest are spilled to disk
+EVENT_LOG_MEMORY = 256
+# Events retained per user in total (memory + disk)
+EVENT_LOG_MAX_EVENTS = 5000
+# Events per document of the log kept in a shared state store
+SHARED_LOG_BLOCK_SIZE = 100
+
+
+class UserEventLog:
+    """Events of one user: recent ones in memory, older ones in a JSON-lines file"""
+
+    def __init__(self, user_id: str, path: Path):
+        self.user_id = user_id
+        self.path = path
+        self.memory: Deque[Dict[str, Any]] = deque()
+        self.next_seq = 1
+        self.disk_count = 0
+        self.disk_first_seq: Optional[int] = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def first_seq(self) -> Optional[int]:
+        """Oldest sequence number still retained"""
+        if self.disk_first_seq is not None:
+            return self.disk_first_seq
+        return self.memory[0]["seq"] if self.memory else None
+
+
+class EventLog:
+    """Assigns monotonic sequence numbers to a user's events and replays them
+
+    Sequence numbers are per user and survive restarts: the spill file is
+    the durable part of the log and memory is flushed to it on shutdown.
+    Clients pass the last seq they saw to get everything after it. The
+    log belongs to this process; replicas sharing a state store use
+    SharedEventLog instead.
+    """
+
+    def __init__(self, memory_size: int = EVENT_LOG_MEMORY, max_events: int = EVENT_LOG_MAX_EVENTS):
+        self.memory_size = memory_size
+        self.max_events = max(max_events, memory_size)
+        self.events_dir = storage.base_dir / "events"
+        self._logs: Dict[str, UserEventLog] = {}
+        self._load_lock = asyncio.Lock()
+
+    def _path(self, user_id: str) -> Path:
+        """Spill file for a user"""
+        return self.events_dir / f"{user_id}.jsonl"
+
+    async def _get_log(self, user_id: str) -> UserEventLog:
+        """Get a user's log, restoring its position from the spill file"""
+        log = self._logs.get(user_id)
+        if log is not None:
+            return log
+
+        async with self._load_lock:
+            log = self._logs.get(user_id)
+            if log is None:
+                log = UserEventLog(user_id, self._path(user_id))
+                events = await self._read_disk(log)
+                if events:
+                    log.disk_count = len(events)
+                    log.disk_first_seq = events[0]["seq"]
+                    log.next_seq = events[-1]["seq"] + 1
+                self._logs[user_id] = log
+        return log
+
+    async def _read_disk(self, log: UserEventLog) -> List[Dict[str, Any]]:
+        """Read all spilled events of a user"""
+        if not log.path.exists():
+            return []
+        events = []
+        try:
+            async with aiofiles.open(log.path, "r") as f:
+                async for line in f:
+                    if line.strip():
+                        events.append(json.loads(line))
+        except Exception as e:
+            logger.error(f"Failed to read event log for user {log.user_id}: {e}")
+        return events
+
+    async def append(
+        self, user_id: str, event_type: str, data: Any, thread_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Record an event and return it with its sequence number"""
+        log = await self._get_log(user_id)
+        async with log.lock:
+            record = {
+                "seq": log.next_seq,
+                "type": event_type,
+                "thread_id": thread_id,
+                "data": data,
+                "timestamp": datetime.utcnow().isoformat()
+            }
+            log.next_seq += 1
+            log.memory.append(record)
+
+            if len(log.memory) > self.memory_size:
+                # Spill the older half in one write
+                count = len(log.memory) - self.memory_size // 2
+                await self._spill(log, [log.memory.popleft() for _ in range(count)])
+        return record
+
+    async def _spill(self, log: UserEventLog, records: List[Dict[str, Any]]):
+        """Append records to the spill file, trimming it to the retention limit"""
+        if not records:
+            return
+        self.events_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            lines = "".join(json.dumps(r, default=str) + "\n" for r in records)
+            async with aiofiles.open(log.path, "a") as f:
+                await f.write(lines)
+        except Exception as e:
+            logger.error(f"Failed to spill events for user {log.user_id}: {e}")
+            return
+
+        if log.disk_first_seq is None:
+            log.disk_first_seq = records[0]["seq"]
+        log.disk_count += len(records)
+
+        # Compact once the file holds twice what we keep, so rewrites stay rare
+        keep = self.max_events - len(log.memory)
+        if log.disk_count > 2 * keep:
+            events = (await self._read_disk(log))[-keep:] if keep > 0 else []
+            async with aiofiles.open(log.path, "w") as f:
+                await f.write("".join(json.dumps(r, default=str) + "\n" for r in events))
+            log.disk_count = len(events)
+            log.disk_first_seq = events[0]["seq"] if events else None
+
+    async def since(self, user_id: str, seq: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """Events after seq, and whether some were no longer retained (a gap)"""
+        log = await self._get_log(user_id)
+        async with log.lock:
+            last_seq = log.next_seq - 1
+            if seq >= last_seq:
+                # Nothing new; a seq from the future means the log was reset
+                return [], seq > last_seq
+
+            first_seq = log.first_seq
+            gap = first_seq is None or seq + 1 < first_seq
+
+            events: List[Dict[str, Any]] = []
+            if log.disk_count and (not log.memory or log.memory[0]["seq"] > seq + 1):
+                events = [e for e in await self._read_disk(log) if e["seq"] > seq]
+            events.extend(e for e in log.memory if e["seq"] > seq)
+        return events, gap
+
+    async def last_seq(self, user_id: str) -> int:
+        """Sequence number of the user's latest event (0 if none)"""
+        log = await self._get_log(user_id)
+        return log.next_seq - 1
+
+    async def flush_all(self):
+        """Spill every in-memory event to disk (called on shutdown)"""
+        for log in list(self._logs.values()):
+            async with log.lock:
+                records = list(log.memory)
+                log.memory.clear()
+                await self._spill(log, records)
+
+
+class SharedEventLog:
+    """Event log in the shared state store, with one sequence per user across replicas
+
+    A head document per user holds the next sequence number and the
+    oldest one retained; events are stored in blocks of
+    SHARED_LOG_BLOCK_SIZE, each updated with compare-and-set. A client
+    that reconnects to another replica replays from the same log with the
+    same seq. When a block is started the one falling out of
+    EVENT_LOG_MAX_EVENTS is deleted.
+    """
+
+    def __init__(
+        self,
+        state: StateStore,
+        max_events: int = EVENT_LOG_MAX_EVENTS,
+        block_size: int = SHARED_LOG_BLOCK_SIZE
+    ):
+        self.state = state
+        self.block_size = block_size
+        # Whole blocks kept, so at least max_events are retained
+        self.max_blocks = max(1, -(-max_events // block_size))
+
+    def _head_key(self, user_id: str) -> str:
+        return f"events/{user_id}/head"
+
+    def _block_key(self, user_id: str, block: int) -> str:
+        return f"events/{user_id}/{block}"
+
+    def _block(self, seq: int) -> int:
+        return (seq - 1) // self.block_size
+
+    async def _update(self, key: str, change: Callable[[Optional[Dict]], Dict]) -> Dict:
+        """Apply change to a document with compare-and-set, retrying on conflict"""
+        while True:
+            data, version = await self.state.get_versioned(key)
+            updated = change(data)
+            if await self.state.compare_and_set(key, updated, version) is not None:
+                return updated
+
+    def _take_seq(self, head: Optional[Dict]) -> Dict:
+        """Head after assigning the next sequence number"""
+        head = dict(head or {"next_seq": 1, "first_seq": 1})
+        seq = head["next_seq"]
+        head["next_seq"] = seq + 1
+        block = self._block(seq)
+        if block >= self.max_blocks and (seq - 1) % self.block_size == 0:
+            head["first_seq"] = (block - self.max_blocks + 1) * self.block_size + 1
+        return head
+
+    async def append(
+        self, user_id: str, event_type: str, data: Any, thread_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Record an event and return it with its sequence number"""
+        head = await self._update(self._head_key(user_id), self._take_seq)
+        seq = head["next_seq"] - 1
+        record = {
+            "seq": seq,
+            "type": event_type,
+            "thread_id": thread_id,
+            "data": data,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        block = self._block(seq)
+        await self._update(
+            self._block_key(user_id, block),
+            lambda doc: {"events": (doc or {}).get("events", []) + [record]}
+        )
+
+        # Starting a block retires the oldest one still stored
+        expired = block - self.max_blocks
+        if expired >= 0 and (seq - 1) % self.block_size == 0:
+            try:
+                await self.state.delete(self._block_key(user_id, expired))
+            except Exception as e:
+                logger.error(f"Failed to trim shared event log for user {user_id}: {e}")
+        return record
+
+    async def since(self, user_id: str, seq: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """Events after seq, and whether some were no longer retained (a gap)"""
+        head = await self.state.get(self._head_key(user_id))
+        last_seq = head["next_seq"] - 1 if head else 0
+        if seq >= last_seq:
+            # Nothing new; a seq from the future means the log was reset
+            return [], seq > last_seq
+
+        first_seq = head["first_seq"]
+        start = max(seq + 1, first_seq)
+        events: List[Dict[str, Any]] = []
+        for block in range(self._block(start), self._block(last_seq) + 1):
+            doc = await self.state.get(self._block_key(user_id, block))
+            if doc:
+                events.extend(e for e in doc["events"] if e["seq"] > seq)
+        # Replicas appending at once may store a block's events out of order
+        events.sort(key=lambda e: e["seq"])
+        return events, seq + 1 < first_seq
+
+    async def last_seq(self, user_id: str) -> int:
+        """Sequence number of the user's latest event (0 if none)"""
+        head = await self.state.get(self._head_key(user_id))
+        return head["next_seq"] - 1 if head else 0
+
+    async def flush_all(self):
+        """Nothing to flush; every event is written to the store when appended"""
+
+
+def create_event_log() -> Union[EventLog, SharedEventLog]:
+    """Keep the log in a store shared by all workers, or in local files for one process"""
+    state = storage.state
+    if state is None and not isinstance(event_bus, InProcessEventBus):
+        # Workers sharing only the event bus keep the log beside their leases
+        state = event_bus.leases
+    if state is not None:
+        return SharedEventLog(state)
+    return EventLog()
+
+
+# Global event log
+event_log = create_event_log()
@@ -1,97 +1,46 @@
 """Google Voice client implementation based on mautrix-gvoice"""
 
 import httpx
-import hashlib
-import time
 import random
 import json
 import base64
 from typing import Dict, Optional, List, Any
 from datetime import datetime
-from urllib.parse import urlencode, quote
+from urllib.parse import quote
 
 from app.core.constants import (
-    USER_AGENT, CH_USER_AGENT, CH_PLATFORM, CLIENT_VERSION,
-    JAVASCRIPT_USER_AGENT, WAA_X_USER_AGENT, API_KEY, WAA_API_KEY,
-    ORIGIN, API_DOMAIN, CONTACTS_DOMAIN, WAA_DOMAIN, UPLOAD_DOMAIN,
-    ENDPOINTS, CLIENT_DETAILS, CONTENT_TYPE_PBLITE, CONTENT_TYPE_PROTOBUF
+    API_KEY, API_DOMAIN, CONTACTS_DOMAIN, WAA_DOMAIN,
+    ENDPOINTS, CONTENT_TYPE_PBLITE, CONTENT_TYPE_PROTOBUF
 )
+from app.core.headers import HeaderBuilder
+from app.services.cookie_jar import CookieJar
 
 
 class GVoiceClient:
     """Google Voice client for making API calls"""
     
-    def __init__(self, cookies: Optional[Dict[str, str]] = None):
-        self.cookies = cookies or {}
+    def __init__(
+        self,
+        cookies: Optional[Dict[str, str]] = None,
+        cookie_jar: Optional[CookieJar] = None
+    ):
+        # With a cookie jar, cookies rotated by responses are shared with the
+        # user's other clients and written back to storage
+        self.cookie_jar = cookie_jar
+        self.cookies = cookie_jar.cookies if cookie_jar else (cookies or {})
         self.auth_user = "0"
         self.client = httpx.AsyncClient(timeout=120.0)
-    
-    def _generate_sapisid_hash(self, sapisid: str) -> str:
-        """Generate SAPISID hash for authorization"""
-        timestamp = int(time.time())
-        hash_input = f"{timestamp} {sapisid} {ORIGIN}"
-        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
-        return f"SAPISIDHASH {timestamp}_{hash_value}"
+        self._headers = HeaderBuilder(self.cookies, self.auth_user)
+        self._cookie_version = cookie_jar.version if cookie_jar else 0
     
     def _prepare_headers(self, url: str, content_type: Optional[str] = None) -> Dict[str, str]:
         """Prepare headers for request based on mautrix-gvoice logic"""
-        headers = {
-            "Sec-Ch-Ua": CH_USER_AGENT,
-            "Sec-Ch-Ua-Platform": CH_PLATFORM,
-            "Sec-Ch-Ua-Mobile": "?0",
-            "User-Agent": USER_AGENT,
-            "X-Goog-AuthUser": self.auth_user,
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Accept": "*/*",
-            "Accept-Language": "en-US,en;q=0.5",
-        }
-        
-        # Set origin and referer
-        if UPLOAD_DOMAIN in url:
-            headers["Origin"] = f"https://{UPLOAD_DOMAIN}"
-            headers["Referer"] = f"https://{UPLOAD_DOMAIN}/"
-        else:
-            headers["Origin"] = ORIGIN
-            headers["Referer"] = f"{ORIGIN}/"
-        
-        # API domain specific headers
-        if API_DOMAIN in url:
-            headers["X-Client-Version"] = CLIENT_VERSION
-            headers["X-ClientDetails"] = urlencode(CLIENT_DETAILS)
-            headers["X-JavaScript-User-Agent"] = JAVASCRIPT_USER_AGENT
-            headers["X-Requested-With"] = "XMLHttpRequest"
-            headers["X-Goog-Encode-Response-If-Executable"] = "base64"
-        
-        # Contacts domain specific headers
-        if CONTACTS_DOMAIN in url:
-            headers["X-Goog-Api-Key"] = API_KEY
-            headers["X-Goog-Encode-Response-If-Executable"] = "base64"
-        
-        # WAA domain specific headers
-        if WAA_DOMAIN in url:
-            headers["X-Goog-Api-Key"] = WAA_API_KEY
-            headers["X-User-Agent"] = WAA_X_USER_AGENT
-        
-        # Set sec-fetch-site
-        if API_DOMAIN in url and url.startswith("https://"):
-            headers["Sec-Fetch-Site"] = "same-site"
-        else:
-            headers["Sec-Fetch-Site"] = "same-origin"
-        
-        # Set content type if provided
-        if content_type:
-            headers["Content-Type"] = content_type
-        
-        # Add authorization if we have SAPISID cookie
-        if "SAPISID" in self.cookies:
-            headers["Authorization"] = self._generate_sapisid_hash(self.cookies["SAPISID"])
-        
-        # Convert cookies dict to Cookie header
-        if self.cookies:
-            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
-        
-        return headers
+        if self.cookie_jar and self.cookie_jar.version != self._cookie_version:
+            # Another client sharing the jar rotated cookies
+            self._cookie_version = self.cookie_jar.version
+            self._headers.cookies_changed()
+        self._headers.auth_user = self.auth_user
+        return self._headers.build(url, content_type)
     
     def _generate_transaction_id(self) -> int:
         """Generate random transaction ID"""
@@ -132,8 +81,21 @@ class GVoiceClient:
         )
         
         # Update cookies from response
-        for cookie in response.cookies:
-            self.cookies[cookie.name] = cookie.value
+        updates = [(cookie.name, cookie.value) for cookie in response.cookies.jar]
+        if updates:
+            if self.cookie_jar:
+                self.cookie_jar.merge(updates)
+                # Also covers rotations by other clients since our last request
+                changed = self.cookie_jar.version != self._cookie_version
+                self._cookie_version = self.cookie_jar.version
+            else:
+                changed = False
+                for name, value in updates:
+                    if self.cookies.get(name) != value:
+                        self.cookies[name] = value
+                        changed = True
+            if changed:
+                self._headers.cookies_changed()
         
         return response
     
@@ -147,6 +109,15 @@ class GVoiceClient:
         )
         return response.json() if response.status_code == 200 else {}
     
+    async def check_session(self) -> int:
+        """Probe the session with a lightweight account call, returning the HTTP status"""
+        response = await self._make_request(
+            "POST",
+            ENDPOINTS["get_account"],
+            json_data={"unknown_int2": 1}
+        )
+        return response.status_code
+    
     async def send_sms(self, phone_number: str, message: str) -> Dict:
         """Send SMS message"""
         request_data = {
@@ -205,9 +176,34 @@ class GVoiceClient:
         )
         
         if response.status_code == 200:
-            # Parse response - in real implementation would parse protobuf
-            return {"threads": [], "version_token": ""}
-        return {"threads": [], "error": f"Failed: {response.status_code}"}
+            return self._parse_threads(response)
+        return {
+            "threads": [],
+            "error": f"Failed: {response.status_code}",
+            "status_code": response.status_code
+        }
+    
+    @staticmethod
+    def _parse_threads(response: httpx.Response) -> Dict:
+        """Threads and version token of a list_threads response
+        
+        Only responses with named JSON fields are understood. Binary protobuf
+        and positional PBLite arrays are not decoded yet; they are flagged
+        with "unparsed" and yield no threads.
+        """
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return {"threads": [], "version_token": "", "unparsed": True}
+        
+        threads = data.get("threads") or data.get("thread") or []
+        return {
+            "threads": [t for t in threads if isinstance(t, dict)],
+            "version_token": data.get("versionToken") or data.get("version_token") or "",
+            "pagination_token": data.get("paginationToken") or ""
+        }
     
     async def get_thread(self, thread_id: str, message_count: int = 20) -> Dict:
         """Get messages in a thread"""
@@ -0,0 +1,183 @@
+"""Polling fallback for inbound events while the realtime channel is down"""
+
+import asyncio
+import logging
+import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.services.client_registry import NoGVoiceSession, client_registry
+from app.services.event_dedup import event_dedup, event_key
+from app.services.realtime_events import RealtimeEvent, normalize
+from app.services.session_keepalive import session_keepalive
+
+logger = logging.getLogger(__name__)
+
+# Poll interval right after activity (seconds)
+POLL_MIN_INTERVAL = 5.0
+# Poll interval once an account has been idle for a while (seconds)
+POLL_MAX_INTERVAL = 120.0
+# Interval growth per poll that finds nothing new
+POLL_BACKOFF_FACTOR = 2.0
+# Random spread applied to every interval (+/- fraction)
+POLL_JITTER = 0.2
+
+EventSink = Callable[[str, List[RealtimeEvent]], Awaitable[None]]
+
+
+class SessionExpired(Exception):
+    """Raised when Google rejects the session (401/403)"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Session rejected with {status_code}")
+        self.status_code = status_code
+
+
+class InboundPoller:
+    """Polls a user's thread list and feeds new events into the realtime pipeline
+
+    Each poll passes the version token of the previous one, so Google
+    only returns what changed. The interval drops to POLL_MIN_INTERVAL
+    when something new arrives and doubles towards POLL_MAX_INTERVAL while
+    idle; every wait is jittered so many accounts don't poll in lockstep.
+    Events go through the same sink as realtime frames, where messages
+    realtime already delivered are dropped by the deduplicator.
+
+    The first poll only records what exists, so resuming doesn't replay
+    an account's history. The token and that baseline are kept across
+    stop() and start(), so messages received while paused are reported.
+
+    A 401/403 stops polling and is reported as session.expired through
+    the keep-alive scheduler, like an expired keep-alive probe.
+    """
+
+    def __init__(
+        self,
+        user_id: str,
+        sink: EventSink,
+        min_interval: float = POLL_MIN_INTERVAL,
+        max_interval: float = POLL_MAX_INTERVAL
+    ):
+        self.user_id = user_id
+        self.sink = sink
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.version_token: Optional[str] = None
+        self.thread_versions: Dict[str, Any] = {}
+        self.baseline = False
+        self.polls = 0
+        self.unparsed_warned = False
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        """Start polling (no-op if already running)"""
+        if self.is_running:
+            return
+        self.interval = self.min_interval
+        self.task = asyncio.create_task(self._run())
+        logger.info(f"Started inbound polling fallback for user {self.user_id}")
+
+    async def stop(self):
+        """Stop polling"""
+        task, self.task = self.task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+        logger.info(f"Stopped inbound polling fallback for user {self.user_id}")
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+    async def _run(self):
+        """Poll until stopped, adapting the interval to activity"""
+        # Spread the first poll so accounts falling back together don't align
+        await asyncio.sleep(random.uniform(0, self.min_interval))
+        while True:
+            try:
+                found = await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except NoGVoiceSession:
+                logger.warning(f"No Google Voice session for user {self.user_id}; polling stopped")
+                return
+            except SessionExpired as e:
+                logger.warning(f"Inbound polling stopped for user {self.user_id}: {e}")
+                await session_keepalive.mark_dead(self.user_id, e.status_code)
+                return
+            except Exception as e:
+                logger.warning(f"Inbound poll failed for user {self.user_id}: {e}")
+                found = 0
+
+            if found:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * POLL_BACKOFF_FACTOR, self.max_interval)
+            await asyncio.sleep(self._jittered(self.interval))
+
+    async def poll(self) -> int:
+        """Fetch changed threads once and ingest new events; returns how many"""
+        result = await client_registry.read(
+            self.user_id,
+            "list_threads",
+            {"folder": "all", "version_token": self.version_token}
+        )
+        self.polls += 1
+        if result.get("status_code") in (401, 403):
+            raise SessionExpired(result["status_code"])
+        if result.get("error"):
+            raise RuntimeError(result["error"])
+        if result.get("unparsed") and not self.unparsed_warned:
+            self.unparsed_warned = True
+            logger.warning(
+                f"Thread list for user {self.user_id} is not in a decodable format; "
+                f"polling finds no new events"
+            )
+
+        events = self._extract(result.get("threads", []))
+        if result.get("version_token"):
+            self.version_token = result["version_token"]
+
+        if not self.baseline:
+            # Remember what already exists without reporting it
+            for event in events:
+                key = event_key(event)
+                if key is not None:
+                    event_dedup.check(self.user_id, key)
+            self.baseline = True
+            return 0
+
+        if events:
+            await self.sink(self.user_id, events)
+        return len(events)
+
+    def _extract(self, threads: List[Dict[str, Any]]) -> List[RealtimeEvent]:
+        """Turn changed threads into events
+
+        Messages become typed events with their IDs, so the deduplicator
+        recognizes them. A thread without message details is reported as
+        a thread_update when its version differs from the last poll (or it
+        is new since the baseline).
+        """
+        events: List[RealtimeEvent] = []
+        for thread in threads:
+            thread_id = thread.get("id") or thread.get("threadId")
+            messages = [m for m in thread.get("messages", []) if isinstance(m, dict)]
+            if messages:
+                for message in messages:
+                    events.extend(normalize({"threadId": thread_id, **message}))
+                continue
+
+            version = thread.get("version") or thread.get("timestamp")
+            if thread_id and version is not None and self.thread_versions.get(thread_id) != version:
+                if self.baseline:
+                    events.extend(normalize({"threadId": thread_id}))
+                self.thread_versions[thread_id] = version
+        return events
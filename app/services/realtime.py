@@ -1,76 +1,109 @@
 """Real-time message receiving implementation based on mautrix-gvoice"""
 
 import asyncio
-import json
 import random
-import time
-from typing import Dict, Optional, Callable, Any
+import uuid
+from typing import Dict, List, Optional, Callable, Any
 import httpx
 from urllib.parse import urlencode
 import logging
-from datetime import datetime
+from enum import Enum
 
-from app.core.constants import (
-    REALTIME_ENDPOINTS, CONTENT_TYPE_PBLITE,
-    USER_AGENT, CH_USER_AGENT, CH_PLATFORM, ORIGIN
+from app.core.constants import REALTIME_ENDPOINTS, CONTENT_TYPE_PBLITE
+from app.core.headers import HeaderBuilder
+from app.services.cookie_jar import CookieJar
+from app.services.webchannel import (
+    ChannelClosed, ChannelMessage, FrameDecoder, WebChannelError,
+    control_type, iter_messages, parse_choose_server, parse_chunks, parse_session_id
 )
+from app.services.event_bus import EventBus, event_bus
+from app.services.event_log import event_log
+from app.services.inbound_poller import InboundPoller
+from app.services.event_dedup import event_dedup, event_key, idempotency_key
+from app.services.realtime_events import RealtimeEvent, normalize
 from app.services.webhook_service import webhook_service
-from app.models.webhook import WebhookEvent
 
 logger = logging.getLogger(__name__)
 
+# Keep a user's upstream channel open this long after the last subscriber leaves (seconds)
+CHANNEL_GRACE_PERIOD = 30.0
+# Lifetime of a worker's ownership lease on a user's channel (seconds)
+CHANNEL_LEASE_TTL = 30.0
+# Reconnect backoff: base delay doubled per consecutive failure, capped (seconds)
+RECONNECT_BASE_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+# Consecutive poll failures tolerated on one SID before the channel is rebuilt
+MAX_RESUME_ATTEMPTS = 3
+
+
+class ChannelHealth(str, Enum):
+    """State of a realtime channel"""
+    CONNECTING = "connecting"
+    CONNECTED = "connected"
+    RECONNECTING = "reconnecting"
+    FAILED = "failed"
+    STOPPED = "stopped"
+
+
+class RealtimeAuthError(Exception):
+    """Raised when the signaler rejects the session cookies"""
+
+
 class RealtimeClient:
     """Real-time message receiving client for Google Voice"""
     
-    def __init__(self, cookies: Dict[str, str], auth_user: str = "0"):
-        self.cookies = cookies
+    def __init__(self, cookie_jar: CookieJar, auth_user: str = "0"):
+        # Cookies rotated by other clients (or the keep-alive probe) reach
+        # this long-lived channel through the shared jar, and cookies rotated
+        # by signaler responses are merged back into it
+        self.cookie_jar = cookie_jar
         self.auth_user = auth_user
         self.client = httpx.AsyncClient(timeout=None)
         self.is_running = False
         self.event_handlers: Dict[str, Callable] = {}
+        self._headers = HeaderBuilder(cookie_jar.cookies, auth_user, api_extras=False)
+        self._cookie_version = cookie_jar.version
+        # Highest array ID received on the current channel, sent back as AID
+        self.last_aid = -1
+        self.health = ChannelHealth.STOPPED
+        self.reconnects = 0
+        self._failures = 0
         
     def on_event(self, event_type: str, handler: Callable):
         """Register event handler"""
         self.event_handlers[event_type] = handler
     
+    async def _set_health(self, health: ChannelHealth):
+        """Record a health transition and notify the "state" handler"""
+        if health == self.health:
+            return
+        self.health = health
+        if "state" in self.event_handlers:
+            try:
+                await self.event_handlers["state"](health.value)
+            except Exception as e:
+                logger.error(f"Error in realtime state handler: {e}")
+    
+    def _check_status(self, status_code: int, action: str):
+        """Raise for a failed signaler response"""
+        if status_code in (401, 403):
+            raise RealtimeAuthError(f"Failed to {action}: {status_code}")
+        if status_code != 200:
+            raise Exception(f"Failed to {action}: {status_code}")
+    
     def _prepare_headers(self, url: str, extra_headers: Optional[Dict] = None) -> Dict[str, str]:
         """Prepare headers for realtime requests"""
-        headers = {
-            "Sec-Ch-Ua": CH_USER_AGENT,
-            "Sec-Ch-Ua-Platform": CH_PLATFORM,
-            "Sec-Ch-Ua-Mobile": "?0",
-            "User-Agent": USER_AGENT,
-            "X-Goog-AuthUser": self.auth_user,
-            "Accept": "*/*",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Origin": ORIGIN,
-            "Referer": f"{ORIGIN}/",
-            "Sec-Fetch-Dest": "empty",
-            "Sec-Fetch-Mode": "cors",
-            "Sec-Fetch-Site": "same-site",
-        }
-        
-        # Add cookies
-        if self.cookies:
-            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
-        
-        # Add authorization if we have SAPISID cookie
-        if "SAPISID" in self.cookies:
-            headers["Authorization"] = self._generate_sapisid_hash(self.cookies["SAPISID"])
-        
-        # Add extra headers
-        if extra_headers:
-            headers.update(extra_headers)
-            
-        return headers
+        if self.cookie_jar.version != self._cookie_version:
+            self._cookie_version = self.cookie_jar.version
+            self._headers.cookies_changed()
+        return self._headers.build(url, extra_headers=extra_headers)
     
-    def _generate_sapisid_hash(self, sapisid: str) -> str:
-        """Generate SAPISID hash for authorization"""
-        import hashlib
-        timestamp = int(time.time())
-        hash_input = f"{timestamp} {sapisid} {ORIGIN}"
-        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
-        return f"SAPISIDHASH {timestamp}_{hash_value}"
+    def _merge_cookies(self, response: httpx.Response):
+        """Merge cookies set by a signaler response into the jar"""
+        updates = [(cookie.name, cookie.value) for cookie in response.cookies.jar]
+        if updates:
+            # The version change rebuilds the Cookie header on the next request
+            self.cookie_jar.merge(updates)
     
     async def _choose_server(self) -> str:
         """Choose realtime server and get session ID"""
@@ -88,15 +121,12 @@ class RealtimeClient:
             content=req_data
         )
         
-        if response.status_code != 200:
-            raise Exception(f"Failed to choose server: {response.status_code}")
+        self._merge_cookies(response)
+        self._check_status(response.status_code, "choose server")
         
-        # Parse response to get GSessionID
-        # In a real implementation, you'd parse the protobuf response
-        # For now, generate a mock session ID
-        gsession_id = f"session_{random.randint(10000000, 99999999)}"
+        gsession_id = parse_choose_server(response.text)
         
-        logger.info(f"Chose realtime server with session: {gsession_id}")
+        logger.info("Chose realtime server")
         return gsession_id
     
     async def _create_channel(self, gsession_id: str) -> Dict[str, str]:
@@ -138,123 +168,188 @@ class RealtimeClient:
             data=urlencode(body_data)
         )
         
-        if response.status_code != 200:
-            raise Exception(f"Failed to create channel: {response.status_code}")
+        self._merge_cookies(response)
+        self._check_status(response.status_code, "create channel")
+        
+        # The response opens with [[0,["c","<SID>","",8,...]]] and may already
+        # carry the first messages
+        chunks = parse_chunks(response.text)
+        session_id = parse_session_id(chunks)
+        if not session_id:
+            raise WebChannelError("No SID in channel creation response")
+        
+        # AIDs are per channel; start acknowledging from scratch
+        self.last_aid = -1
+        for chunk in chunks:
+            for message in iter_messages(chunk):
+                await self._handle_channel_message(message)
         
-        # In a real implementation, parse the response to get channel details
-        # For now, generate mock channel info
         channel_info = {
-            "session_id": f"channel_{random.randint(10000000, 99999999)}",
+            "session_id": session_id,
             "gsession_id": gsession_id
         }
         
-        logger.info(f"Created realtime channel: {channel_info}")
+        logger.info("Created realtime channel")
         return channel_info
     
     async def _poll_messages(self, gsession_id: str, session_id: str):
-        """Long poll for real-time messages"""
-        ack_id = 0
-        failed_requests = 0
+        """Long poll for real-time messages
         
+        Each request acknowledges the last received AID, so a poll repeated
+        after a failure resumes exactly where the previous one stopped.
+        Errors propagate to the supervisor in start().
+        """
         while self.is_running:
-            try:
-                query_params = {
-                    "VER": "8",
-                    "gsessionid": gsession_id,
-                    "RID": "rpc",
-                    "SID": session_id,
-                    "AID": str(ack_id),
-                    "CI": "0",
-                    "TYPE": "xmlhttp",
-                    "t": "1",
-                }
-                
-                headers = self._prepare_headers(REALTIME_ENDPOINTS["channel"])
-                url = f"{REALTIME_ENDPOINTS['channel']}?{urlencode(query_params)}"
+            query_params = {
+                "VER": "8",
+                "gsessionid": gsession_id,
+                "RID": "rpc",
+                "SID": session_id,
+                "AID": str(self.last_aid),
+                "CI": "0",
+                "TYPE": "xmlhttp",
+                "t": "1",
+            }
+            
+            headers = self._prepare_headers(REALTIME_ENDPOINTS["channel"])
+            url = f"{REALTIME_ENDPOINTS['channel']}?{urlencode(query_params)}"
+            
+            logger.debug(f"Long polling for messages with AID={self.last_aid}")
+            
+            # Long poll request
+            async with self.client.stream("GET", url, headers=headers) as response:
+                self._merge_cookies(response)
+                if response.status_code == 400:
+                    # The server no longer knows this SID
+                    raise ChannelClosed("Unknown SID")
+                self._check_status(response.status_code, "poll channel")
                 
-                logger.debug(f"Long polling for messages with AID={ack_id}")
+                self._failures = 0
+                await self._set_health(ChannelHealth.CONNECTED)
                 
-                # Long poll request
-                async with self.client.stream("GET", url, headers=headers) as response:
-                    if response.status_code != 200:
-                        failed_requests += 1
-                        if failed_requests > 10:
-                            raise Exception("Too many failed requests")
-                        
-                        logger.warning(f"Poll request failed: {response.status_code}")
-                        await asyncio.sleep(min(failed_requests * 2, 30))
-                        continue
+                # Decode streamed length-prefixed chunks straight from the bytes
+                decoder = FrameDecoder()
+                async for data in response.aiter_bytes():
+                    if not self.is_running:
+                        break
                     
-                    failed_requests = 0
-                    
-                    # Read streaming response
-                    buffer = ""
-                    async for chunk in response.aiter_bytes():
-                        if not self.is_running:
-                            break
-                            
-                        buffer += chunk.decode('utf-8', errors='ignore')
-                        
-                        # Process complete JSON messages
-                        while '\n' in buffer:
-                            line, buffer = buffer.split('\n', 1)
-                            if line.strip():
-                                await self._process_message(line.strip())
-                                ack_id += 1
-            
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"Error in message polling: {e}")
-                failed_requests += 1
-                await asyncio.sleep(min(failed_requests * 2, 30))
+                    for chunk in decoder.feed(data):
+                        for message in iter_messages(chunk):
+                            await self._handle_channel_message(message)
+    
+    async def _handle_channel_message(self, message: ChannelMessage):
+        """Track acknowledgement and dispatch one channel message"""
+        if message.aid <= self.last_aid:
+            # Already seen (redelivered after a re-poll)
+            return
+        self.last_aid = message.aid
+        
+        control = control_type(message.payload)
+        if control == "noop":
+            return
+        if control in ("close", "stop"):
+            raise ChannelClosed(control)
+        if isinstance(message.payload, list) and message.payload and message.payload[0] == "c":
+            return
+        
+        await self._process_message(message.payload)
     
-    async def _process_message(self, message_data: str):
+    async def _process_message(self, data: Any):
         """Process received real-time message"""
         try:
-            # Try to parse as JSON
-            data = json.loads(message_data)
-            
-            # Check if it's a noop message
-            if isinstance(data, list) and len(data) > 1 and data[1] == "noop":
-                return
-            
             # Emit realtime event
             if "message" in self.event_handlers:
                 await self.event_handlers["message"](data)
             
             logger.debug(f"Processed realtime message: {data}")
             
-        except json.JSONDecodeError:
-            logger.warning(f"Failed to parse realtime message: {message_data}")
         except Exception as e:
             logger.error(f"Error processing message: {e}")
     
+    def _backoff_delay(self) -> float:
+        """Exponential backoff with full jitter for the current failure count"""
+        ceiling = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * (2 ** min(self._failures, 16)))
+        return random.uniform(0, ceiling)
+    
     async def start(self):
-        """Start real-time message receiving"""
+        """Start real-time message receiving
+        
+        Runs until stop() is called. Failed polls are retried on the same
+        SID with the last acknowledged AID, so nothing is skipped or
+        delivered twice; when the SID is gone (or keeps failing) the channel
+        is rebuilt. Retries back off exponentially with jitter. Only an
+        authentication failure ends the loop, with health FAILED.
+        """
         if self.is_running:
             return
         
         self.is_running = True
+        self._failures = 0
         logger.info("Starting real-time message client...")
         
+        channel_info: Optional[Dict[str, str]] = None
+        resume_failures = 0
+        
         try:
-            # Step 1: Choose server
-            gsession_id = await self._choose_server()
-            
-            # Step 2: Create channel
-            channel_info = await self._create_channel(gsession_id)
-            
-            # Step 3: Start polling for messages
-            await self._poll_messages(
-                channel_info["gsession_id"], 
-                channel_info["session_id"]
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in realtime client: {e}")
+            while self.is_running:
+                try:
+                    if channel_info is None:
+                        await self._set_health(
+                            ChannelHealth.RECONNECTING if self.reconnects else ChannelHealth.CONNECTING
+                        )
+                        
+                        # Step 1: Choose server
+                        gsession_id = await self._choose_server()
+                        
+                        # Step 2: Create channel
+                        channel_info = await self._create_channel(gsession_id)
+                        resume_failures = 0
+                        self.reconnects += 1
+                        
+                        if "connected" in self.event_handlers:
+                            await self.event_handlers["connected"]()
+                    
+                    # Step 3: Poll for messages until the server closes the channel
+                    await self._poll_messages(
+                        channel_info["gsession_id"],
+                        channel_info["session_id"]
+                    )
+                    resume_failures = 0
+                
+                except ChannelClosed as e:
+                    logger.info(f"Realtime channel closed by server ({e}), reconnecting")
+                    channel_info = None
+                    await self._set_health(ChannelHealth.RECONNECTING)
+                    # A server-side close is routine; only back off if it repeats
+                    if self._failures:
+                        await asyncio.sleep(self._backoff_delay())
+                    self._failures += 1
+                
+                except RealtimeAuthError as e:
+                    logger.error(f"Realtime session rejected: {e}")
+                    await self._set_health(ChannelHealth.FAILED)
+                    self.is_running = False
+                
+                except Exception as e:
+                    self._failures += 1
+                    if channel_info is not None:
+                        resume_failures += 1
+                        if resume_failures > MAX_RESUME_ATTEMPTS:
+                            channel_info = None
+                    delay = self._backoff_delay()
+                    logger.warning(
+                        f"Realtime channel error ({e}); retrying in {delay:.1f}s "
+                        f"({'resume' if channel_info else 'rebuild'})"
+                    )
+                    await self._set_health(ChannelHealth.RECONNECTING)
+                    await asyncio.sleep(delay)
+        
+        except asyncio.CancelledError:
             self.is_running = False
             raise
+        finally:
+            if self.health != ChannelHealth.FAILED:
+                self.health = ChannelHealth.STOPPED
     
     async def stop(self):
         """Stop real-time message receiving"""
@@ -263,75 +358,326 @@ class RealtimeClient:
         logger.info("Stopped real-time message client")
 
 
+class RealtimeChannel:
+    """A user's realtime state in this worker: local subscribers and, if this
+    worker owns the user's lease, the upstream client"""
+    
+    def __init__(self, user_id: str, cookie_jar: CookieJar):
+        self.user_id = user_id
+        self.cookie_jar = cookie_jar
+        # Lease token, so stopping this channel can't release a later channel's lease
+        self.lease_token = uuid.uuid4().hex[:8]
+        self.client: Optional[RealtimeClient] = None
+        self.task: Optional[asyncio.Task] = None
+        self.subscribers: Dict[str, Dict[str, Callable]] = {}
+        self.stop_task: Optional[asyncio.Task] = None
+        self.lease_task: Optional[asyncio.Task] = None
+        self.poller: Optional[InboundPoller] = None
+    
+    @property
+    def is_owner(self) -> bool:
+        """Whether this worker runs the upstream client"""
+        return self.client is not None
+    
+    @property
+    def is_alive(self) -> bool:
+        """Whether the upstream client task is still running"""
+        return self.task is not None and not self.task.done()
+
+
 class RealtimeManager:
-    """Manages real-time clients for multiple users"""
+    """Manages reference-counted realtime channels for multiple users
     
-    def __init__(self):
-        self.clients: Dict[str, RealtimeClient] = {}
-        self.tasks: Dict[str, asyncio.Task] = {}
+    Local consumers (WebSocket connections) subscribe with their own event
+    handlers. Across all workers each user has at most one upstream
+    channel, run by the worker holding the user's lease on the event bus;
+    every worker with subscribers competes for the lease and takes over if
+    the owner goes away. The owner records messages in the event log and
+    publishes them, and each worker fans bus events out to its own
+    subscribers, so "message" handlers receive the logged record with its
+    sequence number. When the last local subscriber leaves, the channel is
+    kept for a grace period so a page reload or a second tab doesn't
+    repeat the handshake.
+    """
     
-    async def start_client(self, user_id: str, cookies: Dict[str, str], event_handlers: Dict[str, Callable]):
-        """Start real-time client for a user"""
-        if user_id in self.clients:
-            await self.stop_client(user_id)
+    def __init__(
+        self,
+        grace_period: float = CHANNEL_GRACE_PERIOD,
+        lease_ttl: float = CHANNEL_LEASE_TTL,
+        bus: EventBus = event_bus
+    ):
+        self.grace_period = grace_period
+        self.lease_ttl = lease_ttl
+        self.bus = bus
+        self.channels: Dict[str, RealtimeChannel] = {}
+        bus.add_handler(self._on_bus_event)
+    
+    async def subscribe(
+        self,
+        user_id: str,
+        cookie_jar: CookieJar,
+        event_handlers: Dict[str, Callable]
+    ) -> str:
+        """Subscribe to a user's realtime events, starting the channel if needed"""
+        channel = self.channels.get(user_id)
+        if channel is None:
+            channel = RealtimeChannel(user_id, cookie_jar)
+            self.channels[user_id] = channel
+        jar_replaced = channel.cookie_jar is not cookie_jar
+        channel.cookie_jar = cookie_jar
+        
+        # A new subscriber keeps the channel from being stopped
+        if channel.stop_task:
+            channel.stop_task.cancel()
+            channel.stop_task = None
+        
+        if channel.lease_task is None or channel.lease_task.done():
+            channel.lease_task = asyncio.create_task(self._hold_lease(channel))
+        elif channel.is_owner and (jar_replaced or not channel.is_alive):
+            # New cookies after a re-login, or the previous client gave up
+            # (e.g. rejected cookies); retry with this jar
+            await self._stop_client(channel)
+            self._start_client(channel)
+        
+        subscription_id = str(uuid.uuid4())
+        channel.subscribers[subscription_id] = event_handlers
+        logger.info(
+            f"Realtime subscriber joined for user {user_id} "
+            f"({len(channel.subscribers)} active)"
+        )
+        return subscription_id
+    
+    async def replace_cookie_jar(self, user_id: str, cookie_jar: CookieJar):
+        """Point a user's channel at a new jar (e.g. after re-login)
+        
+        A client running on the old cookies is restarted with the new ones.
+        """
+        channel = self.channels.get(user_id)
+        if channel is None or channel.cookie_jar is cookie_jar:
+            return
+        channel.cookie_jar = cookie_jar
+        if channel.is_owner:
+            await self._stop_client(channel)
+            self._start_client(channel)
+    
+    async def unsubscribe(self, user_id: str, subscription_id: str):
+        """Remove a subscriber; the channel stops after the grace period if it was the last"""
+        channel = self.channels.get(user_id)
+        if channel is None:
+            return
         
-        client = RealtimeClient(cookies)
+        channel.subscribers.pop(subscription_id, None)
+        if not channel.subscribers and channel.stop_task is None:
+            channel.stop_task = asyncio.create_task(self._stop_after_grace(channel))
+    
+    async def _hold_lease(self, channel: RealtimeChannel):
+        """Compete for the user's lease while there is local interest
         
-        # Add webhook handler wrapper
-        original_message_handler = event_handlers.get("message")
+        The owner renews the lease every third of its TTL and stops its
+        client if the lease was lost; other workers retry at the same pace,
+        so one of them takes over within a TTL after the owner dies.
+        """
+        user_id = channel.user_id
+        while True:
+            try:
+                if channel.is_owner:
+                    if not await self.bus.renew_owner(user_id, self.lease_ttl, channel.lease_token):
+                        logger.warning(f"Lost realtime lease for user {user_id}")
+                        await self._stop_client(channel)
+                elif await self.bus.acquire_owner(user_id, self.lease_ttl, channel.lease_token):
+                    self._start_client(channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Realtime lease error for user {user_id}: {e}")
+            await asyncio.sleep(self.lease_ttl / 3)
+    
+    async def ingest(self, user_id: str, events: List[RealtimeEvent]):
+        """Feed typed events through deduplication, the event log, the bus and webhooks
         
-        async def message_handler_with_webhook(message_data):
-            # Call original handler
-            if original_message_handler:
-                await original_message_handler(message_data)
+        Events already seen within the dedup window (same Google message
+        ID) are dropped here, so neither subscribers nor webhooks see a
+        message twice when a channel is rebuilt or sources overlap.
+        """
+        for event in events:
+            key = event_key(event)
+            if key is not None and not event_dedup.check(user_id, key):
+                logger.debug(f"Dropped duplicate realtime event {key} for user {user_id}")
+                continue
             
-            # Trigger webhook for received message
+            # Log first so the event has a sequence number and can be replayed
+            record = await event_log.append(
+                user_id, event.type.value, event.data, event.thread_id
+            )
+            await self._publish(user_id, {"kind": "message", "record": record})
+            
+            # Trigger webhook once, regardless of subscribers
+            if event.webhook_event is None:
+                continue
             try:
-                # Parse message data to extract relevant info
-                if isinstance(message_data, dict):
-                    await webhook_service.trigger_webhook(
-                        user_id=user_id,
-                        event_type=WebhookEvent.MESSAGE_RECEIVED,
-                        data={
-                            "raw_data": message_data,
-                            "timestamp": datetime.utcnow().isoformat()
-                        }
-                    )
+                await webhook_service.trigger_webhook(
+                    user_id=user_id,
+                    event_type=event.webhook_event,
+                    data={
+                        **event.data,
+                        "seq": record["seq"],
+                        "received_at": record["timestamp"]
+                    },
+                    idempotency_key=idempotency_key(user_id, key or f"seq:{record['seq']}")
+                )
             except Exception as e:
                 logger.error(f"Error triggering webhook: {e}")
+    
+    def _start_client(self, channel: RealtimeChannel):
+        """Create the upstream client for a user and start it"""
+        user_id = channel.user_id
+        client = RealtimeClient(channel.cookie_jar)
+        
+        async def on_message(message_data):
+            # Decode the frame once; every consumer shares the typed events
+            await self.ingest(user_id, normalize(message_data))
+        
+        async def on_connected():
+            await self._publish(user_id, {"kind": "connected"})
+        
+        async def on_state(state):
+            await self._update_fallback(channel, state)
+            await self._publish(user_id, {"kind": "state", "state": state})
         
-        # Register event handlers
-        for event_type, handler in event_handlers.items():
-            if event_type == "message":
-                client.on_event(event_type, message_handler_with_webhook)
-            else:
-                client.on_event(event_type, handler)
+        client.on_event("message", on_message)
+        client.on_event("connected", on_connected)
+        client.on_event("state", on_state)
         
-        self.clients[user_id] = client
-        self.tasks[user_id] = asyncio.create_task(client.start())
+        channel.client = client
+        channel.task = asyncio.create_task(client.start())
+        channel.task.add_done_callback(self._on_channel_done)
         
         logger.info(f"Started realtime client for user: {user_id}")
     
-    async def stop_client(self, user_id: str):
-        """Stop real-time client for a user"""
-        if user_id in self.clients:
-            await self.clients[user_id].stop()
-            del self.clients[user_id]
+    async def _update_fallback(self, channel: RealtimeChannel, state: str):
+        """Poll for inbound events while the upstream channel is down"""
+        if state in (ChannelHealth.RECONNECTING.value, ChannelHealth.FAILED.value):
+            if channel.poller is None:
+                channel.poller = InboundPoller(channel.user_id, self.ingest)
+            channel.poller.start()
+        elif state == ChannelHealth.CONNECTED.value and channel.poller:
+            await channel.poller.stop()
+    
+    def _on_channel_done(self, task: asyncio.Task):
+        """Log channel tasks that ended with an unexpected error"""
+        if not task.cancelled() and task.exception():
+            logger.error(f"Realtime channel task failed: {task.exception()}")
+    
+    async def _publish(self, user_id: str, event: Dict[str, Any]):
+        """Publish an upstream event to the subscribers in every worker"""
+        try:
+            await self.bus.publish(user_id, event)
+        except Exception as e:
+            logger.error(f"Failed to publish realtime event for user {user_id}: {e}")
+    
+    async def _on_bus_event(self, user_id: str, event: Dict[str, Any]):
+        """Fan a bus event out to this worker's subscribers"""
+        channel = self.channels.get(user_id)
+        if channel is None or not channel.subscribers:
+            return
         
-        if user_id in self.tasks:
-            self.tasks[user_id].cancel()
+        kind = event.get("kind")
+        if kind == "message":
+            await self._dispatch(channel, "message", event["record"])
+        elif kind == "connected":
+            await self._dispatch(channel, "connected")
+        elif kind == "state":
+            await self._dispatch(channel, "state", event["state"])
+    
+    async def _dispatch(self, channel: RealtimeChannel, event_type: str, *args):
+        """Fan an upstream event out to every subscriber of a channel"""
+        for handlers in list(channel.subscribers.values()):
+            handler = handlers.get(event_type)
+            if handler is None:
+                continue
             try:
-                await self.tasks[user_id]
-            except asyncio.CancelledError:
+                await handler(*args)
+            except Exception as e:
+                logger.error(f"Error in realtime subscriber handler: {e}")
+    
+    async def _stop_after_grace(self, channel: RealtimeChannel):
+        """Stop a channel that stayed without subscribers for the grace period"""
+        try:
+            await asyncio.sleep(self.grace_period)
+        except asyncio.CancelledError:
+            return
+        
+        channel.stop_task = None
+        if not channel.subscribers and self.channels.get(channel.user_id) is channel:
+            await self.stop_client(channel.user_id)
+    
+    async def _stop_client(self, channel: RealtimeChannel):
+        """Stop a channel's upstream client and task, if this worker runs one"""
+        client, task = channel.client, channel.task
+        channel.client = None
+        channel.task = None
+        if channel.poller:
+            await channel.poller.stop()
+        if client is None:
+            return
+        
+        await client.stop()
+        
+        if task:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
                 pass
-            del self.tasks[user_id]
+    
+    async def stop_client(self, user_id: str):
+        """Stop a user's realtime channel immediately and release its lease"""
+        channel = self.channels.pop(user_id, None)
+        if channel is None:
+            return
+        
+        for task in (channel.stop_task, channel.lease_task):
+            if task and task is not asyncio.current_task():
+                task.cancel()
+        channel.stop_task = None
+        channel.lease_task = None
         
-        logger.info(f"Stopped realtime client for user: {user_id}")
+        was_owner = channel.is_owner
+        await self._stop_client(channel)
+        if was_owner:
+            try:
+                await self.bus.release_owner(user_id, channel.lease_token)
+            except Exception as e:
+                logger.error(f"Failed to release realtime lease for user {user_id}: {e}")
+            logger.info(f"Stopped realtime client for user: {user_id}")
+            
+            # A channel subscribed during the stop waited for this lease; let it
+            # take over now instead of at its next retry
+            newer = self.channels.get(user_id)
+            if newer is not None and not newer.is_owner and newer.lease_task:
+                newer.lease_task.cancel()
+                newer.lease_task = asyncio.create_task(self._hold_lease(newer))
     
     async def stop_all(self):
         """Stop all real-time clients"""
-        for user_id in list(self.clients.keys()):
+        for user_id in list(self.channels.keys()):
             await self.stop_client(user_id)
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Summarize channels owned by this worker, their health and local subscribers"""
+        health = {state.value: 0 for state in ChannelHealth}
+        for channel in self.channels.values():
+            if channel.client:
+                health[channel.client.health.value] += 1
+        return {
+            "worker": self.bus.worker_id,
+            "channels": len(self.channels),
+            "owned_channels": sum(1 for c in self.channels.values() if c.is_owner),
+            "subscribers": sum(len(c.subscribers) for c in self.channels.values()),
+            "health": health,
+            "polling": sum(1 for c in self.channels.values() if c.poller and c.poller.is_running),
+            "duplicates_dropped": event_dedup.duplicates,
+        }
 
 # Global realtime manager
-realtime_manager = RealtimeManager()
\ No newline at end of file
+realtime_manager = RealtimeManager()
@@ -0,0 +1,150 @@
+"""Normalization of decoded realtime frames into typed events"""
+
+import json
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from app.models.realtime import RealtimeEventType
+from app.models.webhook import WebhookEvent
+
+# Google Voice item type codes
+ITEM_TYPES = {
+    0: (RealtimeEventType.CALL, "missed"),
+    1: (RealtimeEventType.CALL, "received"),
+    2: (RealtimeEventType.VOICEMAIL, None),
+    4: (RealtimeEventType.VOICEMAIL, "recorded"),
+    7: (RealtimeEventType.CALL, "placed"),
+    10: (RealtimeEventType.MESSAGE, "inbound"),
+    11: (RealtimeEventType.MESSAGE, "outbound"),
+}
+
+EVENT_TYPE_NAMES = frozenset(t.value for t in RealtimeEventType)
+
+# Thread IDs are "t.<number>" for 1:1 conversations and "g.<...>" for groups
+THREAD_ID_PREFIXES = ("t.", "g.")
+
+# How deep to look for a thread ID in PBLite arrays
+MAX_SCAN_DEPTH = 8
+
+# Webhook event fired for each realtime event type (None: no webhook)
+WEBHOOK_EVENTS = {
+    RealtimeEventType.MESSAGE: WebhookEvent.MESSAGE_RECEIVED,
+    RealtimeEventType.STATUS: WebhookEvent.MESSAGE_STATUS,
+    RealtimeEventType.THREAD_UPDATE: WebhookEvent.THREAD_UPDATED,
+    RealtimeEventType.CALL: WebhookEvent.CALL_RECEIVED,
+    RealtimeEventType.VOICEMAIL: WebhookEvent.VOICEMAIL_RECEIVED,
+}
+
+
+class RealtimeEvent(NamedTuple):
+    """One typed event decoded from a realtime frame"""
+    type: RealtimeEventType
+    thread_id: Optional[str]
+    data: Dict[str, Any]
+
+    @property
+    def webhook_event(self) -> Optional[WebhookEvent]:
+        """Webhook event for this event
+
+        Outbound messages, placed calls and updates that name no thread
+        don't notify webhooks.
+        """
+        if self.data.get("direction") in ("outbound", "placed"):
+            return None
+        if self.type == RealtimeEventType.THREAD_UPDATE and self.thread_id is None:
+            return None
+        return WEBHOOK_EVENTS.get(self.type)
+
+
+def _first(item: Dict[str, Any], *keys: str) -> Any:
+    """Value of the first key present in a dict"""
+    for key in keys:
+        value = item.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def _unwrap(payload: Any) -> Any:
+    """Strip the WebChannel envelope: [{"p": "<json>"}] or {"p": "<json>"}"""
+    if isinstance(payload, list) and len(payload) == 1 and isinstance(payload[0], dict):
+        payload = payload[0]
+    if isinstance(payload, dict) and isinstance(payload.get("p"), str) and len(payload) == 1:
+        try:
+            return json.loads(payload["p"])
+        except ValueError:
+            return payload
+    return payload
+
+
+def _find_thread_id(value: Any, depth: int = 0) -> Optional[str]:
+    """Find the first thread ID string in a nested PBLite structure"""
+    if isinstance(value, str):
+        return value if value.startswith(THREAD_ID_PREFIXES) else None
+    if isinstance(value, list) and depth < MAX_SCAN_DEPTH:
+        for element in value:
+            found = _find_thread_id(element, depth + 1)
+            if found:
+                return found
+    return None
+
+
+def _normalize_item(item: Dict[str, Any]) -> RealtimeEvent:
+    """Build an event from an item with named fields"""
+    thread_id = _first(item, "threadId", "thread_id")
+    text = _first(item, "text", "messageText", "message")
+    status = _first(item, "status", "deliveryStatus")
+    raw_type = _first(item, "type", "itemType")
+
+    direction = None
+    if isinstance(raw_type, int) and raw_type in ITEM_TYPES:
+        event_type, direction = ITEM_TYPES[raw_type]
+    elif isinstance(raw_type, str) and raw_type in EVENT_TYPE_NAMES:
+        event_type = RealtimeEventType(raw_type)
+    elif status is not None and text is None:
+        event_type = RealtimeEventType.STATUS
+    elif text is not None:
+        event_type = RealtimeEventType.MESSAGE
+    else:
+        event_type = RealtimeEventType.THREAD_UPDATE
+
+    data = {
+        "thread_id": thread_id,
+        "message_id": _first(item, "id", "messageId", "message_id"),
+        "sender": _first(item, "sender", "phoneNumber", "from"),
+        "text": text,
+        "direction": _first(item, "direction") or direction,
+        "status": status,
+        "timestamp": _first(item, "timestamp", "startTime"),
+    }
+    if event_type in (RealtimeEventType.CALL, RealtimeEventType.VOICEMAIL):
+        data["duration"] = _first(item, "duration", "durationSeconds")
+    if event_type == RealtimeEventType.VOICEMAIL:
+        data["transcript"] = _first(item, "transcript", "transcription")
+    return RealtimeEvent(event_type, thread_id, data)
+
+
+def normalize(payload: Any) -> List[RealtimeEvent]:
+    """Decode one realtime frame payload into typed events
+
+    Frames with named fields (a dict, or a list of dicts) yield one event
+    per item. PBLite frames, whose field layout is not stable, become a
+    thread_update for the thread they mention, so receivers refresh that
+    one thread; their raw payload is kept under "raw". Frames that
+    reference no thread at all are reported as a thread_update without
+    thread_id.
+    """
+    payload = _unwrap(payload)
+
+    if isinstance(payload, dict):
+        items = [payload]
+    elif isinstance(payload, list) and payload and all(isinstance(i, dict) for i in payload):
+        items = payload
+    else:
+        thread_id = _find_thread_id(payload)
+        return [RealtimeEvent(
+            RealtimeEventType.THREAD_UPDATE,
+            thread_id,
+            {"thread_id": thread_id, "raw": payload}
+        )]
+
+    return [_normalize_item(item) for item in items]
@@ -0,0 +1,125 @@
+"""Single-task scheduler for delayed work such as webhook retries"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from app.models.webhook import Webhook, WebhookDelivery
+
+logger = logging.getLogger(__name__)
+
+# Entries waiting in the scheduler; further ones are refused
+MAX_SCHEDULED = 100000
+# Largest fraction of a retry delay jitter may remove, so a retry never
+# fires immediately (webhooks stored before retry_jitter was limited to < 1)
+MAX_RETRY_JITTER = 0.9
+
+Callback = Callable[[Any], Awaitable[None]]
+
+
+def next_retry_delay(webhook: Webhook, delivery: WebhookDelivery) -> Optional[float]:
+    """Delay before the next attempt under the webhook's retry policy
+
+    The delay is retry_delay * retry_backoff ** (attempt - 1), capped at
+    retry_max_delay, with up to retry_jitter (at most MAX_RETRY_JITTER) of
+    it taken off at random so retries after a shared outage spread out.
+    Returns None when attempts are used up or the retry would land after
+    retry_deadline (unset or 0: no deadline).
+    """
+    if delivery.attempt >= webhook.max_retries:
+        return None
+    delay = min(
+        webhook.retry_delay * webhook.retry_backoff ** (delivery.attempt - 1),
+        webhook.retry_max_delay
+    )
+    delay *= 1 - min(webhook.retry_jitter, MAX_RETRY_JITTER) * random.random()
+    if webhook.retry_deadline:
+        age = (datetime.utcnow() - delivery.created_at).total_seconds()
+        if age + delay > webhook.retry_deadline:
+            return None
+    return delay
+
+
+class DelayScheduler:
+    """Runs callbacks after a delay from one task and a heap
+
+    A scheduled entry is a tuple in the heap rather than a sleeping task,
+    so many thousands of pending retries cost little memory and wake the
+    loop once per due batch instead of once each.
+    """
+
+    def __init__(self, max_pending: int = MAX_SCHEDULED):
+        self.max_pending = max_pending
+        self._heap: List[Tuple[float, int, Callback, Any]] = []
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.refused = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, delay: float, callback: Callback, item: Any) -> bool:
+        """Call callback(item) after delay seconds; False if the scheduler is full"""
+        if len(self._heap) >= self.max_pending:
+            self.refused += 1
+            return False
+        due = time.monotonic() + max(0.0, delay)
+        # The counter keeps equal due times in FIFO order and items uncompared
+        entry = (due, next(self._counter), callback, item)
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            self._wakeup.set()
+        return True
+
+    def start(self):
+        """Start the scheduler task"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the scheduler task; pending entries are dropped"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._heap.clear()
+
+    async def _run(self):
+        """Sleep until the earliest entry is due, then run every due entry"""
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            wait = self._heap[0][0] - time.monotonic()
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, callback, item = heapq.heappop(self._heap)
+                try:
+                    await callback(item)
+                except Exception as e:
+                    logger.error(f"Scheduled callback failed: {e}")
+
+    def get_status(self) -> dict:
+        return {
+            "pending": len(self._heap),
+            "next_due_in": round(max(0.0, self._heap[0][0] - time.monotonic()), 1) if self._heap else None,
+            "refused": self.refused,
+        }
@@ -0,0 +1,214 @@
+"""Background keep-alive and cookie refresh for Google Voice sessions"""
+
+import asyncio
+import heapq
+import random
+import time
+import zlib
+import logging
+from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+from app.core.storage import storage
+from app.models.webhook import WebhookEvent
+from app.services.client_registry import client_registry, NoGVoiceSession
+from app.services.webhook_service import webhook_service
+
+logger = logging.getLogger(__name__)
+
+# How often each session is probed (seconds)
+KEEPALIVE_INTERVAL = 15 * 60
+# Random spread applied to each reschedule, as a fraction of the interval
+KEEPALIVE_JITTER = 0.1
+# Upper bound on concurrent upstream probes
+MAX_CONCURRENT_REFRESHES = 4
+# Retry transient failures sooner than a full interval (seconds)
+RETRY_DELAY = 60
+
+
+class SessionHealth(str, Enum):
+    """Last known state of a Google Voice session"""
+    UNKNOWN = "unknown"
+    ALIVE = "alive"
+    DEAD = "dead"
+
+
+class SessionKeepAlive:
+    """Periodically probes every stored Google Voice session
+
+    Each probe goes through the client registry, so cookies rotated by the
+    response are written back by the cookie jar. Sessions are placed on the
+    schedule at a phase derived from a hash of the user ID, which spreads
+    thousands of accounts evenly over the interval instead of refreshing
+    them together; each reschedule adds a small random jitter on top.
+    Sessions answering 401/403 are marked dead, reported through the
+    session.expired webhook and dropped from the schedule until re-login.
+    """
+
+    def __init__(
+        self,
+        interval: float = KEEPALIVE_INTERVAL,
+        jitter: float = KEEPALIVE_JITTER,
+        max_concurrent: int = MAX_CONCURRENT_REFRESHES
+    ):
+        self.interval = interval
+        self.jitter = jitter
+        self.health: Dict[str, SessionHealth] = {}
+        self.last_checked: Dict[str, datetime] = {}
+        self._schedule: List[Tuple[float, int, str]] = []
+        self._generations: Dict[str, int] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._wakeup = asyncio.Event()
+        self._inflight: set = set()
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Schedule all stored sessions and start the scheduler loop"""
+        if self.task:
+            return
+        for user_id in await storage.list_gv_session_user_ids():
+            self.register(user_id)
+        self.task = asyncio.create_task(self._run())
+        logger.info(f"Started session keep-alive for {len(self._generations)} sessions")
+
+    async def stop(self):
+        """Stop the scheduler loop and any running probes"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for task in list(self._inflight):
+            task.cancel()
+        logger.info("Stopped session keep-alive")
+
+    def _phase(self, user_id: str) -> float:
+        """Stable offset within the interval for a user (evenly distributed)"""
+        return (zlib.crc32(user_id.encode()) / 0xFFFFFFFF) * self.interval
+
+    def _push(self, user_id: str, due: float):
+        """Put a user on the schedule, superseding earlier entries"""
+        generation = self._generations.get(user_id, 0) + 1
+        self._generations[user_id] = generation
+        heapq.heappush(self._schedule, (due, generation, user_id))
+        self._wakeup.set()
+
+    def register(self, user_id: str):
+        """Add a session to the schedule at its hashed phase"""
+        self.health.setdefault(user_id, SessionHealth.UNKNOWN)
+        self._push(user_id, time.monotonic() + self._phase(user_id))
+
+    def reset(self, user_id: str):
+        """Re-register a session after fresh cookies were stored"""
+        self.health[user_id] = SessionHealth.UNKNOWN
+        self.register(user_id)
+
+    def unregister(self, user_id: str):
+        """Remove a session from the schedule"""
+        self._generations.pop(user_id, None)
+        self.health.pop(user_id, None)
+        self.last_checked.pop(user_id, None)
+
+    def _next_due(self, base_delay: float) -> float:
+        """Compute the next due time with jitter"""
+        spread = base_delay * self.jitter
+        return time.monotonic() + base_delay + random.uniform(-spread, spread)
+
+    async def _run(self):
+        """Scheduler loop: wait for the earliest due session and probe it"""
+        while True:
+            try:
+                self._wakeup.clear()
+                now = time.monotonic()
+                while self._schedule and self._schedule[0][0] <= now:
+                    _, generation, user_id = heapq.heappop(self._schedule)
+                    if self._generations.get(user_id) != generation:
+                        continue  # Superseded or unregistered
+                    task = asyncio.create_task(self._refresh(user_id))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+
+                timeout = self._schedule[0][0] - now if self._schedule else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in session keep-alive loop: {e}")
+                await asyncio.sleep(1)
+
+    async def _refresh(self, user_id: str):
+        """Probe one session and reschedule it"""
+        async with self._semaphore:
+            generation = self._generations.get(user_id)
+            if generation is None:
+                return
+            try:
+                client = await client_registry.get_client(user_id)
+            except NoGVoiceSession:
+                self.unregister(user_id)
+                return
+
+            try:
+                status_code = await client.check_session()
+            except Exception as e:
+                logger.warning(f"Keep-alive probe failed for user {user_id}: {e}")
+                if self._generations.get(user_id) == generation:
+                    self._push(user_id, self._next_due(RETRY_DELAY))
+                return
+            finally:
+                await client.close()
+
+        if self._generations.get(user_id) != generation:
+            # Unregistered or re-registered with new cookies during the probe
+            return
+        self.last_checked[user_id] = datetime.utcnow()
+
+        if status_code in (401, 403):
+            await self.mark_dead(user_id, status_code)
+        elif status_code == 200:
+            self.health[user_id] = SessionHealth.ALIVE
+            self._push(user_id, self._next_due(self.interval))
+        else:
+            logger.warning(f"Keep-alive probe for user {user_id} returned {status_code}")
+            self._push(user_id, self._next_due(RETRY_DELAY))
+
+    async def mark_dead(self, user_id: str, status_code: int):
+        """Record an expired session and notify the user's webhooks
+        
+        Also used by other callers that see a 401/403 (e.g. the inbound
+        poller); the webhook is sent once until the session is reset.
+        """
+        if self.health.get(user_id) == SessionHealth.DEAD:
+            return
+        self.health[user_id] = SessionHealth.DEAD
+        self._generations.pop(user_id, None)
+        logger.warning(f"Google Voice session for user {user_id} expired ({status_code})")
+
+        try:
+            await webhook_service.trigger_webhook(
+                user_id=user_id,
+                event_type=WebhookEvent.SESSION_EXPIRED,
+                data={
+                    "status_code": status_code,
+                    "timestamp": datetime.utcnow().isoformat()
+                }
+            )
+        except Exception as e:
+            logger.error(f"Error triggering session expired webhook: {e}")
+
+    def get_status(self) -> Dict[str, int]:
+        """Count sessions by health state"""
+        counts = {state.value: 0 for state in SessionHealth}
+        for state in self.health.values():
+            counts[state.value] += 1
+        return counts
+
+
+# Global session keep-alive scheduler
+session_keepalive = SessionKeepAlive()
@@ -0,0 +1,245 @@
+"""WebChannel (BrowserChannel) protocol helpers for the realtime signaler"""
+
+import json
+import re
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+# Google prefixes some JSON responses with this to defeat JSON hijacking
+XSSI_PREFIX = ")]}'"
+
+
+# Refuse chunks larger than this many characters
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Runs of ASCII bytes, skipped in one step when measuring multi-byte chunks
+_ASCII_RUN = re.compile(rb"[\x00-\x7f]+")
+
+
+class ChannelMessage(NamedTuple):
+    """One message delivered on a channel: its array ID and payload"""
+    aid: int
+    payload: Any
+
+
+class WebChannelError(Exception):
+    """Raised when a signaler response can't be parsed"""
+
+
+class ChannelClosed(Exception):
+    """Raised when the server closes or stops the channel"""
+
+
+def strip_xssi(text: str) -> str:
+    """Remove the XSSI guard prefix if present"""
+    text = text.lstrip()
+    if text.startswith(XSSI_PREFIX):
+        text = text[len(XSSI_PREFIX):].lstrip()
+    return text
+
+
+def parse_choose_server(text: str) -> str:
+    """Extract the gsessionid from a PBLite chooseServer response
+
+    The response is a ChooseServerResponse message whose first field is
+    the gsessionid string, e.g. ["AbCd...", 3].
+    """
+    try:
+        data = json.loads(strip_xssi(text))
+    except json.JSONDecodeError as e:
+        raise WebChannelError(f"Invalid chooseServer response: {e}")
+
+    # Unwrap single-element wrappers until we reach the message fields
+    while isinstance(data, list) and data and isinstance(data[0], list):
+        data = data[0]
+
+    if isinstance(data, list) and data and isinstance(data[0], str) and data[0]:
+        return data[0]
+    raise WebChannelError("No gsessionid in chooseServer response")
+
+
+def parse_chunks(text: str) -> List[Any]:
+    """Parse a complete length-prefixed WebChannel response body
+
+    The body is a sequence of "<length>\\n<json>" chunks, where each JSON
+    value is an array of [aid, payload] messages.
+    """
+    decoder = FrameDecoder()
+    chunks = decoder.feed(text.encode("utf-8"))
+    if decoder.pending:
+        raise WebChannelError("Truncated WebChannel chunk")
+    return chunks
+
+
+def iter_messages(chunk: Any) -> List[ChannelMessage]:
+    """Split a decoded chunk into its [aid, payload] messages"""
+    messages = []
+    if not isinstance(chunk, list):
+        return messages
+    for item in chunk:
+        if isinstance(item, list) and len(item) >= 2 and isinstance(item[0], int):
+            messages.append(ChannelMessage(item[0], item[1]))
+    return messages
+
+
+def parse_session_id(chunks: List[Any]) -> Optional[str]:
+    """Find the SID in a channel creation response's ["c", SID, ...] message"""
+    for chunk in chunks:
+        for message in iter_messages(chunk):
+            payload = message.payload
+            if isinstance(payload, list) and len(payload) > 1 and payload[0] == "c":
+                return payload[1]
+    return None
+
+
+def control_type(payload: Any) -> Optional[str]:
+    """Return "noop", "close" or "stop" for control messages, else None"""
+    if isinstance(payload, list) and len(payload) == 1 and payload[0] in ("noop", "close", "stop"):
+        return payload[0]
+    return None
+
+
+class FrameDecoder:
+    """Incremental decoder for length-prefixed WebChannel chunks
+
+    Works directly on the received bytes: data is appended to one
+    bytearray, a read offset walks over it, and each complete chunk is
+    copied out and decoded exactly once for json.loads. Consumed bytes are released
+    from the front of the buffer after every feed.
+
+    Chunk lengths count UTF-16 code units (JavaScript string length), not
+    bytes. ASCII chunks, the common case, take a single slice; chunks with
+    multi-byte characters are measured from their UTF-8 lead bytes, resuming
+    where the previous feed stopped, and then decoded strictly.
+    """
+
+    # A length line longer than this means we are not reading a chunk header
+    MAX_LENGTH_LINE = 32
+
+    def __init__(self, max_chunk_size: int = MAX_CHUNK_SIZE):
+        self.max_chunk_size = max_chunk_size
+        self._buffer = bytearray()
+        self._pos = 0
+        self._length: Optional[int] = None
+        self._first_line = True
+        # (bytes, UTF-16 units) measured so far of a multi-byte chunk
+        self._scan: Optional[Tuple[int, int]] = None
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered bytes not yet decoded into chunks"""
+        return len(self._buffer) - self._pos
+
+    def feed(self, data: bytes) -> List[Any]:
+        """Add received bytes and return any chunks that are now complete"""
+        buffer = self._buffer
+        buffer += data
+        chunks = []
+        loads = json.loads
+
+        while True:
+            length = self._length
+            if length is None:
+                length = self._read_length()
+                if length is None:
+                    break
+
+            # Fast path: an all-ASCII chunk is exactly `length` bytes
+            start = self._pos
+            end = start + length
+            if end > len(buffer):
+                break
+            if self._scan is None:
+                try:
+                    chunk = buffer[start:end].decode("ascii")
+                except UnicodeDecodeError:
+                    self._scan = (0, 0)
+            if self._scan is not None:
+                chunk, end = self._read_multibyte_chunk(start, length)
+                if chunk is None:
+                    break
+                self._scan = None
+
+            self._pos = end
+            self._length = None
+            try:
+                chunks.append(loads(chunk))
+            except ValueError as e:
+                raise WebChannelError(f"Invalid WebChannel chunk: {e}")
+
+        # Release consumed bytes (bytearray front deletion is cheap)
+        if self._pos:
+            del buffer[:self._pos]
+            self._pos = 0
+
+        return chunks
+
+    def _read_length(self) -> Optional[int]:
+        """Consume a "<length>\\n" header; returns None if it isn't complete yet"""
+        buffer = self._buffer
+        while True:
+            newline = buffer.find(b"\n", self._pos)
+            if newline == -1:
+                if len(buffer) - self._pos > self.MAX_LENGTH_LINE:
+                    raise WebChannelError("Missing WebChannel chunk length")
+                return None
+
+            line = buffer[self._pos:newline]
+            self._pos = newline + 1
+            if self._first_line:
+                self._first_line = False
+                if line.strip().startswith(XSSI_PREFIX.encode()):
+                    continue
+            if not line.strip():
+                continue
+
+            try:
+                length = int(line)
+            except ValueError:
+                raise WebChannelError(f"Invalid chunk length: {bytes(line[:20])!r}")
+            if length < 0 or length > self.max_chunk_size:
+                raise WebChannelError(f"WebChannel chunk length out of range: {length}")
+            self._length = length
+            return length
+
+    def _read_multibyte_chunk(self, start: int, length: int) -> Tuple[Optional[str], int]:
+        """Decode a chunk containing non-ASCII text, or (None, start) if incomplete
+
+        Walks the UTF-8 lead bytes to find where the chunk's last UTF-16
+        unit ends, continuing from the previous call's position, so a chunk
+        arriving in many small reads is measured once overall.
+        """
+        buffer = self._buffer
+        offset, units = self._scan
+        pos = start + offset
+        size = len(buffer)
+        while units < length and pos < size:
+            lead = buffer[pos]
+            if lead < 0x80:
+                run = _ASCII_RUN.match(buffer, pos, min(size, pos + length - units))
+                units += run.end() - pos
+                pos = run.end()
+                continue
+            if 0xC2 <= lead < 0xE0:
+                width, count = 2, 1
+            elif 0xE0 <= lead < 0xF0:
+                width, count = 3, 1
+            elif 0xF0 <= lead < 0xF5:
+                # Outside the BMP: a surrogate pair in UTF-16
+                width, count = 4, 2
+            else:
+                raise WebChannelError("Invalid UTF-8 in WebChannel chunk")
+            if pos + width > size:
+                break
+            units += count
+            pos += width
+        self._scan = (pos - start, units)
+
+        if units < length:
+            return None, start
+        if units > length:
+            raise WebChannelError("WebChannel chunk length splits a character")
+        try:
+            chunk = bytes(buffer[start:pos]).decode("utf-8")
+        except UnicodeDecodeError:
+            raise WebChannelError("Invalid UTF-8 in WebChannel chunk")
+        return chunk, pos
@@ -0,0 +1,199 @@
+"""Per-destination HTTP connection pools for webhook delivery"""
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+import httpx
+
+from app.services.circuit_breaker import CircuitBreakers
+
+logger = logging.getLogger(__name__)
+
+# Defaults below can be overridden with GVOICE_WEBHOOK_<NAME> environment
+# variables, e.g. GVOICE_WEBHOOK_MAX_CONNECTIONS=50 or GVOICE_WEBHOOK_READ_TIMEOUT=5
+WEBHOOK_ENV_PREFIX = "GVOICE_WEBHOOK_"
+
+# Connections per destination (scheme, host and port)
+WEBHOOK_MAX_CONNECTIONS = 20
+# Idle connections kept open per destination
+WEBHOOK_MAX_KEEPALIVE = 10
+# Seconds an idle connection is kept
+WEBHOOK_KEEPALIVE_EXPIRY = 30.0
+# Timeouts (seconds): connect, read a response, write the body, wait for a
+# pooled connection, and the whole request
+WEBHOOK_CONNECT_TIMEOUT = 5.0
+WEBHOOK_READ_TIMEOUT = 15.0
+WEBHOOK_WRITE_TIMEOUT = 10.0
+WEBHOOK_POOL_TIMEOUT = 10.0
+WEBHOOK_TOTAL_TIMEOUT = 30.0
+# Destination pools kept; the least recently used idle one is closed beyond this
+MAX_DESTINATION_POOLS = 256
+
+# "0" disables HTTP/2 even when the h2 package is installed
+WEBHOOK_HTTP2_ENV = "GVOICE_WEBHOOK_HTTP2"
+
+
+def webhook_setting(name: str, default: float) -> float:
+    """Tunable from GVOICE_WEBHOOK_<name>, or the default if unset or invalid"""
+    value = os.getenv(WEBHOOK_ENV_PREFIX + name)
+    if not value:
+        return default
+    try:
+        number = type(default)(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid {WEBHOOK_ENV_PREFIX + name}={value!r}")
+        return default
+    if number <= 0:
+        logger.warning(f"Ignoring non-positive {WEBHOOK_ENV_PREFIX + name}={value!r}")
+        return default
+    return number
+
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package (pip install httpx[http2])"""
+    if os.getenv(WEBHOOK_HTTP2_ENV, "1") == "0":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class DestinationPool:
+    """HTTP client and usage counters for one destination"""
+
+    def __init__(self, destination: str, client: httpx.AsyncClient):
+        self.destination = destination
+        self.client = client
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.pool_timeouts = 0
+        self.http_versions: Dict[str, int] = {}
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "pool_timeouts": self.pool_timeouts,
+            "http_versions": dict(self.http_versions),
+        }
+
+
+class WebhookHTTP:
+    """Sends webhook requests through one connection pool per destination
+
+    Each destination gets its own limits, so a slow receiver can't take
+    every connection. With HTTP/2 (when h2 is installed), concurrent
+    requests to a destination share a few multiplexed connections.
+    """
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive: Optional[int] = None,
+        http2: Optional[bool] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections or webhook_setting("MAX_CONNECTIONS", WEBHOOK_MAX_CONNECTIONS),
+            max_keepalive_connections=max_keepalive or webhook_setting("MAX_KEEPALIVE", WEBHOOK_MAX_KEEPALIVE),
+            keepalive_expiry=webhook_setting("KEEPALIVE_EXPIRY", WEBHOOK_KEEPALIVE_EXPIRY)
+        )
+        self.timeout = httpx.Timeout(
+            connect=webhook_setting("CONNECT_TIMEOUT", WEBHOOK_CONNECT_TIMEOUT),
+            read=webhook_setting("READ_TIMEOUT", WEBHOOK_READ_TIMEOUT),
+            write=webhook_setting("WRITE_TIMEOUT", WEBHOOK_WRITE_TIMEOUT),
+            pool=webhook_setting("POOL_TIMEOUT", WEBHOOK_POOL_TIMEOUT)
+        )
+        self.total_timeout = webhook_setting("TOTAL_TIMEOUT", WEBHOOK_TOTAL_TIMEOUT)
+        self.http2 = http2_available() if http2 is None else http2
+        # A fixed transport (e.g. a mock in benchmarks) replaces real pools
+        self.transport = transport
+        self._pools: "OrderedDict[str, DestinationPool]" = OrderedDict()
+        # Evicted pools being closed, referenced until done
+        self._closing: Set[asyncio.Task] = set()
+
+    def _pool(self, url: str) -> DestinationPool:
+        """Pool for the destination of a URL, creating it if needed"""
+        destination = CircuitBreakers.destination(url)
+        pool = self._pools.get(destination)
+        if pool is not None:
+            self._pools.move_to_end(destination)
+            return pool
+
+        client = httpx.AsyncClient(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+            transport=self.transport
+        )
+        pool = DestinationPool(destination, client)
+        self._pools[destination] = pool
+        if len(self._pools) > MAX_DESTINATION_POOLS:
+            self._evict()
+        return pool
+
+    def _evict(self):
+        """Close the least recently used pool with no requests in flight"""
+        for destination, pool in self._pools.items():
+            if pool.in_flight == 0:
+                del self._pools[destination]
+                task = asyncio.create_task(pool.client.aclose())
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+                return
+
+    async def post(self, url: str, content: bytes, headers: Dict[str, str]) -> httpx.Response:
+        """POST to a webhook URL within the total timeout"""
+        pool = self._pool(url)
+        pool.requests += 1
+        pool.in_flight += 1
+        pool.peak_in_flight = max(pool.peak_in_flight, pool.in_flight)
+        try:
+            response = await asyncio.wait_for(
+                pool.client.post(url, content=content, headers=headers),
+                self.total_timeout
+            )
+        except asyncio.TimeoutError:
+            pool.errors += 1
+            raise httpx.TimeoutException(f"No response within {self.total_timeout}s")
+        except httpx.PoolTimeout:
+            pool.pool_timeouts += 1
+            pool.errors += 1
+            raise
+        except Exception:
+            pool.errors += 1
+            raise
+        finally:
+            pool.in_flight -= 1
+        pool.http_versions[response.http_version] = pool.http_versions.get(response.http_version, 0) + 1
+        return response
+
+    async def close(self):
+        """Close every pool"""
+        pools, self._pools = list(self._pools.values()), OrderedDict()
+        for pool in pools:
+            await pool.client.aclose()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    def get_destination_status(self, destination: str) -> Optional[Dict[str, Any]]:
+        """Counters of one destination's pool, if it has one"""
+        pool = self._pools.get(destination)
+        return pool.get_status() if pool else None
+
+    def get_status(self) -> Dict[str, Any]:
+        """HTTP/2 availability and counters per destination"""
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "destinations": {d: p.get_status() for d, p in self._pools.items()},
+        }
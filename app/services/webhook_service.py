@@ -1,44 +1,101 @@
 """Webhook delivery service"""
 
-import httpx
 import asyncio
-import json
 import hmac
 import hashlib
-from typing import List, Optional, Dict
+import time
+from collections import OrderedDict
+from typing import List, Optional, Dict, Set, Tuple
 from datetime import datetime, timedelta
 import logging
 
 from app.models.webhook import Webhook, WebhookDelivery, WebhookEvent, WebhookStatus
+from app.core.json_codec import dumps_bytes
+from app.core.state_store import StateStore
+from app.services.circuit_breaker import CircuitBreaker, CircuitBreakers, CircuitState
+from app.services.retry_scheduler import DelayScheduler, next_retry_delay
+from app.services.webhook_http import WebhookHTTP, webhook_setting
+from app.services.webhook_stats import STATS_FIELDS, WebhookStats
 from app.core.storage import storage
 
 logger = logging.getLogger(__name__)
 
+# Queue name for pending deliveries in the shared state store
+DELIVERY_QUEUE = "webhook_deliveries"
+# Signatures kept for reuse by retries and webhooks sharing a secret
+SIGNATURE_CACHE_SIZE = 1024
+# Deliveries sent concurrently by this process (GVOICE_WEBHOOK_WORKERS).
+# Workers take deliveries from one shared queue, so deliveries of the same
+# webhook can arrive out of order; receivers should order events by their
+# timestamps and use the idempotency key, not rely on arrival order.
+# GVOICE_WEBHOOK_WORKERS=1 restores strict FIFO delivery per process.
+DELIVERY_WORKERS = 16
+
+class SharedDeliveryQueue:
+    """Delivery queue kept in the shared state store, consumed by any replica
+    
+    Has the put/get interface of the asyncio.Queue used in single-node mode.
+    """
+    
+    def __init__(self, state: StateStore, name: str = DELIVERY_QUEUE):
+        self.state = state
+        self.name = name
+    
+    async def put(self, delivery: WebhookDelivery):
+        """Enqueue a delivery"""
+        await self.state.push(self.name, delivery.dict())
+    
+    async def get(self) -> WebhookDelivery:
+        """Wait for the next delivery"""
+        while True:
+            item = await self.state.pop(self.name, timeout=5.0)
+            if item is not None:
+                return WebhookDelivery(**item)
+
 class WebhookService:
     """Service for managing and delivering webhooks"""
     
-    def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
-        self.delivery_queue: asyncio.Queue = asyncio.Queue()
-        self.worker_task: Optional[asyncio.Task] = None
+    def __init__(self, workers: Optional[int] = None):
+        self.http = WebhookHTTP()
+        self.delivery_queue = (
+            SharedDeliveryQueue(storage.state) if storage.state else asyncio.Queue()
+        )
+        self.workers = workers or webhook_setting("WORKERS", DELIVERY_WORKERS)
+        self.worker_tasks: List[asyncio.Task] = []
+        self._signatures: "OrderedDict[Tuple[str, bytes], str]" = OrderedDict()
+        self.breakers = CircuitBreakers()
+        self.scheduler = DelayScheduler()
+        self.stats = WebhookStats()
+        self._probing: Set[str] = set()
+        self._probe_tasks: Set[asyncio.Task] = set()
     
     async def start(self):
-        """Start webhook delivery worker"""
-        if not self.worker_task:
-            self.worker_task = asyncio.create_task(self._delivery_worker())
-            logger.info("Started webhook delivery worker")
+        """Start webhook delivery workers"""
+        self.scheduler.start()
+        self.stats.start()
+        if not self.worker_tasks:
+            self.worker_tasks = [
+                asyncio.create_task(self._delivery_worker()) for _ in range(self.workers)
+            ]
+            logger.info(f"Started {self.workers} webhook delivery workers")
     
     async def stop(self):
-        """Stop webhook delivery worker"""
-        if self.worker_task:
-            self.worker_task.cancel()
+        """Stop webhook delivery workers"""
+        for task in self.worker_tasks:
+            task.cancel()
+        for task in self.worker_tasks:
             try:
-                await self.worker_task
+                await task
             except asyncio.CancelledError:
                 pass
-            self.worker_task = None
-        await self.client.aclose()
-        logger.info("Stopped webhook delivery worker")
+        self.worker_tasks = []
+        await self.scheduler.stop()
+        for task in list(self._probe_tasks):
+            task.cancel()
+        self._probing.clear()
+        await self.stats.stop()
+        await self.http.close()
+        logger.info("Stopped webhook delivery workers")
     
     async def _delivery_worker(self):
         """Background worker for delivering webhooks"""
@@ -51,37 +108,74 @@ class WebhookService:
             except Exception as e:
                 logger.error(f"Error in webhook delivery worker: {e}")
     
-    def _generate_signature(self, payload: str, secret: str) -> str:
-        """Generate HMAC signature for webhook payload"""
-        return hmac.new(
-            secret.encode(),
-            payload.encode(),
-            hashlib.sha256
-        ).hexdigest()
+    def _generate_signature(self, payload: bytes, secret: str) -> str:
+        """Generate HMAC signature for webhook payload, reusing earlier results"""
+        key = (secret, payload)
+        signature = self._signatures.get(key)
+        if signature is not None:
+            self._signatures.move_to_end(key)
+            return signature
+        
+        signature = hmac.new(secret.encode(), payload, hashlib.sha256).hexdigest()
+        self._signatures[key] = signature
+        if len(self._signatures) > SIGNATURE_CACHE_SIZE:
+            self._signatures.popitem(last=False)
+        return signature
     
-    async def _deliver_webhook(self, delivery: WebhookDelivery):
-        """Deliver a single webhook"""
+    @staticmethod
+    def _payload_bytes(delivery: WebhookDelivery) -> bytes:
+        """Encoded payload of a delivery, encoding it only the first time"""
+        if delivery._body is None:
+            delivery._body = dumps_bytes(delivery.payload)
+        return delivery._body
+    
+    async def _deliver_webhook(
+        self, delivery: WebhookDelivery, probe_of: Optional[CircuitBreaker] = None
+    ):
+        """Deliver a single webhook; probe_of is the breaker a probe was taken from"""
         webhook = await self.get_webhook(delivery.webhook_id)
+        breaker = self.breakers.get(str(webhook.url)) if webhook else None
+        if probe_of is not None and probe_of is not breaker:
+            # The probe's webhook was deleted or moved; another delivery probes
+            probe_of.release_probe()
+            self._arm_probe(probe_of)
+        
+        # Nothing is sent to a destination whose circuit is open
+        if breaker is not None and not breaker.allow():
+            await self._park(breaker, delivery)
+            return
+        
         if not webhook or webhook.status != WebhookStatus.ACTIVE:
+            if breaker is not None:
+                # Hand the probe slot this delivery may have taken to the next one
+                breaker.release_probe()
+                self._arm_probe(breaker)
             return
         
+        # Prepare headers
+        headers = {
+            **(webhook.headers or {}),
+            "Content-Type": "application/json",
+            "X-Webhook-Event": delivery.event_type.value,
+            "X-Webhook-Delivery": delivery.id,
+        }
+        if delivery.idempotency_key:
+            headers["X-Webhook-Idempotency-Key"] = delivery.idempotency_key
+        
+        # Add signature if secret is configured
+        payload_json = self._payload_bytes(delivery)
+        if webhook.secret:
+            signature = self._generate_signature(payload_json, webhook.secret)
+            headers["X-Webhook-Signature"] = f"sha256={signature}"
+        
+        released: List[WebhookDelivery] = []
+        succeeded = False
+        circuit_open = False
         try:
-            # Prepare headers
-            headers = webhook.headers.copy() if webhook.headers else {}
-            headers["Content-Type"] = "application/json"
-            headers["X-Webhook-Event"] = delivery.event_type
-            headers["X-Webhook-Delivery"] = delivery.id
-            
-            # Add signature if secret is configured
-            payload_json = json.dumps(delivery.payload)
-            if webhook.secret:
-                signature = self._generate_signature(payload_json, webhook.secret)
-                headers["X-Webhook-Signature"] = f"sha256={signature}"
-            
             # Send webhook
             logger.info(f"Delivering webhook {delivery.id} to {webhook.url}")
             
-            response = await self.client.post(
+            response = await self.http.post(
                 str(webhook.url),
                 content=payload_json,
                 headers=headers
@@ -92,54 +186,149 @@ class WebhookService:
             delivery.response_body = response.text[:1000]  # Store first 1KB
             delivery.delivered_at = datetime.utcnow()
             
-            # Update webhook status
-            webhook.last_triggered_at = datetime.utcnow()
-            
             if response.status_code >= 200 and response.status_code < 300:
-                webhook.failure_count = 0
+                succeeded = True
+                released = breaker.record_success()
                 logger.info(f"Webhook {delivery.id} delivered successfully")
             else:
-                webhook.failure_count += 1
                 logger.warning(f"Webhook {delivery.id} failed with status {response.status_code}")
-                
-                # Retry if needed
-                if delivery.attempt < webhook.max_retries:
-                    await self._schedule_retry(delivery, webhook.retry_delay)
-                elif webhook.failure_count >= 5:
-                    # Disable webhook after too many failures
-                    webhook.status = WebhookStatus.FAILED
-                    logger.error(f"Webhook {webhook.id} disabled after repeated failures")
-            
-            # Save updates
-            await self.save_webhook(webhook)
-            await self._save_delivery(delivery)
-            
+                if self._is_destination_failure(response.status_code):
+                    circuit_open = breaker.record_failure()
+                elif breaker.state == CircuitState.HALF_OPEN:
+                    # A rejected probe doesn't show the destination recovered;
+                    # reopen, but retry this delivery normally as it was rejected
+                    breaker.record_failure()
+                    self._arm_probe(breaker)
+                else:
+                    # The receiver is up and answered; only this delivery failed
+                    breaker.record_reachable()
+        
         except Exception as e:
             logger.error(f"Error delivering webhook {delivery.id}: {e}")
             delivery.error = str(e)
-            await self._save_delivery(delivery)
-            
-            webhook.failure_count += 1
-            if delivery.attempt < webhook.max_retries:
-                await self._schedule_retry(delivery, webhook.retry_delay)
-            
-            await self.save_webhook(webhook)
+            circuit_open = breaker.record_failure()
+        
+        if circuit_open:
+            # Resent when the destination recovers, without using up attempts
+            await self._park(breaker, delivery)
+            self._arm_probe(breaker)
+        elif not succeeded:
+            # Retry if needed
+            await self._schedule_retry(delivery, webhook)
+        
+        # Statistics and the delivery record are written in the next batch;
+        # the webhook's configuration is untouched
+        await self.stats.record(webhook, succeeded)
+        await self._save_delivery(delivery)
+        
+        for parked in released:
+            await self.delivery_queue.put(parked)
     
-    async def _schedule_retry(self, delivery: WebhookDelivery, delay_seconds: int):
-        """Schedule webhook retry"""
-        delivery.attempt += 1
-        logger.info(f"Scheduling webhook {delivery.id} retry #{delivery.attempt} in {delay_seconds}s")
+    @staticmethod
+    def _is_destination_failure(status_code: int) -> bool:
+        """Responses that mean the receiver is down or overloaded"""
+        return status_code >= 500 or status_code in (408, 429)
+    
+    async def _park(self, breaker: CircuitBreaker, delivery: WebhookDelivery):
+        """Hold a delivery while its destination's circuit is open or probing"""
+        dropped = breaker.park(delivery)
+        if dropped is not None:
+            dropped.error = f"Dropped: circuit open for {breaker.destination}"
+            logger.warning(f"Webhook {dropped.id} dropped, too many parked for {breaker.destination}")
+            await self._save_delivery(dropped)
+    
+    def _arm_probe(self, breaker: CircuitBreaker):
+        """Wake the oldest parked delivery as a probe once the open period ends
         
-        async def retry():
-            await asyncio.sleep(delay_seconds)
-            await self.delivery_queue.put(delivery)
+        Called when a failure (re)opens the circuit or a probe isn't sent;
+        deliveries parked while a probe is in flight wait for its result.
+        """
+        if breaker.state == CircuitState.OPEN and breaker.destination not in self._probing:
+            self._probing.add(breaker.destination)
+            self.scheduler.schedule(
+                breaker.open_until - time.monotonic(), self._send_probe, breaker
+            )
+    
+    async def _send_probe(self, breaker: CircuitBreaker):
+        """Send one parked delivery to test a destination in the half-open state
         
-        asyncio.create_task(retry())
+        The probe is delivered by this process rather than queued, since
+        another replica taking it from a shared queue would never report
+        back to this breaker.
+        """
+        self._probing.discard(breaker.destination)
+        probe = breaker.take_probe()
+        if probe is not None:
+            task = asyncio.create_task(self._run_probe(breaker, probe))
+            self._probe_tasks.add(task)
+            task.add_done_callback(self._probe_tasks.discard)
+    
+    async def _run_probe(self, breaker: CircuitBreaker, probe: WebhookDelivery):
+        try:
+            await self._deliver_webhook(probe, probe_of=breaker)
+        except Exception as e:
+            logger.error(f"Error sending probe {probe.id} to {breaker.destination}: {e}")
+            breaker.release_probe()
+            self._arm_probe(breaker)
     
-    async def trigger_webhook(self, user_id: str, event_type: WebhookEvent, data: Dict):
-        """Trigger webhooks for a user and event"""
+    async def _schedule_retry(self, delivery: WebhookDelivery, webhook: Webhook):
+        """Schedule webhook retry according to the webhook's retry policy"""
+        delay = next_retry_delay(webhook, delivery)
+        if delay is None:
+            logger.warning(f"Webhook {delivery.id} failed after {delivery.attempt} attempts, giving up")
+            return
+        
+        delivery.attempt += 1
+        if not self.scheduler.schedule(delay, self.delivery_queue.put, delivery):
+            delivery.error = "Dropped: retry scheduler full"
+            logger.error(f"Webhook {delivery.id} retry dropped, scheduler full")
+            return
+        logger.info(f"Scheduling webhook {delivery.id} retry #{delivery.attempt} in {delay:.1f}s")
+    
+    def get_status(self) -> Dict:
+        """Delivery queue, retry, circuit breaker and connection pool state"""
+        return {
+            "queued": self.delivery_queue.qsize() if isinstance(self.delivery_queue, asyncio.Queue) else None,
+            "retries": self.scheduler.get_status(),
+            "circuits": self.breakers.get_status(),
+            "pools": self.http.get_status(),
+        }
+    
+    async def get_user_status(self, user_id: str) -> Dict:
+        """Circuit and connection pool state of a user's webhook destinations"""
+        destinations = {
+            CircuitBreakers.destination(str(w.url)) for w in await self.get_user_webhooks(user_id)
+        }
+        circuits = {}
+        pools = {}
+        for destination in sorted(destinations):
+            breaker = self.breakers.peek(destination)
+            circuits[destination] = (
+                breaker.get_status() if breaker else {"state": CircuitState.CLOSED.value}
+            )
+            pool = self.http.get_destination_status(destination)
+            if pool:
+                pools[destination] = pool
+        return {"circuits": circuits, "pools": pools}
+    
+    async def trigger_webhook(
+        self,
+        user_id: str,
+        event_type: WebhookEvent,
+        data: Dict,
+        idempotency_key: Optional[str] = None
+    ):
+        """Trigger webhooks for a user and event
+        
+        idempotency_key identifies the event: it is sent with every delivery
+        and retry so receivers can discard events they already processed.
+        """
         webhooks = await self.get_user_webhooks(user_id)
         
+        # The payload is the same for every webhook, so it is encoded once
+        payload = None
+        body = None
+        
         for webhook in webhooks:
             # Check if webhook is subscribed to this event
             if webhook.status != WebhookStatus.ACTIVE:
@@ -148,15 +337,23 @@ class WebhookService:
             if WebhookEvent.ALL not in webhook.events and event_type not in webhook.events:
                 continue
             
-            # Create delivery record
-            delivery = WebhookDelivery(
-                webhook_id=webhook.id,
-                event_type=event_type,
-                payload={
+            if payload is None:
+                payload = {
                     "event": event_type,
                     "timestamp": datetime.utcnow().isoformat(),
                     "data": data
                 }
+                if idempotency_key:
+                    payload["idempotency_key"] = idempotency_key
+                body = dumps_bytes(payload)
+            
+            # Create delivery record
+            delivery = WebhookDelivery(
+                webhook_id=webhook.id,
+                event_type=event_type,
+                payload=payload,
+                idempotency_key=idempotency_key,
+                body=body
             )
             
             # Queue for delivery
@@ -164,7 +361,7 @@ class WebhookService:
     
     # Storage methods
     async def save_webhook(self, webhook: Webhook):
-        """Save webhook to storage"""
+        """Save webhook configuration to storage (statistics are kept apart)"""
         webhook.updated_at = datetime.utcnow()
         
         # Get user's webhooks
@@ -174,7 +371,7 @@ class WebhookService:
         existing = await storage.load_json_file(user_webhooks_file) or {"webhooks": []}
         
         # Update or add webhook
-        webhook_dict = webhook.dict()
+        webhook_dict = webhook.dict(exclude=STATS_FIELDS)
         webhook_found = False
         for i, w in enumerate(existing["webhooks"]):
             if w["id"] == webhook.id:
@@ -191,15 +388,12 @@ class WebhookService:
         """Get webhook by ID"""
         # Search all user webhook files
         webhooks_dir = storage.base_dir / "webhooks"
-        if not webhooks_dir.exists():
-            return None
-        
-        for user_file in webhooks_dir.glob("*.json"):
+        for user_file in await storage.list_json_files(webhooks_dir):
             user_data = await storage.load_json_file(user_file)
             if user_data:
                 for webhook_data in user_data.get("webhooks", []):
                     if webhook_data["id"] == webhook_id:
-                        return Webhook(**webhook_data)
+                        return await self.stats.apply(Webhook(**webhook_data))
         
         return None
     
@@ -211,7 +405,7 @@ class WebhookService:
         if not user_data:
             return []
         
-        return [Webhook(**w) for w in user_data.get("webhooks", [])]
+        return [await self.stats.apply(Webhook(**w)) for w in user_data.get("webhooks", [])]
     
     async def delete_webhook(self, webhook_id: str) -> bool:
         """Delete a webhook"""
@@ -227,25 +421,12 @@ class WebhookService:
         ]
         
         await storage.save_json_file(user_webhooks_file, user_data)
+        await self.stats.forget(webhook)
         return True
     
     async def _save_delivery(self, delivery: WebhookDelivery):
-        """Save delivery record"""
-        deliveries_dir = storage.base_dir / "webhook_deliveries"
-        deliveries_dir.mkdir(exist_ok=True)
-        
-        # Save by date for easier cleanup
-        date_str = delivery.created_at.strftime("%Y-%m-%d")
-        delivery_file = deliveries_dir / f"{date_str}.json"
-        
-        existing = await storage.load_json_file(delivery_file) or {"deliveries": []}
-        existing["deliveries"].append(delivery.dict())
-        
-        # Keep only last 1000 deliveries per day
-        if len(existing["deliveries"]) > 1000:
-            existing["deliveries"] = existing["deliveries"][-1000:]
-        
-        await storage.save_json_file(delivery_file, existing)
+        """Save delivery record (buffered and written in batches)"""
+        self.stats.record_delivery(delivery)
 
 # Global webhook service instance
 webhook_service = WebhookService()
\ No newline at end of file
@@ -0,0 +1,244 @@
+"""Webhook delivery statistics and delivery records, written in batches"""
+
+import asyncio
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.storage import storage
+from app.models.webhook import Webhook, WebhookDelivery
+
+logger = logging.getLogger(__name__)
+
+# Seconds between writes of changed statistics and new delivery records
+STATS_FLUSH_INTERVAL = 10.0
+# Delivery records kept per day file
+MAX_DELIVERIES_PER_DAY = 1000
+
+# Webhook fields that are delivery statistics rather than configuration
+STATS_FIELDS = {"last_triggered_at", "failure_count"}
+
+
+def _new_delta() -> Dict[str, Any]:
+    """Changes to one webhook's counters since the last flush"""
+    return {
+        "delivered": 0,
+        "failed": 0,
+        # Failures since the last success or reset (all of them if not reset)
+        "failures": 0,
+        "reset": False,
+        "last_triggered_at": None,
+        "deleted": False,
+    }
+
+
+def _combine(older: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+    """One delta with the effect of older followed by newer"""
+    return {
+        "delivered": older["delivered"] + newer["delivered"],
+        "failed": older["failed"] + newer["failed"],
+        "failures": newer["failures"] if newer["reset"] else older["failures"] + newer["failures"],
+        "reset": older["reset"] or newer["reset"],
+        "last_triggered_at": max(
+            filter(None, (older["last_triggered_at"], newer["last_triggered_at"])), default=None
+        ),
+        "deleted": older["deleted"] or newer["deleted"],
+    }
+
+
+def _apply_delta(entry: Optional[Dict[str, Any]], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Counters of a stored entry after a delta"""
+    entry = dict(entry or {"failure_count": 0, "last_triggered_at": None, "delivered": 0, "failed": 0})
+    entry["delivered"] = entry.get("delivered", 0) + delta["delivered"]
+    entry["failed"] = entry.get("failed", 0) + delta["failed"]
+    entry["failure_count"] = (
+        delta["failures"] if delta["reset"] else entry.get("failure_count", 0) + delta["failures"]
+    )
+    last = max(filter(None, (entry.get("last_triggered_at"), delta["last_triggered_at"])), default=None)
+    entry["last_triggered_at"] = last
+    return entry
+
+
+class WebhookStats:
+    """In-memory delivery counters for webhooks, flushed to per-user files
+
+    Configuration stays in webhooks/{user}.json and is only written when
+    it changes; counters live in webhook_stats/{user}.json. Each flush
+    merges the changes made since the previous one into the stored
+    counters with compare-and-set, so replicas sharing a store add to
+    each other's counts instead of overwriting them. Delivery records are
+    buffered and appended to their day file the same way. Writes that fail
+    are kept for the next flush, and everything pending is written on
+    stop().
+    """
+
+    def __init__(self, flush_interval: float = STATS_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.stats_dir = storage.base_dir / "webhook_stats"
+        self.deliveries_dir = storage.base_dir / "webhook_deliveries"
+        self._stats: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._pending: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._deliveries: Dict[str, List[Dict[str, Any]]] = {}
+        self._load_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _path(self, user_id: str) -> Path:
+        return self.stats_dir / f"{user_id}.json"
+
+    async def _user_stats(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Counters of a user's webhooks, loaded from disk on first use"""
+        stats = self._stats.get(user_id)
+        if stats is not None:
+            return stats
+        async with self._load_lock:
+            if user_id not in self._stats:
+                data = await storage.load_json_file(self._path(user_id)) or {}
+                self._stats[user_id] = data.get("webhooks", {})
+        return self._stats[user_id]
+
+    def _delta(self, webhook: Webhook) -> Dict[str, Any]:
+        return self._pending.setdefault(webhook.user_id, {}).setdefault(webhook.id, _new_delta())
+
+    async def apply(self, webhook: Webhook) -> Webhook:
+        """Fill a webhook's statistics fields from the counters"""
+        entry = (await self._user_stats(webhook.user_id)).get(webhook.id)
+        if entry:
+            webhook.failure_count = entry["failure_count"]
+            last = entry["last_triggered_at"]
+            webhook.last_triggered_at = datetime.fromisoformat(last) if last else None
+        return webhook
+
+    async def record(self, webhook: Webhook, success: bool):
+        """Count a delivery attempt"""
+        stats = await self._user_stats(webhook.user_id)
+        entry = stats.setdefault(webhook.id, {
+            "failure_count": webhook.failure_count,
+            "last_triggered_at": (
+                webhook.last_triggered_at.isoformat() if webhook.last_triggered_at else None
+            ),
+            "delivered": 0,
+            "failed": 0,
+        })
+        delta = self._delta(webhook)
+        now = datetime.utcnow().isoformat()
+        entry["last_triggered_at"] = delta["last_triggered_at"] = now
+        if success:
+            entry["failure_count"] = 0
+            entry["delivered"] += 1
+            delta["delivered"] += 1
+            delta["failures"] = 0
+            delta["reset"] = True
+        else:
+            entry["failure_count"] += 1
+            entry["failed"] += 1
+            delta["failed"] += 1
+            delta["failures"] += 1
+
+    async def reset_failures(self, webhook: Webhook):
+        """Clear a webhook's consecutive failure count (e.g. on reactivation)"""
+        entry = (await self._user_stats(webhook.user_id)).get(webhook.id)
+        if entry:
+            entry["failure_count"] = 0
+            delta = self._delta(webhook)
+            delta["failures"] = 0
+            delta["reset"] = True
+
+    async def forget(self, webhook: Webhook):
+        """Drop the counters of a deleted webhook"""
+        stats = await self._user_stats(webhook.user_id)
+        stats.pop(webhook.id, None)
+        self._delta(webhook)["deleted"] = True
+
+    def record_delivery(self, delivery: WebhookDelivery):
+        """Buffer a delivery record for the next flush"""
+        date_str = delivery.created_at.strftime("%Y-%m-%d")
+        self._deliveries.setdefault(date_str, []).append(delivery.dict())
+
+    async def _update(self, path: Path, change: Callable[[Dict], Dict]) -> Dict:
+        """Apply change to a stored document with compare-and-set, retrying on conflict"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        while True:
+            data, version = await storage.load_json_versioned(path)
+            updated = change(data or {})
+            if await storage.compare_and_set_json(path, updated, version) is not None:
+                return updated
+
+    async def flush(self):
+        """Merge changed counters and append buffered delivery records"""
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            for user_id, deltas in pending.items():
+                try:
+                    await self._flush_user(user_id, deltas)
+                except Exception as e:
+                    # Keep the changes, before any made since, for the next flush
+                    newer = self._pending.get(user_id, {})
+                    for webhook_id, delta in deltas.items():
+                        if webhook_id in newer:
+                            delta = _combine(delta, newer[webhook_id])
+                        newer[webhook_id] = delta
+                    self._pending[user_id] = newer
+                    logger.error(f"Failed to save webhook stats for user {user_id}: {e}")
+
+            deliveries, self._deliveries = self._deliveries, {}
+            for date_str, records in deliveries.items():
+                try:
+                    await self._update(
+                        self.deliveries_dir / f"{date_str}.json",
+                        # Keep only the last deliveries of each day
+                        lambda data: {
+                            "deliveries": (data.get("deliveries", []) + records)[-MAX_DELIVERIES_PER_DAY:]
+                        }
+                    )
+                except Exception as e:
+                    self._deliveries.setdefault(date_str, [])[:0] = records
+                    logger.error(f"Failed to save webhook deliveries for {date_str}: {e}")
+
+    async def _flush_user(self, user_id: str, deltas: Dict[str, Dict[str, Any]]):
+        def merge(data: Dict) -> Dict:
+            webhooks = dict(data.get("webhooks", {}))
+            for webhook_id, delta in deltas.items():
+                if delta["deleted"]:
+                    webhooks.pop(webhook_id, None)
+                else:
+                    webhooks[webhook_id] = _apply_delta(webhooks.get(webhook_id), delta)
+            return {"webhooks": webhooks}
+
+        merged = await self._update(self._path(user_id), merge)
+        # Pick up other replicas' counts, keeping changes made during the write
+        stats = merged["webhooks"]
+        for webhook_id, delta in self._pending.get(user_id, {}).items():
+            if delta["deleted"]:
+                stats.pop(webhook_id, None)
+            else:
+                stats[webhook_id] = _apply_delta(stats.get(webhook_id), delta)
+        self._stats[user_id] = stats
+
+    def start(self):
+        """Start periodic flushing"""
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop periodic flushing and write what is pending"""
+        if self._task:
+            # Let a flush in progress finish rather than cancelling it mid-write
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Webhook stats flush failed: {e}")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for request header construction
+
+Compares the previous per-request header building in GVoiceClient with
+the template-based HeaderBuilder. Run from the repository root:
+
+    python benchmarks/bench_headers.py
+"""
+import hashlib
+import os
+import sys
+import time
+import timeit
+from urllib.parse import urlencode
+
+# Add project to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.constants import (
+    USER_AGENT, CH_USER_AGENT, CH_PLATFORM, CLIENT_VERSION,
+    JAVASCRIPT_USER_AGENT, WAA_X_USER_AGENT, API_KEY, WAA_API_KEY,
+    ORIGIN, API_DOMAIN, CONTACTS_DOMAIN, WAA_DOMAIN, UPLOAD_DOMAIN,
+    ENDPOINTS, CLIENT_DETAILS, CONTENT_TYPE_PBLITE
+)
+from app.core.headers import HeaderBuilder
+
+COOKIES = {
+    "SAPISID": "bench-sapisid-value/Abc123",
+    "HSID": "bench-hsid",
+    "SSID": "bench-ssid",
+    "APISID": "bench-apisid/Xyz",
+    "SID": "g.a000" + "x" * 140,
+    "__Secure-1PSID": "g.a000" + "y" * 140,
+    "__Secure-3PSID": "g.a000" + "z" * 140,
+    "__Secure-1PSIDTS": "sidts-" + "a" * 60,
+    "__Secure-3PSIDTS": "sidts-" + "b" * 60,
+    "NID": "n" * 180,
+}
+
+URL = ENDPOINTS["list_threads"]
+ITERATIONS = 50000
+
+
+def legacy_prepare_headers(cookies, url, content_type=None, auth_user="0"):
+    """Header construction as GVoiceClient._prepare_headers used to do it"""
+    headers = {
+        "Sec-Ch-Ua": CH_USER_AGENT,
+        "Sec-Ch-Ua-Platform": CH_PLATFORM,
+        "Sec-Ch-Ua-Mobile": "?0",
+        "User-Agent": USER_AGENT,
+        "X-Goog-AuthUser": auth_user,
+        "Sec-Fetch-Dest": "empty",
+        "Sec-Fetch-Mode": "cors",
+        "Accept": "*/*",
+        "Accept-Language": "en-US,en;q=0.5",
+    }
+    if UPLOAD_DOMAIN in url:
+        headers["Origin"] = f"https://{UPLOAD_DOMAIN}"
+        headers["Referer"] = f"https://{UPLOAD_DOMAIN}/"
+    else:
+        headers["Origin"] = ORIGIN
+        headers["Referer"] = f"{ORIGIN}/"
+    if API_DOMAIN in url:
+        headers["X-Client-Version"] = CLIENT_VERSION
+        headers["X-ClientDetails"] = urlencode(CLIENT_DETAILS)
+        headers["X-JavaScript-User-Agent"] = JAVASCRIPT_USER_AGENT
+        headers["X-Requested-With"] = "XMLHttpRequest"
+        headers["X-Goog-Encode-Response-If-Executable"] = "base64"
+    if CONTACTS_DOMAIN in url:
+        headers["X-Goog-Api-Key"] = API_KEY
+        headers["X-Goog-Encode-Response-If-Executable"] = "base64"
+    if WAA_DOMAIN in url:
+        headers["X-Goog-Api-Key"] = WAA_API_KEY
+        headers["X-User-Agent"] = WAA_X_USER_AGENT
+    if API_DOMAIN in url and url.startswith("https://"):
+        headers["Sec-Fetch-Site"] = "same-site"
+    else:
+        headers["Sec-Fetch-Site"] = "same-origin"
+    if content_type:
+        headers["Content-Type"] = content_type
+    if "SAPISID" in cookies:
+        timestamp = int(time.time())
+        hash_input = f"{timestamp} {cookies['SAPISID']} {ORIGIN}"
+        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
+        headers["Authorization"] = f"SAPISIDHASH {timestamp}_{hash_value}"
+    if cookies:
+        headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in cookies.items())
+    return headers
+
+
+def main():
+    builder = HeaderBuilder(dict(COOKIES))
+
+    # Both paths must produce the same headers
+    expected = legacy_prepare_headers(COOKIES, URL, CONTENT_TYPE_PBLITE)
+    actual = builder.build(URL, CONTENT_TYPE_PBLITE)
+    assert expected == actual, "HeaderBuilder output differs from legacy headers"
+
+    legacy = timeit.timeit(
+        lambda: legacy_prepare_headers(COOKIES, URL, CONTENT_TYPE_PBLITE),
+        number=ITERATIONS
+    )
+    templated = timeit.timeit(
+        lambda: builder.build(URL, CONTENT_TYPE_PBLITE),
+        number=ITERATIONS
+    )
+
+    print(f"Header construction, {ITERATIONS} requests")
+    print(f"  legacy:    {legacy / ITERATIONS * 1e6:8.2f} us/request")
+    print(f"  templated: {templated / ITERATIONS * 1e6:8.2f} us/request")
+    print(f"  speedup:   {legacy / templated:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
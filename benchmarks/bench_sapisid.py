@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Hot-path benchmarks for SAPISIDHASH signing
+
+Compares hashing on every call (what each client used to do) with the
+shared per-second memo in app.core.sapisid. Run from the repository root:
+
+    python benchmarks/bench_sapisid.py
+"""
+import hashlib
+import os
+import sys
+import time
+import timeit
+
+# Add project to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.constants import ORIGIN
+from app.core.sapisid import sapisid_hash, authorization_header
+
+SAPISID = "bench-sapisid-value/Abc123"
+COOKIES = {
+    "SAPISID": SAPISID,
+    "__Secure-1PAPISID": SAPISID,
+    "__Secure-3PAPISID": SAPISID,
+}
+ITERATIONS = 200000
+
+
+def legacy_sapisid_hash(sapisid: str) -> str:
+    """SAPISIDHASH as the clients used to compute it"""
+    timestamp = int(time.time())
+    hash_input = f"{timestamp} {sapisid} {ORIGIN}"
+    hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
+    return f"SAPISIDHASH {timestamp}_{hash_value}"
+
+
+def report(name: str, seconds: float):
+    print(f"  {name:<28} {seconds / ITERATIONS * 1e9:8.0f} ns/call")
+
+
+def main():
+    timestamp = int(time.time())
+    assert sapisid_hash(SAPISID, timestamp=timestamp) == (
+        f"SAPISIDHASH {timestamp}_"
+        + hashlib.sha1(f"{timestamp} {SAPISID} {ORIGIN}".encode()).hexdigest()
+    )
+
+    print(f"SAPISIDHASH signing, {ITERATIONS} calls")
+    report("legacy (hash every call)", timeit.timeit(
+        lambda: legacy_sapisid_hash(SAPISID), number=ITERATIONS
+    ))
+    report("sapisid_hash (memoized)", timeit.timeit(
+        lambda: sapisid_hash(SAPISID), number=ITERATIONS
+    ))
+    report("authorization_header", timeit.timeit(
+        lambda: authorization_header(COOKIES), number=ITERATIONS
+    ))
+    report("authorization_header +1P/3P", timeit.timeit(
+        lambda: authorization_header(COOKIES, include_variants=True), number=ITERATIONS
+    ))
+
+
+if __name__ == "__main__":
+    main()
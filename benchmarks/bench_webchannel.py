@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Fuzz check and benchmark for the WebChannel frame decoder
+
+The fuzz pass encodes random chunks (including non-ASCII text and the
+XSSI prefix), splits the stream at random byte offsets and checks that
+FrameDecoder returns exactly the original chunks. The benchmark compares
+the decoder with the previous str-accumulating readline loop from
+RealtimeClient._poll_messages. Run from the repository root:
+
+    python benchmarks/bench_webchannel.py [--fuzz-rounds N] [--seed S]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# Add project to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.webchannel import FrameDecoder, WebChannelError, XSSI_PREFIX
+
+ALPHABET = "abcXYZ0129 \n\t\"\\{}[],:é中😀\u2028"
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    """Build a random JSON value"""
+    kind = rng.randrange(6 if depth < 3 else 4)
+    if kind == 0:
+        return rng.randint(-10**6, 10**6)
+    if kind == 1:
+        return "".join(rng.choice(ALPHABET) for _ in range(rng.randrange(20)))
+    if kind == 2:
+        return rng.choice([None, True, False])
+    if kind == 3:
+        return rng.random()
+    if kind == 4:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(5))]
+    return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randrange(4))}
+
+
+def encode_chunk(value, ensure_ascii: bool) -> bytes:
+    """Encode one chunk the way the server does: UTF-16 length, newline, JSON"""
+    text = json.dumps(value, ensure_ascii=ensure_ascii)
+    units = len(text.encode("utf-16-le")) // 2
+    return f"{units}\n{text}".encode("utf-8")
+
+
+def fuzz(rounds: int, seed: int):
+    rng = random.Random(seed)
+    for round_number in range(rounds):
+        chunks = [
+            [[aid, random_value(rng)]] for aid in range(rng.randrange(1, 20))
+        ]
+        stream = b"".join(encode_chunk(c, rng.random() < 0.5) for c in chunks)
+        if rng.random() < 0.3:
+            stream = XSSI_PREFIX.encode() + b"\n" + stream
+
+        decoder = FrameDecoder()
+        decoded = []
+        pos = 0
+        while pos < len(stream):
+            step = rng.choice([1, 2, 3, 7, 64, 4096])
+            decoded.extend(decoder.feed(stream[pos:pos + step]))
+            pos += step
+
+        assert decoded == chunks, f"round {round_number}: decoded chunks differ"
+        assert decoder.pending == 0, f"round {round_number}: leftover bytes"
+
+    # Malformed input must raise WebChannelError rather than anything else
+    for bad in (b"abc\n[]", b"5\n[1,2,", b"-1\n", b"9" * 40, b'5\n["a\xff"]2\n[]'):
+        try:
+            decoder = FrameDecoder()
+            decoder.feed(bad)
+            if bad == b"5\n[1,2,":
+                decoder.feed(b"\n3\n[1]")
+        except WebChannelError:
+            continue
+        raise AssertionError(f"malformed input {bad!r} was accepted")
+
+    print(f"Fuzz: {rounds} rounds OK (seed {seed})")
+
+
+def legacy_loop(data_chunks):
+    """Previous readline-style loop: str accumulation and split per line"""
+    messages = []
+    buffer = ""
+    for chunk in data_chunks:
+        buffer += chunk.decode('utf-8', errors='ignore')
+        while '\n' in buffer:
+            line, buffer = buffer.split('\n', 1)
+            if line.strip():
+                messages.append(json.loads(line.strip()))
+    return messages
+
+
+def decoder_loop(data_chunks):
+    decoder = FrameDecoder()
+    messages = []
+    for chunk in data_chunks:
+        messages.extend(decoder.feed(chunk))
+    return messages
+
+
+def best_of(func, data_chunks, repeat: int = 5):
+    """Run func several times, returning the fastest time and its result"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(data_chunks)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def split(stream: bytes, size: int):
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+
+def benchmark():
+    rng = random.Random(1)
+    values = [
+        [[aid, [[["thread", "t%d" % aid, "x" * rng.randrange(50, 400)]]]]]
+        for aid in range(5000)
+    ]
+    newline_stream = b"".join(json.dumps(v).encode() + b"\n" for v in values)
+    framed_stream = b"".join(encode_chunk(v, True) for v in values)
+
+    print(f"Benchmark: {len(values)} messages, ~{len(framed_stream) // 1024} KiB")
+    for chunk_size in (1024, 64 * 1024, 1024 * 1024):
+        legacy_chunks = split(newline_stream, chunk_size)
+        framed_chunks = split(framed_stream, chunk_size)
+
+        legacy_time, legacy_result = best_of(legacy_loop, legacy_chunks)
+        decoder_time, decoder_result = best_of(decoder_loop, framed_chunks)
+
+        assert legacy_result == decoder_result == values
+        print(
+            f"  {chunk_size // 1024:5d} KiB reads: legacy {legacy_time * 1000:8.1f} ms, "
+            f"decoder {decoder_time * 1000:8.1f} ms ({legacy_time / decoder_time:5.1f}x)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--fuzz-rounds", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=int(time.time()))
+    args = parser.parse_args()
+
+    fuzz(args.fuzz_rounds, args.seed)
+    benchmark()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Load test for webhook delivery against a local stand-in receiver
+
+Starts one or more HTTP receivers on 127.0.0.1 with configurable latency,
+error rate and slow consumers. Receivers can also read request bodies
+slowly or stall halfway through one, with a small socket receive buffer
+so the sender blocks; with --payload-size large enough this exercises the
+pool and write timeouts (tune them with GVOICE_WEBHOOK_WRITE_TIMEOUT and
+friends). Registers webhooks pointing at them and
+calls WebhookService.trigger_webhook at a fixed rate, then reports
+deliveries/s, trigger-to-receipt latency (p50/p99), queue depth and
+memory. It needs no network access. Application state goes to a
+temporary HOME. Run from the repository root:
+
+    python benchmarks/bench_webhooks.py [--rate 200] [--duration 10] [--webhooks 4]
+    python benchmarks/bench_webhooks.py --stall-fraction 0.05 --recv-buffer 4096 \
+        --payload-size 200000
+
+--min-throughput and --max-p99 make the run exit non-zero when a
+threshold is missed, so CI can catch delivery regressions.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Keep sessions, webhooks and delivery logs out of the real ~/.config/gvoice
+os.environ["HOME"] = tempfile.mkdtemp(prefix="gvoice-bench-")
+os.environ.pop("GVOICE_STATE_URL", None)
+
+# Add project to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.webhook import Webhook, WebhookEvent
+from app.services.webhook_service import WebhookService
+
+USER_ID = "bench-user"
+
+
+class StandInReceiver:
+    """Minimal HTTP/1.1 keep-alive server that records webhook receipts"""
+
+    def __init__(
+        self,
+        latency: float,
+        error_rate: float,
+        slow_fraction: float,
+        slow_latency: float,
+        seed: int,
+        slow_read_fraction: float = 0.0,
+        slow_read_rate: float = 64 * 1024,
+        stall_fraction: float = 0.0,
+        stall_time: float = 20.0,
+        recv_buffer: int = 0
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.slow_read_fraction = slow_read_fraction
+        self.slow_read_rate = slow_read_rate
+        self.stall_fraction = stall_fraction
+        self.stall_time = stall_time
+        self.recv_buffer = recv_buffer
+        self.rng = random.Random(seed)
+        self.received = 0
+        self.errors = 0
+        self.slow_reads = 0
+        self.stalls = 0
+        self.aborted = 0
+        self.delivered = set()
+        self.latencies = []
+        self.server = None
+        self.port = None
+
+    async def start(self) -> int:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.recv_buffer:
+            # Set before listen so accepted connections advertise a small window
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer)
+        sock.bind(("127.0.0.1", 0))
+        self.server = await asyncio.start_server(self._handle, sock=sock)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_body(self, reader: asyncio.StreamReader, length: int) -> bytes:
+        """Read a request body, slowly or with a stall halfway for some requests"""
+        draw = self.rng.random()
+        if draw < self.stall_fraction:
+            self.stalls += 1
+            half = await reader.readexactly(length // 2)
+            # Stop reading; the sender's writes block once the buffers fill
+            await asyncio.sleep(self.stall_time)
+            return half + await reader.readexactly(length - length // 2)
+        if draw < self.stall_fraction + self.slow_read_fraction:
+            self.slow_reads += 1
+            piece = 1024
+            parts = []
+            for offset in range(0, length, piece):
+                parts.append(await reader.readexactly(min(piece, length - offset)))
+                await asyncio.sleep(piece / self.slow_read_rate)
+            return b"".join(parts)
+        return await reader.readexactly(length)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                try:
+                    body = await self._read_body(reader, int(headers.get("content-length", 0)))
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    # The sender gave up (e.g. write timeout) mid-body
+                    self.aborted += 1
+                    break
+                self.received += 1
+
+                delay = self.latency
+                if self.rng.random() < self.slow_fraction:
+                    delay += self.slow_latency
+                if delay:
+                    await asyncio.sleep(delay)
+
+                if self.rng.random() < self.error_rate:
+                    self.errors += 1
+                    status = b"500 Internal Server Error"
+                else:
+                    status = b"200 OK"
+                    delivery_id = headers.get("x-webhook-delivery")
+                    if delivery_id not in self.delivered:
+                        self.delivered.add(delivery_id)
+                        sent = json.loads(body)["data"]["t0"]
+                        self.latencies.append(time.perf_counter() - sent)
+
+                writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Length: 2\r\n\r\nok")
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    break
+        finally:
+            writer.close()
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def rss_mib() -> float:
+    """Current resident set size, falling back to the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(args) -> dict:
+    receivers = [
+        StandInReceiver(
+            args.latency, args.error_rate, args.slow_fraction, args.slow_latency, args.seed + i,
+            slow_read_fraction=args.slow_read_fraction,
+            slow_read_rate=args.slow_read_rate,
+            stall_fraction=args.stall_fraction,
+            stall_time=args.stall_time,
+            recv_buffer=args.recv_buffer
+        )
+        for i in range(args.destinations)
+    ]
+    ports = [await r.start() for r in receivers]
+
+    service = WebhookService(workers=args.workers)
+    for i in range(args.webhooks):
+        await service.save_webhook(Webhook(
+            user_id=USER_ID,
+            url=f"http://127.0.0.1:{ports[i % len(ports)]}/hook/{i}",
+            events=[WebhookEvent.MESSAGE_RECEIVED],
+            secret="bench-secret",
+            retry_delay=args.retry_delay
+        ))
+    await service.start()
+
+    depth = {"queue": 0, "retries": 0, "parked": 0}
+    rss_start = rss_mib()
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    async def sample():
+        while True:
+            status = service.get_status()
+            depth["queue"] = max(depth["queue"], status["queued"] or 0)
+            depth["retries"] = max(depth["retries"], status["retries"]["pending"])
+            parked = sum(d["parked"] for d in status["circuits"]["destinations"].values())
+            depth["parked"] = max(depth["parked"], parked)
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample())
+
+    # Trigger on a fixed schedule; falling behind shows up as a lower trigger rate
+    start = time.perf_counter()
+    events = int(args.rate * args.duration)
+    for i in range(events):
+        due = start + i / args.rate
+        wait = due - time.perf_counter()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await service.trigger_webhook(
+            USER_ID, WebhookEvent.MESSAGE_RECEIVED,
+            {"i": i, "t0": time.perf_counter(), "text": "x" * args.payload_size}
+        )
+    trigger_time = time.perf_counter() - start
+
+    # Drain: wait until everything queued has been sent (or give up)
+    expected = events * args.webhooks
+    deadline = time.perf_counter() + args.drain
+    idle_samples = 0
+    while time.perf_counter() < deadline:
+        if sum(len(r.delivered) for r in receivers) >= expected:
+            break
+        # Idle twice in a row: nothing queued, sending, waiting to retry or parked
+        status = service.get_status()
+        idle = (
+            not status["queued"]
+            and not status["retries"]["pending"]
+            and not any(d["parked"] for d in status["circuits"]["destinations"].values())
+            and not any(d["in_flight"] for d in status["pools"]["destinations"].values())
+        )
+        idle_samples = idle_samples + 1 if idle else 0
+        if idle_samples >= 2:
+            break
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    sampler.cancel()
+    traced_peak = None
+    if args.tracemalloc:
+        traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    status = service.get_status()
+    await service.stop()
+    for r in receivers:
+        await r.stop()
+
+    latencies = [latency for r in receivers for latency in r.latencies]
+    pools = status["pools"]["destinations"].values()
+    delivered = sum(len(r.delivered) for r in receivers)
+    return {
+        "events": events,
+        "expected": expected,
+        "delivered": delivered,
+        "requests": sum(r.received for r in receivers),
+        "receiver_errors": sum(r.errors for r in receivers),
+        "slow_reads": sum(r.slow_reads for r in receivers),
+        "stalls": sum(r.stalls for r in receivers),
+        "aborted": sum(r.aborted for r in receivers),
+        "send_errors": sum(p["errors"] for p in pools),
+        "pool_timeouts": sum(p["pool_timeouts"] for p in pools),
+        "peak_in_flight": max((p["peak_in_flight"] for p in pools), default=0),
+        "trigger_rate": events / trigger_time,
+        "throughput": delivered / elapsed,
+        "elapsed": elapsed,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "max": max(latencies) * 1000 if latencies else float("nan"),
+        "depth": depth,
+        "circuits": status["circuits"]["states"],
+        "rss_start": rss_start,
+        "rss_end": rss_mib(),
+        "rss_peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "traced_peak": traced_peak,
+    }
+
+
+def report(result: dict):
+    print(
+        f"Triggered {result['events']} events ({result['trigger_rate']:.0f}/s) -> "
+        f"{result['delivered']}/{result['expected']} deliveries in {result['elapsed']:.1f}s"
+    )
+    print(f"  throughput    {result['throughput']:10.1f} deliveries/s")
+    print(
+        f"  latency       p50 {result['p50']:8.1f} ms   p99 {result['p99']:8.1f} ms   "
+        f"max {result['max']:8.1f} ms"
+    )
+    print(
+        f"  requests      {result['requests']} ({result['receiver_errors']} answered with 500)"
+    )
+    print(
+        f"  slow bodies   {result['slow_reads']} read slowly, {result['stalls']} stalled, "
+        f"{result['aborted']} abandoned by the sender"
+    )
+    print(
+        f"  sender        {result['send_errors']} errors ({result['pool_timeouts']} pool timeouts), "
+        f"peak {result['peak_in_flight']} in flight per destination"
+    )
+    depth = result["depth"]
+    print(
+        f"  max depth     queue {depth['queue']}   retries {depth['retries']}   "
+        f"parked {depth['parked']}"
+    )
+    print(f"  circuits      {result['circuits']}")
+    memory = (
+        f"  memory        RSS {result['rss_start']:.1f} -> {result['rss_end']:.1f} MiB "
+        f"(peak {result['rss_peak']:.1f} MiB)"
+    )
+    if result["traced_peak"] is not None:
+        memory += f", traced peak {result['traced_peak']:.1f} MiB"
+    print(memory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rate", type=float, default=200, help="trigger_webhook calls per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of triggering")
+    parser.add_argument("--webhooks", type=int, default=4, help="webhooks subscribed to each event")
+    parser.add_argument("--destinations", type=int, default=2, help="stand-in receivers (ports)")
+    parser.add_argument("--workers", type=int, default=16, help="delivery workers")
+    parser.add_argument("--latency", type=float, default=0.005, help="receiver response delay (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction answered with 500")
+    parser.add_argument("--slow-fraction", type=float, default=0.0,
+                        help="fraction of requests answered slowly")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="extra delay of slow answers (s)")
+    parser.add_argument("--slow-read-fraction", type=float, default=0.0,
+                        help="fraction of request bodies read slowly")
+    parser.add_argument("--slow-read-rate", type=float, default=64 * 1024,
+                        help="bytes/s at which slow bodies are read")
+    parser.add_argument("--stall-fraction", type=float, default=0.0,
+                        help="fraction of request bodies that stop being read halfway")
+    parser.add_argument("--stall-time", type=float, default=20.0,
+                        help="seconds a stalled body goes unread")
+    parser.add_argument("--recv-buffer", type=int, default=0,
+                        help="receiver socket buffer in bytes (0: system default)")
+    parser.add_argument("--payload-size", type=int, default=200, help="message text length")
+    parser.add_argument("--retry-delay", type=int, default=1, help="webhook retry_delay (s)")
+    parser.add_argument("--drain", type=float, default=30, help="max seconds to wait for delivery")
+    parser.add_argument("--tracemalloc", action="store_true", help="also trace Python allocations")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--min-throughput", type=float, help="fail below this many deliveries/s")
+    parser.add_argument("--max-p99", type=float, help="fail above this p99 latency (ms)")
+    parser.add_argument("--verbose", action="store_true", help="show service logs")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    result = asyncio.run(run(args))
+    report(result)
+
+    failed = []
+    if args.min_throughput is not None and result["throughput"] < args.min_throughput:
+        failed.append(f"throughput {result['throughput']:.1f}/s < {args.min_throughput}/s")
+    if args.max_p99 is not None and not result["p99"] <= args.max_p99:
+        failed.append(f"p99 {result['p99']:.1f} ms > {args.max_p99} ms")
+    if failed:
+        print("FAILED: " + "; ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
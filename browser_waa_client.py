@@ -14,6 +14,8 @@ from playwright.async_api import async_playwright
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 
+from app.core.sapisid import sapisid_hash
+
 # Constants
 USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36"
 ORIGIN = "https://voice.google.com"
@@ -438,12 +440,7 @@ class BrowserWAAClient:
     
     def _generate_sapisid_hash(self) -> str:
         """Generate SAPISID hash for Google authentication"""
-        timestamp = int(time.time())
-        origin = "https://voice.google.com"
-        sapisid = self.cookies.get("SAPISID", "")
-        hash_input = f"{timestamp} {sapisid} {origin}"
-        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
-        return f"SAPISIDHASH {timestamp}_{hash_value}"
+        return sapisid_hash(self.cookies.get("SAPISID", ""))
     
     async def close(self):
         """Clean up all resources"""
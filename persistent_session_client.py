@@ -17,6 +17,8 @@ import threading
 import pickle
 from pathlib import Path
 
+from app.core.sapisid import sapisid_hash
+
 class PersistentGoogleVoiceSession:
     """Maintains long-lived Google Voice sessions with automatic cookie management"""
     
@@ -454,12 +456,7 @@ class PersistentGoogleVoiceSession:
         
     def _generate_sapisid_hash(self) -> str:
         """Generate SAPISID hash"""
-        timestamp = int(time.time())
-        origin = "https://voice.google.com"
-        sapisid = self.cookies.get("SAPISID", "")
-        hash_input = f"{timestamp} {sapisid} {origin}"
-        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
-        return f"SAPISIDHASH {timestamp}_{hash_value}"
+        return sapisid_hash(self.cookies.get("SAPISID", ""))
         
     async def start_background_maintenance(self):
         """Start background session maintenance like mautrix-gvoice"""
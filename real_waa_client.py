@@ -14,6 +14,8 @@ from playwright.async_api import async_playwright
 from typing import Optional, Dict, Any
 from datetime import datetime
 
+from app.core.sapisid import sapisid_hash
+
 class RealWAASignatureGenerator:
     """Generates authentic WAA signatures using Google's actual JavaScript"""
     
@@ -299,12 +301,7 @@ class RealWAASignatureGenerator:
             
     def _generate_sapisid_hash(self) -> str:
         """Generate SAPISID hash for authorization"""
-        timestamp = int(time.time())
-        origin = "https://voice.google.com"
-        sapisid = self.cookies.get("SAPISID", "")
-        hash_input = f"{timestamp} {sapisid} {origin}"
-        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
-        return f"SAPISIDHASH {timestamp}_{hash_value}"
+        return sapisid_hash(self.cookies.get("SAPISID", ""))
         
     async def close(self):
         """Clean up resources"""
@@ -466,12 +463,7 @@ class GoogleVoiceRealSMS:
             
     def _generate_sapisid_hash(self) -> str:
         """Generate SAPISID hash for authorization"""
-        timestamp = int(time.time())
-        origin = "https://voice.google.com"
-        sapisid = self.cookies.get("SAPISID", "")
-        hash_input = f"{timestamp} {sapisid} {origin}"
-        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
-        return f"SAPISIDHASH {timestamp}_{hash_value}"
+        return sapisid_hash(self.cookies.get("SAPISID", ""))
         
     async def close(self):
         """Clean up resources"""
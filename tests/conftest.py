@@ -0,0 +1,20 @@
+"""Shared test setup: an in-memory state store and a throwaway home directory"""
+
+import asyncio
+import os
+import tempfile
+
+# Set before any app module is imported, since storage is created on import
+os.environ["HOME"] = tempfile.mkdtemp(prefix="gvoice-tests-")
+os.environ["GVOICE_STATE_URL"] = "memory://"
+os.environ.pop("GVOICE_EVENT_BUS_URL", None)
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """One loop for the session, as the app's global singletons hold asyncio primitives"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
@@ -0,0 +1,33 @@
+"""AccountCache refresh and invalidation"""
+
+import asyncio
+
+import app.services.account_cache as account_cache_module
+from app.services.account_cache import AccountCache
+
+
+async def test_refresh_in_flight_during_invalidate_is_not_stored(monkeypatch):
+    gate = asyncio.Event()
+
+    async def read(user_id, endpoint, cache_ttl=None):
+        await gate.wait()
+        return {"primaryDid": "+15550100"}
+
+    monkeypatch.setattr(account_cache_module.client_registry, "read", read)
+    cache = AccountCache()
+    refresh = asyncio.create_task(cache.refresh("u1"))
+    await asyncio.sleep(0)
+
+    cache.invalidate("u1")
+    gate.set()
+    assert await refresh == {"primaryDid": "+15550100"}
+    assert cache.peek("u1") is None
+
+    await cache.refresh("u1")
+    assert cache.peek("u1") == {"primaryDid": "+15550100"}
+
+
+async def test_phone_number_from_json_and_pblite():
+    assert AccountCache._extract_phone_number({"primaryDid": "+15550100"}) == "+15550100"
+    assert AccountCache._extract_phone_number([["+15550101", None]]) == "+15550101"
+    assert AccountCache._extract_phone_number([]) is None
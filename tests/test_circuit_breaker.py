@@ -0,0 +1,106 @@
+"""CircuitBreaker state transitions"""
+
+from app.services.circuit_breaker import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_MAX_PARKED,
+    CircuitBreakers,
+    CircuitState,
+)
+
+
+def open_breaker(breakers=None):
+    """A breaker tripped by consecutive failures"""
+    breaker = (breakers or CircuitBreakers()).get("https://hooks.example.com/a")
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        breaker.record_failure()
+    return breaker
+
+
+def test_destination_is_scheme_host_and_port():
+    assert CircuitBreakers.destination("https://h.example:8443/x/y?z") == "https://h.example:8443"
+    assert CircuitBreakers.destination("http://h.example") == "http://h.example"
+
+
+def test_failures_below_threshold_keep_circuit_closed():
+    breaker = CircuitBreakers().get("https://hooks.example.com/a")
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD - 1):
+        assert not breaker.record_failure()
+    breaker.record_reachable()
+    assert not breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_threshold_opens_circuit():
+    breaker = open_breaker()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow()
+
+
+def test_one_probe_allowed_after_open_period():
+    breaker = open_breaker()
+    breaker.open_until = 0
+    assert breaker.allow()
+    assert breaker.state == CircuitState.HALF_OPEN
+    # The probe is in flight; nothing else goes through
+    assert not breaker.allow()
+
+
+def test_probe_success_closes_and_releases_parked():
+    breaker = open_breaker()
+    breaker.park("d1")
+    breaker.park("d2")
+    breaker.open_until = 0
+    breaker.allow()
+
+    assert breaker.record_success() == ["d1", "d2"]
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.failures == 0
+    assert not breaker.parked
+
+
+def test_probe_failure_reopens_for_longer():
+    breaker = open_breaker()
+    breaker.open_until = 0
+    breaker.allow()
+
+    assert breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.trips == 1
+    assert not breaker.allow()
+
+
+def test_reachable_never_closes_an_open_circuit():
+    breaker = open_breaker()
+    breaker.record_reachable()
+    assert breaker.state == CircuitState.OPEN
+
+
+def test_released_probe_lets_the_next_delivery_probe():
+    breaker = open_breaker()
+    breaker.open_until = 0
+    breaker.allow()
+
+    breaker.release_probe()
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.allow()
+    assert breaker.state == CircuitState.HALF_OPEN
+
+
+def test_parking_drops_the_oldest_beyond_the_limit():
+    breaker = open_breaker()
+    for i in range(CIRCUIT_MAX_PARKED):
+        assert breaker.park(i) is None
+    assert breaker.park("newest") == 0
+    assert breaker.dropped == 1
+    assert breaker.take_probe() == 1
+
+
+def test_transitions_are_counted():
+    breakers = CircuitBreakers()
+    breaker = open_breaker(breakers)
+    breaker.open_until = 0
+    breaker.allow()
+    breaker.record_success()
+    assert breakers.transitions == {
+        "closed->open": 1, "open->half_open": 1, "half_open->closed": 1
+    }
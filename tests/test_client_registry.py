@@ -0,0 +1,70 @@
+"""ClientRegistry: single-flight reads and invalidation"""
+
+import asyncio
+
+from app.services.client_registry import ClientRegistry
+
+
+def make_registry(results):
+    """Registry whose upstream reads take the next result and wait for a gate"""
+    registry = ClientRegistry()
+    registry.gate = asyncio.Event()
+    registry.calls = 0
+
+    async def fetch(user_id, endpoint, params):
+        registry.calls += 1
+        result = results.pop(0)
+        await registry.gate.wait()
+        return result
+
+    registry._fetch = fetch
+    return registry
+
+
+async def test_identical_reads_share_one_upstream_call():
+    registry = make_registry([{"threads": [1]}])
+    reads = [asyncio.create_task(registry.read("u1", "list_threads")) for _ in range(5)]
+    await asyncio.sleep(0)
+    registry.gate.set()
+
+    results = await asyncio.gather(*reads)
+    assert registry.calls == 1
+    assert all(r == {"threads": [1]} for r in results)
+    assert registry.stats["upstream"] == 1
+    assert registry.stats["coalesced"] == 4
+
+
+async def test_successful_read_is_cached():
+    registry = make_registry([{"threads": [1]}])
+    registry.gate.set()
+    await registry.read("u1", "list_threads")
+    assert await registry.read("u1", "list_threads") == {"threads": [1]}
+    assert registry.calls == 1
+    assert registry.stats["cache_hits"] == 1
+
+
+async def test_read_in_flight_during_invalidate_is_not_cached():
+    registry = make_registry([{"threads": ["stale"]}, {"threads": ["fresh"]}])
+    stale = asyncio.create_task(registry.read("u1", "list_threads"))
+    await asyncio.sleep(0)
+
+    registry.invalidate("u1")
+    registry.gate.set()
+    # The caller that started before invalidate still gets its result
+    assert await stale == {"threads": ["stale"]}
+    assert await registry.read("u1", "list_threads") == {"threads": ["fresh"]}
+    assert registry.calls == 2
+
+
+async def test_invalidate_detaches_reads_in_flight():
+    registry = make_registry([{"a": 1}, {"a": 2}])
+    first = asyncio.create_task(registry.read("u1", "get_account"))
+    await asyncio.sleep(0)
+    registry.invalidate("u1")
+    second = asyncio.create_task(registry.read("u1", "get_account"))
+    await asyncio.sleep(0)
+    registry.gate.set()
+
+    assert await first == {"a": 1}
+    assert await second == {"a": 2}
+    assert registry.calls == 2
@@ -0,0 +1,86 @@
+"""CookieJar change tracking and compare-and-set write-back between replicas"""
+
+import uuid
+
+from app.core.storage import storage
+from app.services.cookie_jar import CookieJar, CookieJarStore
+
+
+async def stored_session(cookies):
+    """A user with cookies in the shared store"""
+    user_id = f"user-{uuid.uuid4().hex[:8]}"
+    version = await storage.save_gv_session(user_id, cookies)
+    return user_id, version
+
+
+def test_merge_bumps_version_only_on_change():
+    jar = CookieJar("u", {"SID": "a"})
+    assert not jar.merge([("SID", "a")])
+    assert jar.version == 0
+    assert jar.merge([("SID", "b"), ("HSID", "c")])
+    assert jar.version == 1
+    assert jar.changed_names == {"SID", "HSID"}
+    assert jar.dirty
+
+
+def test_adopt_keeps_own_unsaved_changes():
+    jar = CookieJar("u", {"SID": "a", "SIDTS": "old"})
+    jar.merge([("SIDTS", "mine")])
+    version = jar.version
+
+    jar.adopt({"SID": "theirs", "SIDTS": "theirs"})
+    assert jar.cookies == {"SID": "theirs", "SIDTS": "mine"}
+    assert jar.version == version + 1
+
+
+async def test_flush_writes_back_with_compare_and_set():
+    user_id, _ = await stored_session({"SID": "a"})
+    jars = CookieJarStore(debounce=60)
+    jar = await jars.get_jar(user_id)
+
+    jar.merge([("SIDTS", "rotated")])
+    await jars.flush(user_id)
+    assert not jar.dirty
+    assert await storage.get_gv_session(user_id) == {"SID": "a", "SIDTS": "rotated"}
+
+
+async def test_replicas_merge_each_others_rotations():
+    user_id, _ = await stored_session({"SID": "a", "SIDTS": "0", "PSIDCC": "0"})
+    replica_a, replica_b = CookieJarStore(debounce=60), CookieJarStore(debounce=60)
+    jar_a = await replica_a.get_jar(user_id)
+    jar_b = await replica_b.get_jar(user_id)
+
+    jar_a.merge([("SIDTS", "from-a")])
+    jar_b.merge([("PSIDCC", "from-b")])
+    await replica_a.flush(user_id)
+    # B's write conflicts, adopts A's cookie and keeps its own
+    await replica_b.flush(user_id)
+
+    expected = {"SID": "a", "SIDTS": "from-a", "PSIDCC": "from-b"}
+    assert await storage.get_gv_session(user_id) == expected
+    assert jar_b.cookies == expected
+    assert not jar_b.changed_names
+
+
+async def test_write_back_does_not_restore_a_deleted_session():
+    user_id, _ = await stored_session({"SID": "a"})
+    jars = CookieJarStore(debounce=60)
+    jar = await jars.get_jar(user_id)
+
+    await storage.delete_gv_session(user_id)
+    jar.merge([("SIDTS", "rotated")])
+    await jars.flush(user_id)
+    assert await storage.get_gv_session(user_id) is None
+
+
+async def test_replace_detaches_the_old_jar():
+    user_id, version = await stored_session({"SID": "a"})
+    jars = CookieJarStore(debounce=60)
+    old = await jars.get_jar(user_id)
+
+    new = jars.replace(user_id, {"SID": "b"}, version)
+    assert new is not old
+    assert await jars.get_jar(user_id) is new
+    old.merge([("SID", "late")])
+    await jars.flush(user_id)
+    assert await storage.get_gv_session(user_id) == {"SID": "a"}
@@ -0,0 +1,69 @@
+"""EventDeduplicator window, size limit and forget"""
+
+import app.services.event_dedup as event_dedup_module
+from app.models.realtime import RealtimeEventType
+from app.services.event_dedup import EventDeduplicator, event_key, idempotency_key
+from app.services.realtime_events import RealtimeEvent
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_repeated_key_is_a_duplicate():
+    dedup = EventDeduplicator()
+    assert dedup.check("u1", "sms:m1")
+    assert not dedup.check("u1", "sms:m1")
+    assert dedup.check("u2", "sms:m1")
+    assert dedup.duplicates == 1
+
+
+def test_keys_expire_after_the_window(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(event_dedup_module.time, "monotonic", clock)
+    dedup = EventDeduplicator(window=60)
+    dedup.check("u1", "sms:m1")
+
+    clock.now += 59
+    assert not dedup.check("u1", "sms:m1")
+    clock.now += 2
+    assert dedup.check("u1", "sms:m1")
+
+
+def test_expired_keys_are_swept(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(event_dedup_module.time, "monotonic", clock)
+    dedup = EventDeduplicator(window=60)
+    for i in range(10):
+        dedup.check("u1", f"sms:m{i}")
+
+    clock.now += 61
+    dedup.check("u1", "sms:new")
+    assert list(dedup._seen["u1"]) == ["sms:new"]
+
+
+def test_oldest_keys_are_forgotten_beyond_the_limit():
+    dedup = EventDeduplicator(max_keys=3)
+    for i in range(4):
+        dedup.check("u1", f"sms:m{i}")
+    assert dedup.check("u1", "sms:m0")
+    assert not dedup.check("u1", "sms:m3")
+
+
+def test_forget_drops_a_users_keys():
+    dedup = EventDeduplicator()
+    dedup.check("u1", "sms:m1")
+    dedup.forget("u1")
+    assert dedup.check("u1", "sms:m1")
+
+
+def test_event_key_identifies_messages_and_status_changes():
+    message = RealtimeEvent(RealtimeEventType.MESSAGE, "t.1", {"message_id": "m1"})
+    status = RealtimeEvent(RealtimeEventType.STATUS, "t.1", {"message_id": "m1", "status": "read"})
+    assert event_key(message) != event_key(status)
+    assert event_key(RealtimeEvent(RealtimeEventType.MESSAGE, "t.1", {})) is None
+    assert idempotency_key("u1", "k") == idempotency_key("u1", "k") != idempotency_key("u2", "k")
@@ -0,0 +1,52 @@
+"""Event logs: sequence numbers and replay"""
+
+import asyncio
+
+from app.core.state_store import MemoryStateStore
+from app.services.event_log import EventLog, SharedEventLog
+
+
+async def test_shared_log_hands_out_one_sequence_across_replicas():
+    store = MemoryStateStore()
+    replicas = [SharedEventLog(store), SharedEventLog(store)]
+    records = await asyncio.gather(*(
+        replicas[i % 2].append("u1", "message", {"i": i}) for i in range(20)
+    ))
+
+    assert sorted(r["seq"] for r in records) == list(range(1, 21))
+    events, gap = await replicas[1].since("u1", 10)
+    assert [e["seq"] for e in events] == list(range(11, 21))
+    assert not gap
+    assert await replicas[0].last_seq("u1") == 20
+
+
+async def test_shared_log_reports_a_gap_for_trimmed_events():
+    store = MemoryStateStore()
+    log = SharedEventLog(store, max_events=8, block_size=4)
+    for i in range(20):
+        await log.append("u1", "message", {"i": i})
+
+    events, gap = await log.since("u1", 0)
+    assert gap
+    assert [e["seq"] for e in events] == list(range(13, 21))
+    assert len(await store.keys("events/u1/")) == 3  # head and two blocks
+
+
+async def test_unknown_or_future_seq():
+    for log in (SharedEventLog(MemoryStateStore()), EventLog()):
+        user_id = f"user-{id(log)}"
+        assert await log.since(user_id, 0) == ([], False)
+        assert await log.since(user_id, 5) == ([], True)
+        await log.append(user_id, "message", {})
+        assert await log.since(user_id, 1) == ([], False)
+
+
+async def test_file_log_replays_spilled_events(tmp_path):
+    log = EventLog(memory_size=4, max_events=100)
+    log.events_dir = tmp_path
+    for i in range(10):
+        await log.append("u1", "message", {"i": i})
+
+    events, gap = await log.since("u1", 2)
+    assert [e["seq"] for e in events] == list(range(3, 11))
+    assert not gap
@@ -0,0 +1,91 @@
+"""Retry delays and the DelayScheduler"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from app.models.webhook import Webhook, WebhookDelivery, WebhookEvent
+from app.services.retry_scheduler import MAX_RETRY_JITTER, DelayScheduler, next_retry_delay
+
+
+def webhook(**policy):
+    return Webhook(user_id="u", url="https://hooks.example.com/a", **policy)
+
+
+def delivery(attempt=1, age=0.0):
+    return WebhookDelivery(
+        webhook_id="w",
+        event_type=WebhookEvent.MESSAGE_RECEIVED,
+        payload={},
+        attempt=attempt,
+        created_at=datetime.utcnow() - timedelta(seconds=age),
+    )
+
+
+def test_delay_backs_off_within_jitter_bounds():
+    hook = webhook(retry_delay=10, retry_backoff=2.0, retry_jitter=0.5, max_retries=10)
+    for attempt in range(1, 5):
+        base = 10 * 2.0 ** (attempt - 1)
+        for _ in range(200):
+            delay = next_retry_delay(hook, delivery(attempt))
+            assert base * 0.5 <= delay <= base
+
+
+def test_delay_is_capped_at_max_delay():
+    hook = webhook(retry_delay=10, retry_backoff=10.0, retry_max_delay=60, retry_jitter=0, max_retries=10)
+    assert next_retry_delay(hook, delivery(attempt=5)) == 60
+
+
+def test_jitter_never_removes_the_whole_delay():
+    hook = webhook(retry_delay=10, retry_jitter=0.5, max_retries=10)
+    hook.retry_jitter = 1.0  # as stored before the limit was enforced
+    for _ in range(200):
+        assert next_retry_delay(hook, delivery()) >= 10 * (1 - MAX_RETRY_JITTER)
+
+
+def test_no_retry_after_max_retries():
+    hook = webhook(max_retries=3)
+    assert next_retry_delay(hook, delivery(attempt=2)) is not None
+    assert next_retry_delay(hook, delivery(attempt=3)) is None
+
+
+def test_no_retry_past_deadline():
+    hook = webhook(retry_delay=60, retry_jitter=0, retry_deadline=3600, max_retries=10)
+    assert next_retry_delay(hook, delivery(age=3000)) == 60
+    assert next_retry_delay(hook, delivery(age=3590)) is None
+
+    hook.retry_deadline = 0
+    assert next_retry_delay(hook, delivery(age=10 ** 6)) == 60
+
+
+async def test_scheduler_runs_callbacks_in_due_order():
+    scheduler = DelayScheduler()
+    ran = []
+
+    async def record(item):
+        ran.append(item)
+
+    scheduler.start()
+    try:
+        scheduler.schedule(0.06, record, "late")
+        scheduler.schedule(0.02, record, "early")
+        scheduler.schedule(0.02, record, "early-second")
+        await asyncio.sleep(0.01)
+        assert ran == []
+        await asyncio.sleep(0.1)
+        assert ran == ["early", "early-second", "late"]
+    finally:
+        await scheduler.stop()
+
+
+async def test_scheduler_refuses_when_full():
+    scheduler = DelayScheduler(max_pending=2)
+
+    async def noop(item):
+        pass
+
+    assert scheduler.schedule(10, noop, 1)
+    assert scheduler.schedule(10, noop, 2)
+    assert not scheduler.schedule(10, noop, 3)
+    assert scheduler.get_status()["refused"] == 1
+    await scheduler.stop()
+    assert len(scheduler) == 0
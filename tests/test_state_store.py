@@ -0,0 +1,56 @@
+"""MemoryStateStore documents, compare-and-set, leases and queues"""
+
+import app.core.state_store as state_store
+from app.core.state_store import MemoryStateStore
+
+
+async def test_compare_and_set_needs_the_current_version():
+    store = MemoryStateStore()
+    assert await store.compare_and_set("doc", {"n": 1}, 0) == 1
+    assert await store.compare_and_set("doc", {"n": 2}, 0) is None
+    assert await store.compare_and_set("doc", {"n": 2}, 1) == 2
+    assert await store.get_versioned("doc") == ({"n": 2}, 2)
+
+
+async def test_stale_compare_and_set_fails_on_a_recreated_document():
+    store = MemoryStateStore()
+    version = await store.set("doc", {"n": 1})
+    assert await store.delete("doc")
+    assert not await store.delete("doc")
+
+    assert await store.get_versioned("doc") == (None, 0)
+    assert await store.compare_and_set("doc", {"n": 2}, version) is None
+    assert await store.compare_and_set("doc", {"n": 2}, 0) == version + 1
+
+
+async def test_deleted_versions_are_forgotten_after_a_while(monkeypatch):
+    monkeypatch.setattr(state_store, "DELETED_VERSION_TTL", 0.0)
+    store = MemoryStateStore()
+    for key in ("a", "b"):
+        await store.set(key, {})
+        await store.delete(key)
+
+    assert await store.set("c", {}) == 1
+    assert not store._deleted
+
+
+async def test_leases_have_one_owner():
+    store = MemoryStateStore()
+    assert await store.acquire_lease("lease", "w1", 10)
+    assert await store.acquire_lease("lease", "w1", 10)
+    assert not await store.acquire_lease("lease", "w2", 10)
+    assert not await store.renew_lease("lease", "w2", 10)
+
+    await store.release_lease("lease", "w2")
+    assert not await store.acquire_lease("lease", "w2", 10)
+    await store.release_lease("lease", "w1")
+    assert await store.acquire_lease("lease", "w2", 10)
+
+
+async def test_queue_is_fifo():
+    store = MemoryStateStore()
+    await store.push("q", {"n": 1})
+    await store.push("q", {"n": 2})
+    assert await store.pop("q") == {"n": 1}
+    assert await store.pop("q") == {"n": 2}
+    assert await store.pop("q", timeout=0.01) is None
@@ -0,0 +1,113 @@
+"""WebhookService delivery through circuit breakers and probe re-arming"""
+
+import asyncio
+import time
+import uuid
+
+import pytest
+
+from app.models.webhook import Webhook, WebhookDelivery, WebhookEvent, WebhookStatus
+from app.services.circuit_breaker import CIRCUIT_FAILURE_THRESHOLD, CircuitState
+from app.services.webhook_service import WebhookService
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = ""
+
+
+@pytest.fixture
+def service(event_loop):
+    service = WebhookService(workers=1)
+    service.sent = []
+    service.status_code = 200
+
+    async def post(url, content, headers):
+        service.sent.append(headers["X-Webhook-Delivery"])
+        return Response(service.status_code)
+
+    service.http.post = post
+    yield service
+    event_loop.run_until_complete(service.scheduler.stop())
+
+
+async def add_webhook(service, host):
+    webhook = Webhook(user_id=f"user-{uuid.uuid4().hex[:8]}", url=f"https://{host}/hook")
+    await service.save_webhook(webhook)
+    return webhook
+
+
+def delivery_for(webhook):
+    return WebhookDelivery(webhook_id=webhook.id, event_type=WebhookEvent.MESSAGE_RECEIVED, payload={})
+
+
+async def trip(service, webhook):
+    """Open the webhook's circuit and make its open period end shortly"""
+    service.scheduler.start()
+    breaker = service.breakers.get(str(webhook.url))
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        breaker.record_failure()
+    breaker.open_until = time.monotonic() + 0.05
+    return breaker
+
+
+async def test_failures_open_the_circuit_and_park_deliveries(service):
+    webhook = await add_webhook(service, "down.example.com")
+    service.status_code = 503
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        await service._deliver_webhook(delivery_for(webhook))
+
+    breaker = service.breakers.get(str(webhook.url))
+    assert breaker.state == CircuitState.OPEN
+    assert len(breaker.parked) == 1
+    sent = len(service.sent)
+    await service._deliver_webhook(delivery_for(webhook))
+    assert len(service.sent) == sent
+    assert len(breaker.parked) == 2
+
+
+async def test_probe_success_closes_the_circuit(service):
+    webhook = await add_webhook(service, "recovering.example.com")
+    breaker = await trip(service, webhook)
+    probe = delivery_for(webhook)
+    await service._park(breaker, probe)
+    service._arm_probe(breaker)
+
+    await asyncio.sleep(0.2)
+    assert service.sent == [probe.id]
+    assert breaker.state == CircuitState.CLOSED
+
+
+async def test_probe_of_deleted_webhook_is_replaced(service):
+    gone = await add_webhook(service, "shared.example.com")
+    kept = await add_webhook(service, "shared.example.com")
+    breaker = await trip(service, gone)
+    first, second = delivery_for(gone), delivery_for(kept)
+    await service._park(breaker, first)
+    await service._park(breaker, second)
+    await service.delete_webhook(gone.id)
+    service._arm_probe(breaker)
+
+    await asyncio.sleep(0.2)
+    assert service.sent == [second.id]
+    assert breaker.state == CircuitState.CLOSED
+
+
+async def test_probe_of_inactive_webhook_frees_the_slot(service):
+    webhook = await add_webhook(service, "paused.example.com")
+    breaker = await trip(service, webhook)
+    await service._park(breaker, delivery_for(webhook))
+    webhook.status = WebhookStatus.INACTIVE
+    await service.save_webhook(webhook)
+    service._arm_probe(breaker)
+
+    await asyncio.sleep(0.2)
+    assert service.sent == []
+    assert breaker.state == CircuitState.OPEN
+    # The next delivery becomes the probe
+    webhook.status = WebhookStatus.ACTIVE
+    await service.save_webhook(webhook)
+    await service._deliver_webhook(delivery_for(webhook))
+    assert len(service.sent) == 1
+    assert breaker.state == CircuitState.CLOSED
@@ -0,0 +1,80 @@
+"""WebhookStats delta merging across replicas sharing a store"""
+
+import uuid
+
+from app.core.storage import storage
+from app.models.webhook import Webhook
+from app.services.webhook_stats import WebhookStats
+
+
+def new_webhook():
+    return Webhook(user_id=f"user-{uuid.uuid4().hex[:8]}", url="https://hooks.example.com/a")
+
+
+async def stored_counters(webhook):
+    data = await storage.load_json_file(storage.base_dir / "webhook_stats" / f"{webhook.user_id}.json")
+    return data["webhooks"][webhook.id]
+
+
+async def test_replicas_add_to_each_others_counts():
+    webhook = new_webhook()
+    replica_a, replica_b = WebhookStats(), WebhookStats()
+    for _ in range(3):
+        await replica_a.record(webhook, True)
+    await replica_b.record(webhook, True)
+    await replica_b.record(webhook, False)
+
+    await replica_a.flush()
+    await replica_b.flush()
+    counters = await stored_counters(webhook)
+    assert counters["delivered"] == 4
+    assert counters["failed"] == 1
+    # B flushed last, so it sees A's counts too
+    assert (await replica_b._user_stats(webhook.user_id))[webhook.id]["delivered"] == 4
+
+
+async def test_failure_streak_resets_on_success():
+    webhook = new_webhook()
+    replica_a, replica_b = WebhookStats(), WebhookStats()
+    await replica_a.record(webhook, False)
+    await replica_a.record(webhook, False)
+    await replica_a.flush()
+
+    await replica_b.record(webhook, True)
+    await replica_b.record(webhook, False)
+    await replica_b.flush()
+    counters = await stored_counters(webhook)
+    assert counters["failure_count"] == 1
+    assert counters["failed"] == 3
+
+
+async def test_failures_add_up_without_a_reset():
+    webhook = new_webhook()
+    replica_a, replica_b = WebhookStats(), WebhookStats()
+    await replica_a.record(webhook, False)
+    await replica_b.record(webhook, False)
+    await replica_a.flush()
+    await replica_b.flush()
+    assert (await stored_counters(webhook))["failure_count"] == 2
+
+
+async def test_apply_fills_statistics_fields():
+    webhook = new_webhook()
+    stats = WebhookStats()
+    await stats.record(webhook, False)
+
+    fresh = await stats.apply(Webhook(**webhook.dict(exclude={"failure_count", "last_triggered_at"})))
+    assert fresh.failure_count == 1
+    assert fresh.last_triggered_at is not None
+
+
+async def test_forget_removes_stored_counters():
+    webhook = new_webhook()
+    replica_a, replica_b = WebhookStats(), WebhookStats()
+    await replica_a.record(webhook, True)
+    await replica_a.flush()
+
+    await replica_b.forget(webhook)
+    await replica_b.flush()
+    data = await storage.load_json_file(storage.base_dir / "webhook_stats" / f"{webhook.user_id}.json")
+    assert webhook.id not in data["webhooks"]
@@ -13,6 +13,8 @@ import httpx
 from playwright.async_api import async_playwright
 from typing import Optional, Dict, Any
 
+from app.core.sapisid import sapisid_hash
+
 class WAAClient:
     """Creates WAA payloads via Google's WAA service"""
     
@@ -35,12 +37,7 @@ class WAAClient:
             
     def _generate_sapisid_hash(self) -> str:
         """Generate SAPISID hash for authorization"""
-        timestamp = int(time.time())
-        origin = "https://voice.google.com"
-        sapisid = self.cookies.get("SAPISID", "")
-        hash_input = f"{timestamp} {sapisid} {origin}"
-        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
-        return f"SAPISIDHASH {timestamp}_{hash_value}"
+        return sapisid_hash(self.cookies.get("SAPISID", ""))
         
     async def create_waa_payload(self) -> Dict[str, Any]:
         """Create WAA payload from Google's WAA service"""
@@ -419,12 +416,7 @@ class GoogleVoiceWAASMS:
             
     def _generate_sapisid_hash(self) -> str:
         """Generate SAPISID hash for authorization"""
-        timestamp = int(time.time())
-        origin = "https://voice.google.com"
-        sapisid = self.cookies.get("SAPISID", "")
-        hash_input = f"{timestamp} {sapisid} {origin}"
-        hash_value = hashlib.sha1(hash_input.encode()).hexdigest()
-        return f"SAPISIDHASH {timestamp}_{hash_value}"
+        return sapisid_hash(self.cookies.get("SAPISID", ""))
         
     async def close(self):
         """Clean up resources"""